@@ -1,49 +1,70 @@
 from pathlib import Path
 import pandas as pd
-from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, Alignment
 from openpyxl import load_workbook
 
+from chunked import run_chunked, sum_rows
+from csv_source import load_csv, read_csv_header
+from excel_output import EXCEL_MAX_ROWS, apply_column_alignment, apply_column_widths, write_sheets_streaming
+from incremental import SUM_COL, refresh_cells
+from parallel_pivot import parallel_subtotal_pivot
+from stage_log import StageLog, stage
+from xlsx_parts import add_pivot_tables, replace_sheets
+
 # ---------------- CONFIG ----------------
 CSV_PATH = r"C:\path\to\your\source.csv"          # <-- change
 OUTPUT_XLSX = r"C:\path\to\your\output.xlsx"      # <-- change (can be same file daily if you want)
 SOURCE_SHEET = "Source"
 PIVOT_SHEET = "Pivot_Summary"
+STREAMING_WRITE = True                            # new file -> write-only, one pass (no reload)
+INPLACE_UPDATE = True                             # existing file -> only our sheets swapped inside the xlsx
+                                                  # (other sheets copied as they are, never loaded)
 
 # Column names in CSV (change only if your csv uses different names)
 COL_DRUG = "drug"
 COL_REASON = "case_sub_status_reason_code"
 COL_COUNT = "case_count"
+
+# CSV read: typed columns; passthrough keeps every column for the Source sheet (False -> only these)
+CSV_ENGINE = "auto"                               # "auto" (pyarrow if installed) | "pyarrow" | "c"
+CSV_CACHE_DIR = None                              # e.g. r"C:\path\to\csv_cache" -> reuse parsed extracts (needs pyarrow)
+CSV_CACHE_BYPASS = False                          # True -> parse the CSV again and refresh its cache entry
+RUN_LOG = True                                    # per-stage timings appended to <output>.runlog.jsonl
+PIVOT_WORKERS = 1                                 # >1 -> pivot split by drug over this many processes
+PIVOT_OUTPUT = "rows"                             # "rows" -> pivot computed and written here | "excel" -> native
+                                                  # PivotTable over Source, computed by Excel when the file opens
+                                                  # (labels sorted A-Z there, not by count; see bench_native_pivot.py)
+CSV_SCHEMA = dict(
+    required=[COL_DRUG, COL_REASON, COL_COUNT],
+    categories=[COL_DRUG, COL_REASON],
+    passthrough=True,
+)
+
+# Incremental refresh: drug x reason sums kept from the last run (None -> full rebuild)
+INCREMENTAL_STATE = None                          # e.g. r"C:\path\to\output.summary_state.pkl"
+
+# Chunked mode for extracts bigger than RAM: read in blocks, Source streamed to a new workbook
+# (memory follows the block size; no cache / incremental state in this mode)
+CHUNK_ROWS = None                                 # e.g. 250_000
 # ----------------------------------------
 
 
-def autosize_columns(ws, max_col=3):
-    """Auto-fit column width based on cell content length."""
-    for col_idx in range(1, max_col + 1):
-        col_letter = get_column_letter(col_idx)
-        max_len = 0
-        for cell in ws[col_letter]:
-            if cell.value is not None:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = min(max_len + 3, 60)
+def autosize_columns(ws, df: pd.DataFrame, max_col=3):
+    """Auto-fit column width from the DataFrame (max str length per column)."""
+    apply_column_widths(ws, df, max_col=max_col)
 
 
-def format_sheet(ws):
+def format_sheet(ws, df: pd.DataFrame):
     """Apply basic formatting to make it look professional."""
     # Bold header row
     for cell in ws[1]:
         cell.font = Font(bold=True)
         cell.alignment = Alignment(horizontal="left")
 
-    # Align text columns left, numbers right
-    for row in ws.iter_rows(min_row=2):
-        for cell in row:
-            if cell.column in (1, 2):
-                cell.alignment = Alignment(horizontal="left")
-            else:
-                cell.alignment = Alignment(horizontal="right")
+    # Align text columns left, numbers right (one style per column)
+    apply_column_alignment(ws, df, vertical=None, left_cols=(1, 2))
 
-    autosize_columns(ws, max_col=3)
+    autosize_columns(ws, df, max_col=3)
 
 
 def build_excel_like_pivot(df: pd.DataFrame) -> pd.DataFrame:
@@ -53,44 +74,105 @@ def build_excel_like_pivot(df: pd.DataFrame) -> pd.DataFrame:
     - Then list each reason and its sum
     - Finally grand total row
     """
-    # Pivot detail rows
-    detail = (
-        df.groupby([COL_DRUG, COL_REASON], as_index=False)[COL_COUNT]
-        .sum()
-        .sort_values([COL_DRUG, COL_COUNT], ascending=[True, False])
-    )
+    return parallel_subtotal_pivot(df, [COL_DRUG, COL_REASON], COL_COUNT, PIVOT_WORKERS, order="value")
 
-    # Drug totals
-    totals = (
-        df.groupby(COL_DRUG, as_index=False)[COL_COUNT]
-        .sum()
-        .sort_values(COL_COUNT, ascending=False)
-    )
 
-    rows = []
-    grand_total = df[COL_COUNT].sum()
+def clean_source(df: pd.DataFrame) -> pd.DataFrame:
+    """Trim drug / reason text and make the count numeric (in place; the Source sheet shows this)."""
+    df[COL_DRUG] = df[COL_DRUG].astype(str).str.strip()
+    df[COL_REASON] = df[COL_REASON].astype(str).str.strip()
+    df[COL_COUNT] = pd.to_numeric(df[COL_COUNT], errors="coerce").fillna(0)
+    return df
+
+
+def write_output(out_path: Path, df: pd.DataFrame, pivot_out: pd.DataFrame):
+    """Write Source + Pivot sheets (streamed for a new file, swapped into an existing one, else replace and format)."""
+    streamed = dict(
+        total_sheets={PIVOT_SHEET: "Grand Total"},
+        freeze_cell=None,
+        vertical=None,
+        left_cols=(1, 2),
+        max_col=3,
+    )
+    if STREAMING_WRITE and not out_path.exists():
+        # New file: stream both sheets out already formatted (no load_workbook / second save)
+        with stage("excel_write", rows_in=len(df) + len(pivot_out)):
+            write_sheets_streaming(out_path, {SOURCE_SHEET: df, PIVOT_SHEET: pivot_out}, **streamed)
+    elif INPLACE_UPDATE and out_path.exists():
+        # Existing file: same streamed sheets, swapped in place of the old ones (other sheets not parsed)
+        with stage("excel_write", rows_in=len(df) + len(pivot_out)):
+            replace_sheets(out_path, {SOURCE_SHEET: df, PIVOT_SHEET: pivot_out}, **streamed)
+    else:
+        # Write to Excel (fix for if_sheet_exists)
+        mode = "a" if out_path.exists() else "w"
+        writer_kwargs = dict(engine="openpyxl", mode=mode)
+        if mode == "a":
+            writer_kwargs["if_sheet_exists"] = "replace"
+
+        with stage("excel_write", rows_in=len(df) + len(pivot_out)):
+            with pd.ExcelWriter(out_path, **writer_kwargs) as writer:
+                df.to_excel(writer, sheet_name=SOURCE_SHEET, index=False)
+                pivot_out.to_excel(writer, sheet_name=PIVOT_SHEET, index=False)
+
+        # Apply formatting via openpyxl
+        with stage("format", rows_in=len(df) + len(pivot_out)):
+            wb = load_workbook(out_path)
+            ws_pivot = wb[PIVOT_SHEET]
+            ws_source = wb[SOURCE_SHEET]
+
+            format_sheet(ws_source, df)
+            format_sheet(ws_pivot, pivot_out)
+
+            # Make "Grand Total" bold
+            for row in ws_pivot.iter_rows():
+                if row[0].value == "Grand Total":
+                    for c in row[:3]:
+                        c.font = Font(bold=True)
+
+            wb.save(out_path)
+
+
+def summary_cells(rows: pd.DataFrame) -> pd.DataFrame:
+    """Incremental groups for new/changed rows (already cleaned): drug, reason and the count to sum."""
+    return pd.DataFrame({
+        COL_DRUG: rows[COL_DRUG],
+        COL_REASON: rows[COL_REASON],
+        SUM_COL: rows[COL_COUNT],
+    })
+
+
+def build_pivot_incremental(df: pd.DataFrame):
+    """Pivot from the incremental state: only new/changed/removed rows update the drug x reason sums."""
+    cells, stats = refresh_cells(
+        INCREMENTAL_STATE, df, summary_cells,
+        cell_cols=[COL_DRUG, COL_REASON],
+        fingerprint_cols=[COL_DRUG, COL_REASON, COL_COUNT],
+        summed=True,
+    )
+    # sums only cover today's rows, so today's count dtype holds them (int stays int)
+    sums = pd.DataFrame({
+        COL_DRUG: cells[COL_DRUG],
+        COL_REASON: cells[COL_REASON],
+        COL_COUNT: cells[SUM_COL].astype(df[COL_COUNT].dtype),
+    })
+    return build_excel_like_pivot(sums), stats
 
-    # Build output rows
-    for _, t in totals.iterrows():
-        drug = t[COL_DRUG]
-        drug_total = int(t[COL_COUNT])
 
-        # Drug header/total row
-        rows.append([drug, "", drug_total])
+def source_chunk(block: pd.DataFrame):
+    """Chunked mode: cleaned Source rows of one block + its drug x reason sums."""
+    block = clean_source(block)
+    return {SOURCE_SHEET: block}, sum_rows(block, [COL_DRUG, COL_REASON], COL_COUNT)
 
-        # Reasons under drug
-        sub = detail[detail[COL_DRUG] == drug]
-        for _, r in sub.iterrows():
-            rows.append(["", "  " + str(r[COL_REASON]), int(r[COL_COUNT])])
 
-        # Blank spacer row
-        rows.append(["", "", ""])
+def pivot_from_sums(sums: pd.DataFrame):
+    """Chunked mode: the pivot from the merged drug x reason sums."""
+    return {PIVOT_SHEET: build_excel_like_pivot(sums)}
 
-    # Grand total row
-    rows.append(["Grand Total", "", int(grand_total)])
 
-    out = pd.DataFrame(rows, columns=[COL_DRUG, COL_REASON, COL_COUNT])
-    return out
+def excel_pivot(df: pd.DataFrame) -> dict:
+    """Native PivotTable (xlsx_parts.add_pivot_tables) on the pivot sheet: drug > reason, sum of the counts."""
+    return {PIVOT_SHEET: dict(source=SOURCE_SHEET, columns=list(df.columns), rows=len(df),
+                              row_fields=[COL_DRUG, COL_REASON], value_fields=[COL_COUNT], subtotals=True)}
 
 
 def main():
@@ -99,49 +181,62 @@ def main():
 
     if not csv_path.exists():
         raise FileNotFoundError(f"CSV not found: {csv_path}")
-
-    # Read CSV
-    df = pd.read_csv(csv_path)
-
-    # Validate required columns
-    required = {COL_DRUG, COL_REASON, COL_COUNT}
-    missing = required - set(df.columns)
+    if PIVOT_OUTPUT not in ("rows", "excel"):
+        raise ValueError(f"PIVOT_OUTPUT must be 'rows' or 'excel', not {PIVOT_OUTPUT!r}")
+    if PIVOT_OUTPUT == "excel" and CHUNK_ROWS:
+        raise ValueError("PIVOT_OUTPUT = 'excel' builds the PivotTable over the Source sheet (set CHUNK_ROWS to None)")
+
+    # Validate required columns (header line only, before reading the whole file)
+    header = read_csv_header(csv_path)
+    required = set(CSV_SCHEMA["required"])
+    missing = required - set(header)
     if missing:
-        raise ValueError(f"Missing columns in CSV: {missing}. Found: {list(df.columns)}")
-
-    # Cleanup
-    df[COL_DRUG] = df[COL_DRUG].astype(str).str.strip()
-    df[COL_REASON] = df[COL_REASON].astype(str).str.strip()
-    df[COL_COUNT] = pd.to_numeric(df[COL_COUNT], errors="coerce").fillna(0)
-
-    # Build pivot output (Excel-like)
-    pivot_out = build_excel_like_pivot(df)
-
-    # Write to Excel (fix for if_sheet_exists)
-    mode = "a" if out_path.exists() else "w"
-    writer_kwargs = dict(engine="openpyxl", mode=mode)
-    if mode == "a":
-        writer_kwargs["if_sheet_exists"] = "replace"
-
-    with pd.ExcelWriter(out_path, **writer_kwargs) as writer:
-        df.to_excel(writer, sheet_name=SOURCE_SHEET, index=False)
-        pivot_out.to_excel(writer, sheet_name=PIVOT_SHEET, index=False)
-
-    # Apply formatting via openpyxl
-    wb = load_workbook(out_path)
-    ws_pivot = wb[PIVOT_SHEET]
-    ws_source = wb[SOURCE_SHEET]
-
-    format_sheet(ws_source)
-    format_sheet(ws_pivot)
-
-    # Make "Grand Total" bold
-    for row in ws_pivot.iter_rows():
-        if row[0].value == "Grand Total":
-            for c in row[:3]:
-                c.font = Font(bold=True)
+        raise ValueError(f"Missing columns in CSV: {missing}. Found: {header}")
+
+    with StageLog(out_path, "1st_cumulative", enabled=RUN_LOG):
+        if CHUNK_ROWS:
+            plan = [dict(name="1st_cumulative", source=csv_path, schema=CSV_SCHEMA, chunk=source_chunk,
+                         keys=[COL_DRUG, COL_REASON], finish=pivot_from_sums,
+                         sheets=[SOURCE_SHEET, PIVOT_SHEET])]
+            run_chunked(out_path, plan, chunk_rows=CHUNK_ROWS, total_sheets={PIVOT_SHEET: "Grand Total"},
+                        freeze_cell=None, vertical=None, left_cols=(1, 2), max_col=3)
+            print(f"✅ Done. Pivot created in: {out_path} (Sheet: {PIVOT_SHEET}, chunked)")
+            return
+
+        # Read CSV (typed)
+        with stage("read") as st:
+            df = load_csv(csv_path, CSV_SCHEMA, engine=CSV_ENGINE, header=header,
+                          cache_dir=CSV_CACHE_DIR, cache_bypass=CSV_CACHE_BYPASS)
+            st["rows_out"] = len(df)
+
+        # Cleanup
+        with stage("clean", rows_in=len(df)) as st:
+            df = clean_source(df)
+            st["rows_out"] = len(df)
+
+        if PIVOT_OUTPUT == "excel":
+            if len(df) > EXCEL_MAX_ROWS - 1:
+                raise ValueError(f"PIVOT_OUTPUT = 'excel' needs Source on one sheet; it has {len(df):,} rows, "
+                                 f"more than {EXCEL_MAX_ROWS - 1:,} (set PIVOT_OUTPUT = 'rows')")
+            # Source + an empty pivot sheet, then the PivotTable over Source (Excel computes it on open)
+            write_output(out_path, df, pd.DataFrame())
+            with stage("excel_pivots", rows_in=len(df)):
+                add_pivot_tables(out_path, excel_pivot(df))
+            print(f"✅ Done. PivotTable created in: {out_path} (Sheet: {PIVOT_SHEET}, refreshed when opened)")
+            return
+
+        # Build pivot output (Excel-like)
+        with stage("pivot", rows_in=len(df)) as st:
+            if INCREMENTAL_STATE:
+                pivot_out, stats = build_pivot_incremental(df)
+                print(f"Incremental: {stats['added']:,} added, {stats['removed']:,} removed "
+                      f"of {stats['rows']:,} rows{' (full rebuild)' if stats['full'] else ''}")
+            else:
+                pivot_out = build_excel_like_pivot(df)
+            st["rows_out"] = len(pivot_out)
 
-    wb.save(out_path)
+        # Write Source + Pivot sheets
+        write_output(out_path, df, pivot_out)
     print(f"✅ Done. Pivot created in: {out_path} (Sheet: {PIVOT_SHEET})")
 
 
@@ -1,15 +1,32 @@
+from functools import partial
 from pathlib import Path
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+
+from aging import (BUCKET_INDEX_COL, as_of_counts, as_of_dates, as_of_pivot, as_of_trend, bucket_index, bucket_pivot,
+                   day_number, days_since, with_bucket_flags)
+from chunked import count_rows, run_chunked
+from csv_source import load_csv, read_csv_header
+from date_parse import parse_date_columns, parse_dates
+from excel_output import apply_column_alignment, apply_column_widths, shard_frames
+from incremental import ROWS_COL, refresh_cells
+from parallel_pivot import parallel_bucket_pivot
+from stage_log import StageLog, stage
+from text_cleanup import clean_series, clean_text
+from xlsx_parts import replace_sheets, write_sheets_parallel
 
 # ---------------- CONFIG ----------------
 CSV_PATH = r"C:\path\to\source.csv"              # <-- change
 OUTPUT_XLSX = r"C:\path\to\output.xlsx"          # <-- change
+STREAMING_WRITE = True                           # new file -> write-only, one pass (no reload)
+INPLACE_UPDATE = True                            # existing file -> only our sheets swapped inside the xlsx
+                                                 # (other sheets copied as they are, never loaded)
 
 SHEET1 = "All Pending Cases by Case ID"
 SHEET2 = "Aging by Status & Drug"
+TREND_SHEET = "Aging Trend"                      # backfill (AS_OF_DATES below)
+SNAPSHOT_SHEET = "Aging {:%Y-%m-%d}"             # backfill with AS_OF_SHEETS: one per date
 
 # CSV column names (change only if your csv uses different names)
 COL_DRUG = "drug"
@@ -18,6 +35,37 @@ COL_REASON = "case_sub_status_reason_code"
 COL_FILE_RCPT = "file_receipt_date_time"         # date
 COL_ELIG_START = "eligibility_start_date"        # date
 
+# CSV read: typed columns; passthrough keeps every column for Sheet1 (False -> only these)
+CSV_ENGINE = "auto"                              # "auto" (pyarrow if installed) | "pyarrow" | "c"
+CSV_CACHE_DIR = None                             # e.g. r"C:\path\to\csv_cache" -> reuse parsed extracts (needs pyarrow)
+CSV_CACHE_BYPASS = False                         # True -> parse the CSV again and refresh its cache entry
+RUN_LOG = True                                   # per-stage timings appended to <output>.runlog.jsonl
+PIVOT_WORKERS = 1                                # >1 -> Sheet2 pivot split by drug over this many processes
+WRITE_WORKERS = 1                                # >1 -> sheets written by this many processes at once (streamed
+                                                 # writes; sheets over 1,048,576 rows go on "name (2)", ...)
+DATE_FALLBACK = False                            # True -> dates in other formats than the file's first one are
+                                                 # aged too (default: blank, counted in the run log)
+CSV_SCHEMA = dict(
+    required=[COL_DRUG, COL_STATUS, COL_REASON, COL_FILE_RCPT, COL_ELIG_START],
+    dates=[COL_FILE_RCPT, COL_ELIG_START],                # date_fallback: DATE_FALLBACK, added by csv_schema()
+    categories=[COL_DRUG, COL_STATUS, COL_REASON],
+    passthrough=True,
+)
+
+# Incremental refresh: counts per drug/status/reason/day kept from the last run (None -> full rebuild)
+INCREMENTAL_STATE = None                         # e.g. r"C:\path\to\output.aging_state.pkl"
+
+# Chunked mode for extracts bigger than RAM: read in blocks, Sheet1 streamed to a new workbook
+# (memory follows the block size; no cache / incremental state in this mode)
+CHUNK_ROWS = None                                # e.g. 250_000
+
+# Backfill: Sheet2 counts on every date of a range, all from this one read (trend reporting);
+# writes TREND_SHEET (date / drug / status / reason / bucket / cases) instead of Sheet1 + Sheet2
+AS_OF_DATES = None                               # e.g. ("2025-01-01", "2025-12-31")
+AS_OF_FREQ = "D"                                 # every day; "W-FRI" / "ME" -> Fridays / month ends
+AS_OF_SHEETS = False                             # True -> also one SNAPSHOT_SHEET per date (Sheet2 layout)
+AS_OF_RECEIVED_ONLY = False                      # True -> a date only counts cases received by then
+                                                 # (default: as a run on that day would, later cases age 0)
 # ----------------------------------------
 
 
@@ -32,62 +80,43 @@ BUCKETS = [
 ]
 
 DAYS_COL = "File Receipt Date Until Today"
+DAY_NUMBER_COL = "_day"                          # incremental state only: chosen date as a day number
 
 
-def clean_text(x, unknown="Unknown"):
-    """Normalize text so Excel-like pivot grouping happens (case-insensitive + trims)."""
-    if pd.isna(x):
-        return unknown
-    s = str(x).strip()
-    if s == "" or s.lower() == "nan":
-        return unknown
-    s = " ".join(s.split())      # remove extra internal spaces
-    s = s.lower()
-    return s.title()             # nice report display
+def csv_schema() -> dict:
+    """CSV_SCHEMA with DATE_FALLBACK as set when the read starts (not when the module was imported)."""
+    return dict(CSV_SCHEMA, date_fallback=DATE_FALLBACK)
 
 
-def autosize_columns(ws, max_width=60):
-    for col_idx in range(1, ws.max_column + 1):
-        col_letter = get_column_letter(col_idx)
-        max_len = 0
-        for cell in ws[col_letter]:
-            if cell.value is not None:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = min(max_len + 3, max_width)
+def autosize_columns(ws, df: pd.DataFrame, max_width=60):
+    """Auto-fit widths from the DataFrame (max str length per column) instead of every cell."""
+    apply_column_widths(ws, df, max_width=max_width)
 
 
-def format_sheet_basic(ws, freeze_cell="A2"):
+def format_sheet_basic(ws, df: pd.DataFrame, freeze_cell="A2"):
     # Bold header row
     for cell in ws[1]:
         cell.font = Font(bold=True)
         cell.alignment = Alignment(horizontal="left", vertical="center")
 
-    # Align columns
-    for row in ws.iter_rows(min_row=2):
-        for cell in row:
-            if cell.value is None:
-                continue
-            # numbers right, text left
-            if isinstance(cell.value, (int, float)):
-                cell.alignment = Alignment(horizontal="right", vertical="center")
-            else:
-                cell.alignment = Alignment(horizontal="left", vertical="center")
+    # Align columns: numbers right, text left (one style per column, from the dtype)
+    apply_column_alignment(ws, df, vertical="center")
 
     ws.freeze_panes = freeze_cell
-    autosize_columns(ws)
+    autosize_columns(ws, df)
 
 
-def build_sheet1(df: pd.DataFrame) -> pd.DataFrame:
-    """Create Sheet1 with Days + Bucket columns as 1 or blank (Excel-like)."""
+def build_sheet1(df: pd.DataFrame, today=None) -> pd.DataFrame:
+    """Create Sheet1 with Days + bucket index (1/blank bucket columns are added at write time)."""
     # Parse date columns (safe)
-    df[COL_FILE_RCPT] = pd.to_datetime(df.get(COL_FILE_RCPT), errors="coerce")
-    df[COL_ELIG_START] = pd.to_datetime(df.get(COL_ELIG_START), errors="coerce")
+    with stage("to_datetime", rows_in=len(df)) as st:
+        st["dates"] = parse_date_columns(df, [COL_FILE_RCPT, COL_ELIG_START], fallback=DATE_FALLBACK)
 
     # Choose date: if file_receipt_date_time blank -> eligibility_start_date else file_receipt_date_time
     chosen_date = df[COL_FILE_RCPT].where(df[COL_FILE_RCPT].notna(), df[COL_ELIG_START])
 
     # Days until today
-    today = pd.Timestamp.today().normalize()
+    today = today if today is not None else pd.Timestamp.today().normalize()
     days = (today - chosen_date).dt.days
 
     # If both dates missing, keep blank
@@ -97,72 +126,131 @@ def build_sheet1(df: pd.DataFrame) -> pd.DataFrame:
 
     df[DAYS_COL] = days
 
-    # Create bucket columns as 1 or "" (blank)
-    for name, lo, hi in BUCKETS:
-        if hi is None:
-            mask = df[DAYS_COL].notna() & (df[DAYS_COL] > lo)
-        else:
-            mask = df[DAYS_COL].notna() & (df[DAYS_COL] >= lo) & (df[DAYS_COL] < hi)
-
-        df[name] = ""
-        df.loc[mask, name] = 1
+    # Bucket position per row, one searchsorted over the bucket edges (-1 = no bucket)
+    df[BUCKET_INDEX_COL] = bucket_index(df[DAYS_COL], BUCKETS)
 
     return df
 
 
-def build_sheet2_pivot(df_sheet1: pd.DataFrame) -> pd.DataFrame:
-    """Create Sheet2 pivot (Aging by Status & Drug)."""
+def build_pivot_keys(df_sheet1: pd.DataFrame) -> pd.DataFrame:
+    """Normalize row fields to merge case-mismatch like Excel pivot (only the columns we need)."""
+    return pd.DataFrame({
+        COL_DRUG: df_sheet1[COL_DRUG].astype(str).str.strip(),
+        COL_STATUS: clean_series(df_sheet1[COL_STATUS], clean_text),
+        COL_REASON: clean_series(df_sheet1[COL_REASON], clean_text),
+        BUCKET_INDEX_COL: df_sheet1[BUCKET_INDEX_COL],
+    })
+
+
+def build_sheet2_pivot(df_sheet1: pd.DataFrame, pivot_keys: pd.DataFrame = None) -> pd.DataFrame:
+    """Create Sheet2 pivot (Aging by Status & Drug); pivot_keys = build_pivot_keys(df_sheet1) if already made."""
+    df = pivot_keys if pivot_keys is not None else build_pivot_keys(df_sheet1)
+
+    # Pivot: rows = drug, status, reason; values = count per bucket (sorted ascending by the keys)
+    return parallel_bucket_pivot(df, [COL_DRUG, COL_STATUS, COL_REASON], BUCKETS, PIVOT_WORKERS)
 
-    # Normalize row fields to merge case-mismatch like Excel pivot
-    df = df_sheet1.copy()
-    df[COL_DRUG] = df[COL_DRUG].astype(str).str.strip()
-    df[COL_STATUS] = df[COL_STATUS].apply(clean_text)
-    df[COL_REASON] = df[COL_REASON].apply(clean_text)
 
-    # For pivot sums, need numeric 1/0 versions of bucket columns
-    for name, _, _ in BUCKETS:
-        df[name] = df[name].apply(lambda v: 1 if v == 1 else 0)
+def aging_cells(rows: pd.DataFrame) -> pd.DataFrame:
+    """Incremental groups for new/changed rows: cleaned pivot keys + day number of the chosen date."""
+    file_rcpt = parse_dates(rows[COL_FILE_RCPT], fallback=DATE_FALLBACK)
+    elig_start = parse_dates(rows[COL_ELIG_START], fallback=DATE_FALLBACK)
 
-    # Pivot: rows = drug, status, reason; values = sum of buckets
-    pivot = pd.pivot_table(
-        df,
-        index=[COL_DRUG, COL_STATUS, COL_REASON],
-        values=[b[0] for b in BUCKETS],
-        aggfunc="sum",
-        fill_value=0
+    return pd.DataFrame({
+        COL_DRUG: rows[COL_DRUG].astype(str).str.strip(),
+        COL_STATUS: clean_series(rows[COL_STATUS], clean_text),
+        COL_REASON: clean_series(rows[COL_REASON], clean_text),
+        DAY_NUMBER_COL: day_number(file_rcpt.where(file_rcpt.notna(), elig_start)),
+    })
+
+
+def build_sheet2_incremental(df: pd.DataFrame, today):
+    """
+    Sheet2 from the incremental state: only new/changed/removed rows update the per-day counts,
+    then every day count is re-aged on `today` (cases move buckets as days pass).
+    """
+    keys = [COL_DRUG, COL_STATUS, COL_REASON]
+    cells, stats = refresh_cells(
+        INCREMENTAL_STATE, df, aging_cells,
+        cell_cols=keys + [DAY_NUMBER_COL],
+        fingerprint_cols=[COL_DRUG, COL_STATUS, COL_REASON, COL_FILE_RCPT, COL_ELIG_START],
     )
+    cells[BUCKET_INDEX_COL] = bucket_index(days_since(cells[DAY_NUMBER_COL], today), BUCKETS)
+
+    return bucket_pivot(cells, keys, BUCKETS, weight_col=ROWS_COL), stats
+
+
+def build_backfill(df: pd.DataFrame, dates) -> dict:
+    """
+    Sheet2 on every as-of date from one read: rows counted per cleaned drug/status/reason and day
+    of the chosen date, then aged on all the dates at once (aging.as_of_counts).
+    Returns {TREND_SHEET: long table, SNAPSHOT_SHEET of each date: its Sheet2 (AS_OF_SHEETS only)}.
+    """
+    keys = [COL_DRUG, COL_STATUS, COL_REASON]
+    cells = count_rows(aging_cells(df), keys + [DAY_NUMBER_COL], ROWS_COL)
+    groups, counts = as_of_counts(cells, keys, DAY_NUMBER_COL, BUCKETS, dates, weight_col=ROWS_COL,
+                                  received_only=AS_OF_RECEIVED_ONLY)
 
-    # Sort by drug/status/reason ascending (like you asked earlier)
-    pivot = pivot.sort_index(level=[0, 1, 2], ascending=[True, True, True])
+    sheets = {TREND_SHEET: as_of_trend(groups, counts, dates, BUCKETS)}
+    if AS_OF_SHEETS:
+        for date, day_counts in zip(dates, counts):
+            sheets[SNAPSHOT_SHEET.format(date)] = as_of_pivot(groups, day_counts, BUCKETS)
+    return sheets
 
-    # Flatten for Excel
-    pivot = pivot.reset_index()
 
-    return pivot
+def sheet1_chunk(block: pd.DataFrame, today):
+    """Chunked mode: Sheet1 rows of one block + its rows per drug/status/reason/bucket."""
+    sheet1 = build_sheet1(block, today)
+    counts = count_rows(sheet1, [COL_DRUG, COL_STATUS, COL_REASON, BUCKET_INDEX_COL], ROWS_COL)
+    return {SHEET1: with_bucket_flags(sheet1, BUCKETS)}, counts
+
+
+def sheet2_from_counts(counts: pd.DataFrame):
+    """Chunked mode: Sheet2 from the merged row counts (clean-ups run per group, not per row)."""
+    keys = build_pivot_keys(counts)
+    keys[ROWS_COL] = counts[ROWS_COL]
+    return {SHEET2: bucket_pivot(keys, [COL_DRUG, COL_STATUS, COL_REASON], BUCKETS, weight_col=ROWS_COL)}
 
 
 def write_excel(df1: pd.DataFrame, df2: pd.DataFrame, out_path: Path):
+    write_sheets(out_path, {SHEET1: df1, SHEET2: df2})
+
+
+def write_sheets(out_path: Path, sheets: dict[str, pd.DataFrame]):
+    rows = sum(len(df) for df in sheets.values())
+    # New file: stream the sheets out already formatted (no load_workbook / second save)
+    if STREAMING_WRITE and not out_path.exists():
+        with stage("excel_write", rows_in=rows):
+            write_sheets_parallel(out_path, sheets, WRITE_WORKERS, freeze_cell="A2")
+        return
+
+    # Existing file: same streamed sheets, swapped in place of the old ones (other sheets not parsed)
+    if INPLACE_UPDATE and out_path.exists():
+        with stage("excel_write", rows_in=rows):
+            replace_sheets(out_path, sheets, workers=WRITE_WORKERS, freeze_cell="A2")
+        return
+
     mode = "a" if out_path.exists() else "w"
     writer_kwargs = dict(engine="openpyxl", mode=mode)
     if mode == "a":
         writer_kwargs["if_sheet_exists"] = "replace"
 
-    with pd.ExcelWriter(out_path, **writer_kwargs) as writer:
-        df1.to_excel(writer, sheet_name=SHEET1, index=False)
-        df2.to_excel(writer, sheet_name=SHEET2, index=False)
+    # Sheets over Excel's row limit go on "name (2)", ... (to_excel can't write them in one)
+    sheets = shard_frames(sheets)
+    with stage("excel_write", rows_in=rows):
+        with pd.ExcelWriter(out_path, **writer_kwargs) as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
 
     # Formatting
-    wb = load_workbook(out_path)
-    ws1 = wb[SHEET1]
-    ws2 = wb[SHEET2]
+    with stage("format", rows_in=rows):
+        wb = load_workbook(out_path)
+        for sheet_name, df in sheets.items():
+            format_sheet_basic(wb[sheet_name], df, freeze_cell="A2")
 
-    format_sheet_basic(ws1, freeze_cell="A2")
-    format_sheet_basic(ws2, freeze_cell="A2")
+        # Make the bucket headers stand out a bit (optional)
+        # (Keep simple & clean: just bold already done)
 
-    # Make the bucket headers stand out a bit (optional)
-    # (Keep simple & clean: just bold already done)
-
-    wb.save(out_path)
+        wb.save(out_path)
 
 
 def main():
@@ -172,20 +260,71 @@ def main():
     if not csv_path.exists():
         raise FileNotFoundError(f"CSV not found: {csv_path}")
 
-    df = pd.read_csv(csv_path)
-
-    # Validate required columns
-    required = {COL_DRUG, COL_STATUS, COL_REASON, COL_FILE_RCPT, COL_ELIG_START}
-    missing = required - set(df.columns)
+    # Validate required columns (header line only, before reading the whole file)
+    header = read_csv_header(csv_path)
+    required = set(CSV_SCHEMA["required"])
+    missing = required - set(header)
     if missing:
-        raise ValueError(f"Missing columns in CSV: {missing}. Found: {list(df.columns)}")
-
-    # Build sheets
-    sheet1_df = build_sheet1(df)
-    sheet2_df = build_sheet2_pivot(sheet1_df)
-
-    # Write output
-    write_excel(sheet1_df, sheet2_df, out_path)
+        raise ValueError(f"Missing columns in CSV: {missing}. Found: {header}")
+
+    if AS_OF_DATES and CHUNK_ROWS:
+        raise ValueError("AS_OF_DATES backfills from the whole extract in memory (set CHUNK_ROWS to None)")
+
+    with StageLog(out_path, "All_pending", enabled=RUN_LOG):
+        if CHUNK_ROWS:
+            plan = [dict(
+                name="All_pending", source=csv_path, schema=csv_schema(),
+                chunk=partial(sheet1_chunk, today=pd.Timestamp.today().normalize()),
+                keys=[COL_DRUG, COL_STATUS, COL_REASON, BUCKET_INDEX_COL],
+                finish=sheet2_from_counts,
+                sheets=[SHEET1, SHEET2],
+            )]
+            run_chunked(out_path, plan, chunk_rows=CHUNK_ROWS, freeze_cell="A2")
+            print(f"✅ Done. Created (chunked):\n- {SHEET1}\n- {SHEET2}\nFile: {out_path}")
+            return
+
+        with stage("read") as st:
+            df = load_csv(csv_path, csv_schema(), engine=CSV_ENGINE, header=header,
+                          cache_dir=CSV_CACHE_DIR, cache_bypass=CSV_CACHE_BYPASS)
+            st["rows_out"] = len(df)
+
+        if AS_OF_DATES:
+            dates = as_of_dates(*AS_OF_DATES, freq=AS_OF_FREQ)
+            if not len(dates):
+                raise ValueError(f"No as-of dates in {AS_OF_DATES} (freq {AS_OF_FREQ})")
+            with stage("backfill", rows_in=len(df)) as st:
+                sheets = build_backfill(df, dates)
+                st["rows_out"] = len(sheets[TREND_SHEET])
+            write_sheets(out_path, sheets)
+            listed = TREND_SHEET + (f"\n- {SNAPSHOT_SHEET.format(dates[0])} .. {SNAPSHOT_SHEET.format(dates[-1])}"
+                                    if AS_OF_SHEETS else "")
+            print(f"✅ Done. Backfill of {len(dates)} as-of dates:\n- {listed}\nFile: {out_path}")
+            return
+
+        # Build sheets
+        today = pd.Timestamp.today().normalize()
+        with stage("bucket", rows_in=len(df)) as st:
+            sheet1_df = build_sheet1(df, today)
+            st["rows_out"] = len(sheet1_df)
+
+        if INCREMENTAL_STATE:
+            with stage("pivot", rows_in=len(sheet1_df)) as st:
+                sheet2_df, stats = build_sheet2_incremental(sheet1_df, today)
+                st["rows_out"] = len(sheet2_df)
+            print(f"Incremental: {stats['added']:,} added, {stats['removed']:,} removed "
+                  f"of {stats['rows']:,} rows{' (full rebuild)' if stats['full'] else ''}")
+        else:
+            with stage("clean", rows_in=len(sheet1_df)) as st:
+                pivot_keys = build_pivot_keys(sheet1_df)
+                st["rows_out"] = len(pivot_keys)
+            with stage("pivot", rows_in=len(pivot_keys)) as st:
+                sheet2_df = build_sheet2_pivot(sheet1_df, pivot_keys)
+                st["rows_out"] = len(sheet2_df)
+
+        # Write output (1/blank bucket columns only exist in the Excel copy of Sheet1)
+        with stage("bucket_flags", rows_in=len(sheet1_df)):
+            sheet1_out = with_bucket_flags(sheet1_df, BUCKETS)
+        write_excel(sheet1_out, sheet2_df, out_path)
 
     print(f"✅ Done. Created/updated:\n- {SHEET1}\n- {SHEET2}\nFile: {out_path}")
 
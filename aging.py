@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+
+# Internal column: position of the row's bucket in BUCKETS (-1 = no bucket). Never written to Excel.
+BUCKET_INDEX_COL = "_bucket_idx"
+
+
+def bucket_index(days, buckets) -> np.ndarray:
+    """
+    Bucket position for every day count with one searchsorted over the lower edges.
+
+    Same rules as the old per-bucket masks:
+    - (name, lo, hi)   -> lo <= days < hi
+    - (name, lo, None) -> days > lo   (so exactly lo, e.g. 90, lands in no bucket)
+    - missing days     -> -1
+    """
+    days = pd.to_numeric(pd.Series(days), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    lows = np.array([lo for _, lo, _ in buckets], dtype=float)
+    highs = np.array([np.inf if hi is None else hi for _, _, hi in buckets], dtype=float)
+    open_ended = np.array([hi is None for _, _, hi in buckets])
+
+    idx = np.searchsorted(lows, days, side="right") - 1
+    safe = idx.clip(min=0)
+
+    inside = (idx >= 0) & ~np.isnan(days) & (days < highs[safe])
+    inside &= ~(open_ended[safe] & (days == lows[safe]))
+
+    return np.where(inside, idx, -1).astype(np.int8)
+
+
+def day_number(dates) -> pd.Series:
+    """
+    Dates as whole days since 1970-01-01, rounded up (NaT -> NaN), so that
+    today_day - day_number == (today - date).dt.days for a midnight `today`.
+    Lets day counts be kept per day and re-aged on any later date without the rows.
+    """
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce")
+    return (dates.dt.ceil("D") - pd.Timestamp(0)).dt.days.astype(float)
+
+
+def days_since(day_numbers, today) -> pd.Series:
+    """Age in days on `today` (midnight) for day_number values, clipped at 0 (NaN stays NaN)."""
+    today_day = (pd.Timestamp(today).normalize() - pd.Timestamp(0)).days
+    return (today_day - pd.Series(day_numbers, dtype=float)).clip(lower=0)
+
+
+def with_bucket_flags(df: pd.DataFrame, buckets, index_col=BUCKET_INDEX_COL) -> pd.DataFrame:
+    """Excel display version: bucket index column replaced by one 1-or-blank column per bucket."""
+    idx = df[index_col].to_numpy()
+    flags = {}
+    for i, (name, _, _) in enumerate(buckets):
+        col = np.full(len(df), "", dtype=object)
+        col[idx == i] = 1
+        flags[name] = col
+    return pd.concat([df.drop(columns=index_col), pd.DataFrame(flags, index=df.index)], axis=1)
+
+
+def bucket_pivot(df: pd.DataFrame, keys, buckets, index_col=BUCKET_INDEX_COL, weight_col=None) -> pd.DataFrame:
+    """
+    Same table as pivot_table(index=keys, values=<bucket columns>, aggfunc="sum", fill_value=0)
+    over 1/0 bucket columns, counted straight from the bucket index with one bincount.
+    Groups whose rows fall in no bucket still get a row of zeros.
+    weight_col: rows that stand for several cases (e.g. pre-counted groups); default 1 per row.
+    """
+    grouped = df.groupby(keys, sort=True)
+    gid = grouped.ngroup().to_numpy()
+    n_groups = grouped.ngroups
+    width = len(buckets) + 1                     # slot 0 = "no bucket"
+
+    keep = gid >= 0                              # rows with a missing key are dropped, like pivot_table
+    slots = gid[keep].astype(np.int64) * width + (df[index_col].to_numpy()[keep].astype(np.int64) + 1)
+    weights = None if weight_col is None else df[weight_col].to_numpy()[keep]
+    counts = np.bincount(slots, weights=weights, minlength=n_groups * width).reshape(n_groups, width)[:, 1:]
+
+    names = [name for name, _, _ in buckets]
+    out = pd.DataFrame(counts.astype(np.int64), index=grouped.size().index, columns=names)
+
+    # pivot_table orders the value columns by name
+    return out[sorted(names)].reset_index()
+
+
+def case_bucket_pivot(df: pd.DataFrame, keys, buckets, index_col=BUCKET_INDEX_COL) -> pd.DataFrame:
+    """
+    bucket_pivot for keys ending in a per-case ID (one group per case), built on integer codes:
+    each key factorized once (sorted), rows ordered by one lexsort of the codes, and a case
+    in a single row is just its bucket as a 1 (only repeated keys are summed).
+    Same rows, order and counts as bucket_pivot; the key columns come back as categoricals,
+    so the distinct labels are held once instead of in a MultiIndex of object tuples.
+    """
+    codes, labels = [], []
+    keep = np.ones(len(df), dtype=bool)
+    for key in keys:
+        c, uniques = pd.factorize(df[key], sort=True)
+        codes.append(c)
+        labels.append(uniques)
+        keep &= c >= 0                           # rows with a missing key are dropped, like pivot_table
+    codes = [c[keep] for c in codes]
+    idx = df[index_col].to_numpy()[keep].astype(np.int64)
+
+    order = np.lexsort(codes[::-1])
+    codes = [c[order] for c in codes]
+    idx = idx[order]
+
+    new = np.ones(len(idx), dtype=bool)          # first row of each group
+    if len(idx):
+        new[1:] = np.logical_or.reduce([c[1:] != c[:-1] for c in codes])
+    starts = np.flatnonzero(new)
+    width = len(buckets) + 1                     # slot 0 = "no bucket"
+
+    if len(starts) == len(idx):
+        counts = np.zeros((len(idx), width), dtype=np.int64)
+        counts[np.arange(len(idx)), idx + 1] = 1
+    else:
+        gid = np.cumsum(new) - 1
+        counts = np.bincount(gid * width + idx + 1, minlength=len(starts) * width).reshape(len(starts), width)
+    counts = counts[:, 1:].astype(np.int64)
+
+    out = pd.DataFrame({
+        key: pd.Categorical.from_codes(c[starts], categories=pd.Index(u))
+        for key, c, u in zip(keys, codes, labels)
+    })
+    names = [name for name, _, _ in buckets]
+    for i in np.argsort(names, kind="stable"):
+        out[names[i]] = counts[:, i]
+    return out
+
+
+def bucket_rollups(pivot: pd.DataFrame, keys, buckets, grand_total_label="Grand Total"):
+    """
+    Drill-down rows for a case_bucket_pivot: above each first-level value, then each second-level
+    value within it, ..., a subtotal row summed from the case rows below it (no second groupby),
+    then the case rows, and a grand total at the end.
+
+    Returns (frame, levels): labels as text ("" below a subtotal's level) + the bucket columns,
+    and the Excel outline level of every row (subtotal depth, cases = len(keys) - 1, total 0).
+    """
+    names = sorted(name for name, _, _ in buckets)
+    counts = pivot[names].to_numpy(dtype=np.int64)
+    codes = [pivot[k].cat.codes.to_numpy() for k in keys]
+    n, depth_leaf = len(pivot), len(keys) - 1
+
+    # row position of each block: (first case row, depth) -> subtotals sit right above their first case
+    positions, blocks = [], []
+    new = np.zeros(n, dtype=bool)
+    for d in range(depth_leaf):
+        if n:
+            new[0] = True
+            new[1:] |= codes[d][1:] != codes[d][:-1]
+        starts = np.flatnonzero(new)
+        positions.append(starts * len(keys) + d)
+        blocks.append((d, starts, np.add.reduceat(counts, starts, axis=0) if n else counts[:0]))
+    positions.append(np.arange(n) * len(keys) + depth_leaf)
+    blocks.append((depth_leaf, np.arange(n), counts))
+    order = np.argsort(np.concatenate(positions), kind="stable")
+
+    columns = {}
+    for j, key in enumerate(keys):
+        text = pivot[key].cat.categories.to_numpy(dtype=object)
+        parts = [text[codes[j][rows]] if j <= d else np.full(len(rows), "", dtype=object) for d, rows, _ in blocks]
+        columns[key] = np.append(np.concatenate(parts)[order], grand_total_label if j == 0 else "")
+    totals = np.vstack([block for _, _, block in blocks])[order]
+    for i, name in enumerate(names):
+        columns[name] = np.append(totals[:, i], counts[:, i].sum())
+
+    levels = np.append(np.concatenate([np.full(len(rows), d, dtype=np.int8) for d, rows, _ in blocks])[order], 0)
+    return pd.DataFrame(columns), levels
+
+
+def as_of_dates(start, end=None, freq="D") -> pd.DatetimeIndex:
+    """Midnight as-of dates from start to end (inclusive), every `freq` (pandas offset: "D", "W-FRI", "ME", ...)."""
+    dates = pd.date_range(pd.Timestamp(start), pd.Timestamp(end if end is not None else start), freq=freq)
+    return dates.normalize().unique()
+
+
+def _age_range(lo, hi):
+    # whole-day ages a bucket takes (bucket_index rules): lo <= a < hi, or a > lo when open-ended
+    if hi is None:
+        return int(np.floor(lo)) + 1, None
+    return int(np.ceil(lo)), int(np.ceil(hi)) - 1
+
+
+def as_of_counts(df: pd.DataFrame, keys, day_col, buckets, dates, weight_col=None, received_only=False):
+    """
+    bucket_pivot of the same rows on many as-of dates at once, from day numbers (day_number) instead
+    of ages. On a date (day t) a bucket holds the rows whose day falls in a range set by t and the
+    bucket edges, so the rows are sorted once by (group, day) with a running total of their weights,
+    and every group x bucket x date count is two searchsorted lookups into it: the dates add lookups,
+    not passes over the rows.
+
+    Ages are those of a run on that date: days_since (future dates age 0, missing days no bucket).
+    received_only: a date only counts the rows whose day is on or before it.
+    Returns (groups, counts): the key columns of every group, sorted like bucket_pivot, and
+    counts[date, group, bucket] with the buckets in `buckets` order.
+    """
+    grouped = df.groupby(keys, sort=True)
+    gid = grouped.ngroup().to_numpy()
+    groups = grouped.size().index.to_frame(index=False)
+    days = pd.to_numeric(df[day_col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    weights = np.ones(len(df)) if weight_col is None else df[weight_col].to_numpy(dtype=float)
+
+    keep = (gid >= 0) & ~np.isnan(days)          # missing key: dropped; missing day: in no bucket
+    gid, days, weights = gid[keep].astype(np.int64), days[keep].astype(np.int64), weights[keep]
+
+    # rows as group * span + (day - first): sorted, "rows of group g with day <= x" is one searchsorted
+    first = days.min() if len(days) else 0
+    span = (days.max() - first + 2) if len(days) else 2
+    order = np.argsort(gid * span + (days - first), kind="stable")
+    position = (gid * span + (days - first))[order]
+    running = np.concatenate([[0.0], np.cumsum(weights[order])])
+    g = np.arange(len(groups), dtype=np.int64)
+    base = running[np.searchsorted(position, g * span, side="left")]
+
+    def upto(x):
+        # weight of each group's rows with day <= x (x: one bound per bucket) -> (buckets, groups)
+        offset = np.clip(np.asarray(x, dtype=np.int64) - first, -1, span - 2)
+        return running[np.searchsorted(position, g * span + offset[:, None], side="right")] - base
+
+    ranges = [_age_range(lo, hi) for _, lo, hi in buckets]
+    never = np.iinfo(np.int32).min                   # a day bound below every row
+    counts = np.zeros((len(dates), len(groups), len(buckets)), dtype=np.int64)
+    for i, date in enumerate(pd.DatetimeIndex(dates)):
+        t = (date.normalize() - pd.Timestamp(0)).days
+        # ages lo..hi on day t <-> days t - hi .. t - lo (bottom is exclusive); ages are clipped at 0,
+        # so a bucket from age 0 also takes the later days, unless received_only
+        top, bottom = [], []
+        for lo, hi in ranges:
+            if hi is not None and hi < max(lo, 0):
+                top.append(never)                    # no whole-day age fits
+            elif lo > 0:
+                top.append(t - lo)
+            else:
+                top.append(t if received_only else first + span)
+            bottom.append(never if hi is None else t - hi - 1)
+        counts[i] = np.maximum(upto(top) - upto(bottom), 0).T.round().astype(np.int64)
+    return groups, counts
+
+
+def as_of_pivot(groups: pd.DataFrame, counts: np.ndarray, buckets) -> pd.DataFrame:
+    """One date of as_of_counts (counts[i]) as bucket_pivot lays it out: keys, then the buckets by name."""
+    out = groups.copy()
+    names = [name for name, _, _ in buckets]
+    for i in np.argsort(names, kind="stable"):
+        out[names[i]] = counts[:, i]
+    return out
+
+
+def as_of_trend(groups: pd.DataFrame, counts: np.ndarray, dates, buckets,
+                date_col="As Of", bucket_col="Bucket", count_col="Cases") -> pd.DataFrame:
+    """
+    as_of_counts as one long table: a row per date x group x bucket with cases in it (empty cells
+    left out), by date, then the groups as sorted, then the buckets in order.
+    """
+    d, g, b = np.nonzero(counts)
+    out = groups.iloc[g].reset_index(drop=True)
+    out.insert(0, date_col, pd.DatetimeIndex(dates)[d])
+    out[bucket_col] = pd.Categorical.from_codes(b, categories=[name for name, _, _ in buckets])
+    out[count_col] = counts[d, g, b]
+    return out
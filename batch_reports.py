@@ -0,0 +1,300 @@
+"""
+Batch mode: many source extracts -> one workbook each, over a process pool.
+
+    python batch_reports.py                                   # SOURCE_GLOB / OUTPUT_DIR below
+    python batch_reports.py --glob "D:\\extracts\\*.csv" --out-dir D:\\reports
+    python batch_reports.py --manifest jobs.csv               # report,source[,source_2],output
+
+Report types are the three scripts, run unchanged with their CONFIG pointed at the job's files:
+  cumulative   1st_cumulative.py   (Source + Pivot_Summary)
+  aging        All_pending.py      (All Pending Cases + aging pivot)
+  regalo       final_regalo.py     (4 sheets; one source is used for both reports unless source_2 is given)
+With a glob, the report type comes from the file name (REPORT_BY_NAME, first match wins).
+
+Each job runs in a fresh worker process (nothing left over between jobs). At most WORKERS run at
+once, and their estimated peak memory stays under MEMORY_BUDGET_MB. The estimate is the job's
+peak RSS from the last batch, or MEMORY_PER_SOURCE_MB x source size for a new job. A job bigger
+than the budget runs alone.
+
+Skip-unchanged: a job is skipped when its output exists and its sources match the last successful
+run. A matching size + mtime counts as a match without reading the file; otherwise the content
+hash decides (a copied or touched extract with the same bytes is still skipped). The script file
+is compared too, and aging / regalo jobs also rerun on a new day (their ages count to today).
+The state is JSON next to the outputs (STATE_FILE), saved after every finished job.
+
+Outputs belong to the batch: a job that runs replaces its workbook (other sheets are not kept).
+"""
+import argparse
+import csv
+import fnmatch
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import pandas as pd
+
+from frame_cache import file_digest
+from stage_log import peak_rss_mb
+
+# ---------------- CONFIG ----------------
+SOURCE_GLOB = r"C:\path\to\extracts\*.csv"        # <-- change (or --glob / --manifest)
+OUTPUT_DIR = r"C:\path\to\reports"                # glob jobs: <OUTPUT_DIR>\<source stem>.xlsx
+REPORT_BY_NAME = [                                # file name pattern -> report type (first match wins)
+    ("*cumulative*", "cumulative"),
+    ("*pending*", "aging"),
+    ("*regalo*", "regalo"),
+]
+WORKERS = 2                                       # jobs at once (each in its own process)
+MEMORY_BUDGET_MB = 4096                           # estimated peak memory of the running jobs, together
+MEMORY_PER_SOURCE_MB = 8                          # first-run estimate: MB of peak memory per MB of source
+STATE_FILE = None                                 # default: <OUTPUT_DIR>\batch_state.json
+SUMMARY_CSV = None                                # default: <OUTPUT_DIR>\batch_summary.csv
+FORCE = False                                     # True -> run every job, changed or not
+# ----------------------------------------
+
+HERE = Path(__file__).resolve().parent
+STATE_VERSION = 1
+
+# report type -> script, its source CONFIG names, whether the output depends on today's date
+REPORTS = {
+    "cumulative": dict(script="1st_cumulative.py", sources=["CSV_PATH"], dated=False),
+    "aging": dict(script="All_pending.py", sources=["CSV_PATH"], dated=True),
+    "regalo": dict(script="final_regalo.py", sources=["CSV1_PATH", "CSV2_PATH"], dated=True),
+}
+SUMMARY_COLUMNS = ["report", "sources", "output", "status", "seconds", "peak_rss_mb", "message"]
+
+
+# ------------------ Jobs ------------------
+def job(report, sources, output) -> dict:
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report type {report!r}; expected one of {sorted(REPORTS)}")
+    sources = [str(Path(s)) for s in sources if s]
+    needed = len(REPORTS[report]["sources"])
+    if report == "regalo" and len(sources) == 1:
+        sources = sources * 2                     # one extract for both reports
+    if len(sources) != needed:
+        raise ValueError(f"{report} needs {needed} source(s), got {sources}")
+    return dict(report=report, sources=sources, output=str(Path(output)))
+
+
+def report_for(path) -> str:
+    name = Path(path).name.lower()
+    for pattern, report in REPORT_BY_NAME:
+        if fnmatch.fnmatch(name, pattern.lower()):
+            return report
+    return None
+
+
+def jobs_from_glob(pattern, out_dir) -> list:
+    """One job per matching file whose name maps to a report type (others are listed and left out)."""
+    jobs, unmatched = [], []
+    for path in sorted(Path(p) for p in _glob(pattern)):
+        report = report_for(path)
+        if report is None:
+            unmatched.append(path.name)
+            continue
+        jobs.append(job(report, [path], Path(out_dir) / f"{path.stem}.xlsx"))
+    if unmatched:
+        print(f"No report type for {len(unmatched)} file(s) (see REPORT_BY_NAME): {unmatched}")
+    return jobs
+
+
+def _glob(pattern):
+    pattern = Path(pattern)
+    return pattern.parent.glob(pattern.name)
+
+
+def jobs_from_manifest(manifest_path) -> list:
+    """Manifest CSV: report, source, output (+ optional source_2); relative paths are relative to it."""
+    base = Path(manifest_path).resolve().parent
+    jobs = []
+    with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+            missing = [c for c in ("report", "source", "output") if not row.get(c)]
+            if missing:
+                raise ValueError(f"{manifest_path} line {line_no}: missing {missing}")
+            sources = [base / row["source"]] + ([base / row["source_2"]] if row.get("source_2") else [])
+            jobs.append(job(row["report"].lower(), sources, base / row["output"]))
+
+    outputs = [j["output"] for j in jobs]
+    duplicated = sorted({o for o in outputs if outputs.count(o) > 1})
+    if duplicated:
+        raise ValueError(f"More than one job writes {duplicated}")
+    return jobs
+
+
+# ------------------ Skip-unchanged ------------------
+def load_state(state_path) -> dict:
+    try:
+        state = json.loads(Path(state_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return state.get("jobs", {}) if state.get("version") == STATE_VERSION else {}
+
+
+def save_state(state_path, jobs_state):
+    # written next to the target and swapped in, so a killed batch never leaves half a state file
+    state_path = Path(state_path)
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(dict(version=STATE_VERSION, jobs=jobs_state), indent=1), encoding="utf-8")
+    os.replace(tmp_path, state_path)
+
+
+def file_stamp(path, previous=None) -> dict:
+    """size / mtime / content hash; the hash is reused from previous when size and mtime still match."""
+    st = Path(path).stat()
+    stamp = dict(size=st.st_size, mtime_ns=st.st_mtime_ns)
+    if previous and previous.get("size") == stamp["size"] and previous.get("mtime_ns") == stamp["mtime_ns"]:
+        stamp["digest"] = previous["digest"]
+    else:
+        stamp["digest"] = file_digest(path)
+    return stamp
+
+
+def job_stamp(j, previous, today) -> dict:
+    """Everything the job's output depends on: sources, script and (dated reports) the day."""
+    spec = REPORTS[j["report"]]
+    previous = previous or {}
+    old_files = previous.get("files", {})
+    script = HERE / spec["script"]
+    files = {str(p): file_stamp(p, old_files.get(str(p))) for p in list(dict.fromkeys(j["sources"])) + [script]}
+    return dict(files=files, day=str(today.date()) if spec["dated"] else None)
+
+
+def unchanged(j, stamp, previous) -> bool:
+    if not previous or not Path(j["output"]).exists():
+        return False
+    digests = lambda s: {path: f["digest"] for path, f in s["files"].items()}
+    return digests(stamp) == digests(previous) and stamp["day"] == previous.get("day")
+
+
+# ------------------ Worker ------------------
+def load_script(script, name):
+    spec = importlib.util.spec_from_file_location(name, HERE / script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_job(j) -> dict:
+    """One job in a worker process: the report script with its CONFIG pointed at the job's files."""
+    start = time.perf_counter()
+    spec = REPORTS[j["report"]]
+    out = Path(j["output"])
+    try:
+        module = load_script(spec["script"], f"batch_{j['report']}")
+        for name, source in zip(spec["sources"], j["sources"]):
+            setattr(module, name, source)
+        module.OUTPUT_XLSX = str(out)
+        module.PIVOT_WORKERS = 1                  # parallel across jobs, not inside one
+        if getattr(module, "INCREMENTAL_STATE", None):
+            module.INCREMENTAL_STATE = str(out.with_name(out.stem + ".state.pkl"))    # one per output
+
+        # rebuilt from scratch: with no old workbook the script takes its one-pass streaming write
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.unlink(missing_ok=True)
+        printed = io.StringIO()
+        with redirect_stdout(printed):
+            module.main()
+        lines = printed.getvalue().strip().splitlines()
+        status, message = "done", lines[-1] if lines else ""
+    except Exception as exc:                      # one bad extract doesn't stop the batch
+        status, message = "failed", f"{type(exc).__name__}: {exc}"
+    return dict(status=status, seconds=round(time.perf_counter() - start, 2),
+                peak_rss_mb=round(peak_rss_mb() or 0, 1), message=message)
+
+
+# ------------------ Batch ------------------
+def estimate_mb(j, previous) -> float:
+    if previous and previous.get("peak_rss_mb"):
+        return previous["peak_rss_mb"]
+    size_mb = sum(Path(s).stat().st_size for s in dict.fromkeys(j["sources"])) / 2**20
+    return max(size_mb * MEMORY_PER_SOURCE_MB, 100)
+
+
+def run_batch(jobs, state_path, workers=WORKERS, memory_budget_mb=MEMORY_BUDGET_MB, force=FORCE) -> pd.DataFrame:
+    """Run (or skip) every job; returns one summary row per job, in job order."""
+    state = load_state(state_path)
+    today = pd.Timestamp.today().normalize()
+    results = [None] * len(jobs)
+    todo = []
+
+    for i, j in enumerate(jobs):
+        previous = state.get(j["output"])
+        missing = [s for s in j["sources"] if not Path(s).exists()]
+        if missing:
+            results[i] = dict(status="failed", message=f"Source not found: {missing}")
+            continue
+        stamp = job_stamp(j, previous, today)
+        if not force and unchanged(j, stamp, previous):
+            results[i] = dict(status="skipped", message="sources unchanged", seconds=0.0)
+            continue
+        todo.append((i, stamp, estimate_mb(j, previous)))
+
+    # biggest first, so the long jobs don't start last
+    todo.sort(key=lambda item: -item[2])
+    running = {}
+    in_use = 0.0
+    # one fresh process per job (max_tasks_per_child): memory goes back to the OS after each job
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max(1, workers), mp_context=ctx, max_tasks_per_child=1) as pool:
+        while todo or running:
+            while todo and len(running) < workers:
+                fits = [k for k, (_, _, mb) in enumerate(todo) if in_use + mb <= memory_budget_mb]
+                if not fits and running:
+                    break                          # wait for memory to free up
+                i, stamp, mb = todo.pop(fits[0] if fits else 0)
+                running[pool.submit(run_job, jobs[i])] = (i, stamp, mb)
+                in_use += mb
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i, stamp, mb = running.pop(future)
+                in_use -= mb
+                results[i] = future.result()
+                print(f"[{results[i]['status']}] {jobs[i]['output']} ({results[i]['seconds']}s)")
+                if results[i]["status"] == "done":
+                    state[jobs[i]["output"]] = dict(stamp, report=jobs[i]["report"],
+                                                    peak_rss_mb=results[i]["peak_rss_mb"])
+                    save_state(state_path, state)
+
+    rows = [dict(report=j["report"], sources=";".join(dict.fromkeys(j["sources"])), output=j["output"], **r)
+            for j, r in zip(jobs, results)]
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build many report workbooks over a process pool.")
+    parser.add_argument("--manifest", help="CSV with report,source,output (+ source_2) per job")
+    parser.add_argument("--glob", default=SOURCE_GLOB, help="source extracts (report type from the name)")
+    parser.add_argument("--out-dir", default=OUTPUT_DIR, help="glob jobs' workbooks, state and summary")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_BUDGET_MB)
+    parser.add_argument("--force", action="store_true", default=FORCE, help="run unchanged jobs too")
+    args = parser.parse_args()
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = jobs_from_manifest(args.manifest) if args.manifest else jobs_from_glob(args.glob, out_dir)
+    if not jobs:
+        raise FileNotFoundError(f"No jobs: nothing matched {args.manifest or args.glob}")
+
+    state_path = Path(STATE_FILE) if STATE_FILE else out_dir / "batch_state.json"
+    summary = run_batch(jobs, state_path, workers=args.workers, memory_budget_mb=args.memory_mb, force=args.force)
+
+    summary_path = Path(SUMMARY_CSV) if SUMMARY_CSV else out_dir / "batch_summary.csv"
+    summary.to_csv(summary_path, index=False)
+    counts = summary["status"].value_counts()
+    print(f"✅ Done. {counts.get('done', 0)} built, {counts.get('skipped', 0)} skipped, "
+          f"{counts.get('failed', 0)} failed -> summary: {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Aging backfill: All_pending's Sheet2 on many as-of dates, one run per date vs one pass (AS_OF_DATES).
+
+    python bench_backfill.py
+    python bench_backfill.py --rows 1000000 --days 365 --sample 3
+
+Per size, on a synthetic extract:
+
+  per date   what a rerun on each date costs: read + dates / Sheet1 ages + clean-ups + pivot,
+             timed on --sample dates and multiplied out to --days
+  backfill   one read + build_backfill over all --days dates (trend table; per-date sheets
+             are laid out from the same counts, see AS_OF_SHEETS)
+
+Also checks that on the sampled dates the backfill counts equal the Sheet2 of a run on that date.
+Excel writing is left out of both (the trend sheet is a few rows per date and group).
+"""
+import argparse
+import importlib.util
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from synthetic_extract import write_extract
+
+# ---------------- CONFIG ----------------
+ROW_COUNTS = [200_000, 1_000_000]
+DAYS = 365                       # as-of dates, one per day, ending today
+SAMPLE = 3                       # dates actually rerun for the "per date" column
+SEED = 7
+# ----------------------------------------
+
+HERE = Path(__file__).resolve().parent
+
+
+def load_all_pending(csv_path):
+    spec = importlib.util.spec_from_file_location("bench_All_pending", HERE / "All_pending.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.CSV_PATH = str(csv_path)
+    return module
+
+
+def read(m):
+    return m.load_csv(Path(m.CSV_PATH), m.csv_schema(), engine=m.CSV_ENGINE)
+
+
+def run_on(m, df, today):
+    """Sheet2 of a run on `today` (the rows already read)."""
+    sheet1 = m.build_sheet1(df.copy(), today)
+    return m.build_sheet2_pivot(sheet1, m.build_pivot_keys(sheet1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aging backfill: one run per date vs one pass.")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--sample", type=int, default=SAMPLE)
+    args = parser.parse_args()
+
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=args.days, freq="D")
+    sample = dates[np.linspace(0, len(dates) - 1, min(args.sample, len(dates))).round().astype(int)]
+
+    print(f"{'rows':>10}  {'dates':>5}  {'read s':>7}  {'1 date s':>8}  {'per date s':>10}  "
+          f"{'backfill s':>10}  {'x':>6}  {'trend rows':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.rows:
+            csv_path = Path(tmp) / f"synthetic_{n_rows}.csv"
+            write_extract(csv_path, n_rows, seed=SEED)
+            m = load_all_pending(csv_path)
+
+            start = time.perf_counter()
+            df = read(m)
+            t_read = time.perf_counter() - start
+
+            want, t_dates = {}, []
+            for today in sample:
+                start = time.perf_counter()
+                want[today] = run_on(m, df, today)
+                t_dates.append(time.perf_counter() - start)
+            t_one = float(np.mean(t_dates))
+
+            m.AS_OF_SHEETS = False
+            start = time.perf_counter()
+            sheets = m.build_backfill(read(m), dates)
+            t_backfill = time.perf_counter() - start
+
+            # sampled dates: the backfill's counts laid out as Sheet2 == the run on that date
+            m.AS_OF_SHEETS = True
+            snapshots = m.build_backfill(df.copy(), sample)
+            for today in sample:
+                got = snapshots[m.SNAPSHOT_SHEET.format(today)]
+                pd.testing.assert_frame_equal(got.reset_index(drop=True), want[today].reset_index(drop=True),
+                                              check_dtype=False, check_categorical=False)
+
+            t_per_date = len(dates) * (t_read + t_one)
+            print(f"{n_rows:>10,}  {len(dates):>5}  {t_read:>7.2f}  {t_one:>8.2f}  {t_per_date:>10.1f}  "
+                  f"{t_backfill:>10.2f}  {t_per_date / t_backfill:>6.0f}  {len(sheets[m.TREND_SHEET]):>10,}")
+
+    print("✅ Done. Backfill counts match a run on each sampled date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from csv_source import load_csv, pyarrow_available
+
+# ---------------- CONFIG ----------------
+N_ROWS = 1_000_000               # override: python bench_csv_load.py 200000
+N_EXTRA_COLS = 30                # wide extract: columns the reports never look at
+SEED = 11
+
+SCHEMA = dict(
+    required=["drug", "case_sub_status", "case_sub_status_reason_code",
+              "file_receipt_date_time", "eligibility_start_date"],
+    dates=["file_receipt_date_time", "eligibility_start_date"],
+    categories=["drug", "case_sub_status", "case_sub_status_reason_code"],
+)
+# ----------------------------------------
+
+
+def write_extract(path: Path, n_rows, rng):
+    today = pd.Timestamp.today().normalize()
+    days = pd.to_timedelta(rng.integers(0, 200, n_rows), unit="D")
+    df = pd.DataFrame({
+        "case_id": [f"C{i:08d}" for i in range(n_rows)],
+        "drug": rng.choice(["Drug A", "Drug B", " drug c ", "DRUG D"], n_rows),
+        "case_sub_status": rng.choice(["Pending", "pending ", "On Hold", ""], n_rows),
+        "case_sub_status_reason_code": rng.choice(["Missing Info", "missing  info", "Pa Required"], n_rows),
+        "file_receipt_date_time": (today - days).strftime("%Y-%m-%d %H:%M:%S"),
+        "eligibility_start_date": (today - days).strftime("%Y-%m-%d"),
+    })
+    for i in range(N_EXTRA_COLS):
+        if i % 3 == 0:
+            df[f"extra_num_{i}"] = rng.integers(0, 10_000, n_rows)
+        elif i % 3 == 1:
+            df[f"extra_amt_{i}"] = np.round(rng.random(n_rows) * 1000, 2)
+        else:
+            df[f"extra_txt_{i}"] = rng.choice(["alpha", "beta", "gamma", "delta"], n_rows)
+    df.to_csv(path, index=False)
+
+
+def peak_rss_mb():
+    """VmHWM is reset on exec (ru_maxrss keeps the parent's peak on Linux)."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode, csv_path):
+    """Runs in a fresh process so the peak RSS belongs to this read only."""
+    start = time.perf_counter()
+    if mode == "legacy":
+        df = pd.read_csv(csv_path)
+    else:
+        engine, passthrough = mode.split("-")
+        df = load_csv(csv_path, dict(SCHEMA, passthrough=passthrough == "all"), engine=engine)
+    wall = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    print(json.dumps({"mode": mode, "wall_s": round(wall, 3), "peak_rss_mb": round(peak_mb, 1),
+                      "cols": df.shape[1], "frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 1)}))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+        return
+
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else N_ROWS
+    modes = ["legacy", "c-all", "c-used"]
+    if pyarrow_available():
+        modes += ["pyarrow-all", "pyarrow-used"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "extract.csv"
+        write_extract(csv_path, n_rows, np.random.default_rng(SEED))
+        print(f"rows={n_rows:,} file={csv_path.stat().st_size / 2**20:.0f} MB")
+        print(f"{'mode':<14} {'wall s':>8} {'peak RSS MB':>12} {'frame MB':>9} {'cols':>5}")
+        for mode in modes:
+            out = subprocess.run([sys.executable, __file__, "--measure", mode, str(csv_path)],
+                                 capture_output=True, text=True, check=True)
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{r['mode']:<14} {r['wall_s']:>8.2f} {r['peak_rss_mb']:>12.0f} {r['frame_mb']:>9.0f} {r['cols']:>5}")
+
+    print("✅ Done. (*-all keeps every column for the source sheet; *-used reads only schema columns)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold vs warm latency of one small job: a fresh process per run vs the resident report_daemon.
+
+    python bench_daemon.py
+    python bench_daemon.py --rows 50000 --reports regalo
+
+Per report type (10k-row synthetic extract by default, new workbook every run), best of REPEAT:
+  cold    `python report_daemon.py --run <extract>`: start Python, import, run the report, exit
+          (what a scheduled `python final_regalo.py` costs)
+  warm    the same job sent to a running daemon (--port, after its warm-up), timed at the sender
+          from submit to reply
+  first   the daemon's first job of that type without warm-up (imports done, first calls not)
+"""
+import argparse
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from report_daemon import submit
+from synthetic_extract import write_extract
+
+# ---------------- CONFIG ----------------
+ROWS = 10_000
+REPORTS = ["cumulative", "aging", "regalo"]
+REPEAT = 3                       # best of
+PORT = 8765
+SEED = 7
+START_TIMEOUT = 300              # seconds for the daemon to warm up and open its port
+# ----------------------------------------
+
+HERE = Path(__file__).resolve().parent
+DAEMON = [sys.executable, str(HERE / "report_daemon.py")]
+
+
+def cold(source, report, out):
+    out.unlink(missing_ok=True)
+    start = time.perf_counter()
+    subprocess.run(DAEMON + ["--run", str(source), "--report", report, "--output", str(out)],
+                   check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def warm(source, report, out, port):
+    out.unlink(missing_ok=True)
+    start = time.perf_counter()
+    result = submit(source, report, out, wait=True, port=port)
+    if result["status"] != "done":
+        raise RuntimeError(f"{report}: {result['message']}")
+    return time.perf_counter() - start
+
+
+def start_daemon(port, tmp, warmup=True):
+    """A daemon on `port` (socket only); returns once it takes jobs."""
+    process = subprocess.Popen(DAEMON + ["--inbox", "", "--out-dir", str(tmp), "--port", str(port)]
+                               + ([] if warmup else ["--no-warmup"]),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"report_daemon.py exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise TimeoutError(f"report_daemon.py did not open port {port} in {START_TIMEOUT}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold process vs warm daemon latency.")
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--reports", nargs="+", default=REPORTS)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = tmp / f"synthetic_{args.rows}_seed{SEED}.csv"
+        write_extract(source, args.rows, seed=SEED)
+
+        # first job of each type on a daemon without warm-up
+        daemon = start_daemon(args.port, tmp, warmup=False)
+        try:
+            first = {report: warm(source, report, tmp / f"first_{report}.xlsx", args.port) for report in args.reports}
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+        daemon = start_daemon(args.port, tmp)
+        try:
+            warm_s = {report: min(warm(source, report, tmp / f"warm_{report}.xlsx", args.port)
+                                  for _ in range(REPEAT)) for report in args.reports}
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+        cold_s = {report: min(cold(source, report, tmp / f"cold_{report}.xlsx") for _ in range(REPEAT))
+                  for report in args.reports}
+
+    print(f"{args.rows:,} rows")
+    print(f"{'report':<12}  {'cold s':>7}  {'first s':>7}  {'warm s':>7}  {'cold/warm':>9}")
+    for report in args.reports:
+        print(f"{report:<12}  {cold_s[report]:>7.2f}  {first[report]:>7.2f}  {warm_s[report]:>7.2f}  "
+              f"{cold_s[report] / warm_s[report]:>9.2f}")
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    main()
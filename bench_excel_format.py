@@ -0,0 +1,112 @@
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+
+from excel_output import apply_column_alignment, apply_column_widths
+
+# ---------------- CONFIG ----------------
+N_ROWS = 500_000                 # override: python bench_excel_format.py 100000
+SEED = 7
+SHEET = "All Pending Cases by Case ID"
+BUCKETS = ["0-15", "15-30", "30-45", "45-60", "60-75", "75-90", "90+"]
+# ----------------------------------------
+
+
+def make_aging_sheet(n_rows, rng):
+    """Synthetic 'All Pending Cases by Case ID' sheet: text, dates, days and 1/blank buckets."""
+    today = pd.Timestamp.today().normalize()
+    days = rng.integers(0, 200, n_rows)
+    df = pd.DataFrame({
+        "case_id": [f"C{i:08d}" for i in range(n_rows)],
+        "drug": rng.choice(["Drug A", "Drug B", "Drug C", "Drug D"], n_rows),
+        "case_sub_status": rng.choice(["Pending", "On Hold", "Pending Review"], n_rows),
+        "case_sub_status_reason_code": rng.choice(["Missing Info", "Pa Required", "Benefit Check"], n_rows),
+        "file_receipt_date_time": today - pd.to_timedelta(days, unit="D"),
+        "eligibility_start_date": today - pd.to_timedelta(days + 3, unit="D"),
+        "File Receipt Date Until Today": days,
+    })
+    edges = [0, 15, 30, 45, 60, 75, 90]
+    idx = np.searchsorted(edges, days, side="right") - 1
+    for i, name in enumerate(BUCKETS):
+        col = np.full(n_rows, "", dtype=object)
+        col[idx == i] = 1
+        df[name] = col
+    return df
+
+
+# ---- old per-cell formatting (final_regalo.py before this change), kept for comparison ----
+def legacy_autosize_columns(ws, max_width=60):
+    for col_idx in range(1, ws.max_column + 1):
+        col_letter = get_column_letter(col_idx)
+        max_len = 0
+        for cell in ws[col_letter]:
+            if cell.value is not None:
+                max_len = max(max_len, len(str(cell.value)))
+        ws.column_dimensions[col_letter].width = min(max_len + 3, max_width)
+
+
+def legacy_format_sheet_basic(ws):
+    for row in ws.iter_rows(min_row=2):
+        for cell in row:
+            if cell.value is None:
+                continue
+            if isinstance(cell.value, (int, float)):
+                cell.alignment = Alignment(horizontal="right", vertical="center")
+            else:
+                cell.alignment = Alignment(horizontal="left", vertical="center")
+    legacy_autosize_columns(ws)
+
+
+def new_format_sheet_basic(ws, df):
+    apply_column_alignment(ws, df, vertical="center")
+    apply_column_widths(ws, df)
+
+
+def load_sheet(xlsx_bytes):
+    return load_workbook(io.BytesIO(xlsx_bytes))[SHEET]
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else N_ROWS
+    df = make_aging_sheet(n_rows, np.random.default_rng(SEED))
+
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name=SHEET, index=False)
+    xlsx_bytes = buf.getvalue()
+
+    ws = load_sheet(xlsx_bytes)
+    start = time.perf_counter()
+    legacy_format_sheet_basic(ws)
+    t_old = time.perf_counter() - start
+    old_widths = {k: d.width for k, d in ws.column_dimensions.items()}
+    del ws
+
+    ws = load_sheet(xlsx_bytes)
+    start = time.perf_counter()
+    new_format_sheet_basic(ws, df)
+    t_new = time.perf_counter() - start
+    new_widths = {k: d.width for k, d in ws.column_dimensions.items()}
+
+    if old_widths != new_widths:
+        raise AssertionError(f"Width mismatch: {old_widths} vs {new_widths}")
+
+    start = time.perf_counter()
+    apply_column_widths(ws, df)
+    t_widths = time.perf_counter() - start
+
+    print(f"rows={n_rows:,} cols={df.shape[1]}")
+    print(f"  legacy per-cell format + autosize : {t_old:8.2f}s")
+    print(f"  per-column format + df widths     : {t_new:8.2f}s  ({t_old / t_new:.1f}x)")
+    print(f"    of which widths from DataFrame  : {t_widths:8.2f}s")
+    print("✅ Done. Column widths identical.")
+
+
+if __name__ == "__main__":
+    main()
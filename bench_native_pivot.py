@@ -0,0 +1,218 @@
+"""
+Pivot sheets computed here vs native Excel PivotTables (PIVOT_OUTPUT), on synthetic extracts.
+
+    python bench_native_pivot.py
+    python bench_native_pivot.py --rows 1000000 --data-dir bench_data
+
+Per size and script (final_regalo, 1st_cumulative), best of REPEAT: the whole run (read, clean-ups,
+pivots or PivotTable parts, write) into a new workbook, and the size of that workbook.
+
+  rows    pivot sheets grouped in pandas and written as rows (today's output)
+  excel   no pivot grouping: the case sheets + PivotTable definitions and caches over them
+          (no cached records, Excel fills the tables when the file is opened)
+
+Also checks that the case sheets hold the labels the PivotTables group by: summed per drug / status /
+reason they give the same numbers as the "rows" pivot sheets; and that the excel file, and the same
+file after add_pivot_tables is run on it again (same sources, then each pivot sheet alone over
+another source), keeps its pivot parts consistent and loads and saves with openpyxl.
+
+The excel mode saves the pivot stages and the pivot rows; the case sheets are written either way,
+so the gain is the share the pivots had of the run. The work moves to Excel: the first open of the
+file scans the case sheets once (a refresh, like pressing Refresh All).
+"""
+import argparse
+import importlib.util
+import io
+import re
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from synthetic_extract import write_extract
+from xlsx_parts import (CONTENT_TYPES, DOC_REL_NS, MAIN_NS, PIVOT_CACHE_REL, PIVOT_TABLE_REL, _relationships,
+                        _sheets, _workbook_part, add_pivot_tables)
+
+# ---------------- CONFIG ----------------
+ROW_COUNTS = [100_000, 500_000]
+REPEAT = 2                       # best of
+SEED = 7
+# ----------------------------------------
+
+HERE = Path(__file__).resolve().parent
+SCRIPTS = ["final_regalo", "1st_cumulative"]
+
+
+def load_script(name, mode, csv_path, out_path):
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", HERE / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.PIVOT_OUTPUT = mode
+    module.RUN_LOG = False
+    module.OUTPUT_XLSX = str(out_path)
+    if name == "final_regalo":
+        module.CSV1_PATH = module.CSV2_PATH = str(csv_path)
+    else:
+        module.CSV_PATH = str(csv_path)
+    return module
+
+
+def best_run(name, mode, csv_path, out_path):
+    best = float("inf")
+    for _ in range(REPEAT):
+        out_path.unlink(missing_ok=True)
+        m = load_script(name, mode, csv_path, out_path)
+        start = time.perf_counter()
+        m.main()
+        best = min(best, time.perf_counter() - start)
+    return m, best
+
+
+def check_labels(m, excel_path, rows_path):
+    """Pivot sheets of the "rows" file == the case sheets of the "excel" file summed the way the PivotTables are."""
+    if m.__name__ == "bench_final_regalo":
+        checks = [(m.R1_SOURCE_SHEET, m.R1_PIVOT_SHEET, [m.R1_COL_DRUG, m.R1_COL_REASON], [m.R1_COL_COUNT]),
+                  (m.R2_SHEET1, m.R2_SHEET2, [m.R2_COL_DRUG, m.R2_COL_STATUS, m.R2_COL_REASON],
+                   [name for name, _, _ in m.R2_BUCKETS])]
+    else:
+        checks = [(m.SOURCE_SHEET, m.PIVOT_SHEET, [m.COL_DRUG, m.COL_REASON], [m.COL_COUNT])]
+
+    for source, pivot, keys, values in checks:
+        # labels as text ("nan" is a label here); only empty cells are missing
+        read = dict(dtype={k: str for k in keys}, keep_default_na=False, na_values=[""])
+        cases = pd.read_excel(excel_path, sheet_name=source, **read)
+        want = pd.read_excel(rows_path, sheet_name=pivot, **read)
+        # leaf rows of the computed pivot: outer labels are only on the first row of their group,
+        # subtotal / Grand Total rows leave the last key empty, reasons may be indented
+        want[keys[:-1]] = want[keys[:-1]].ffill()
+        want[keys[-1]] = want[keys[-1]].str.strip()
+        want = want.dropna(subset=[keys[-1]]).set_index(keys)[values].fillna(0).sort_index()
+        got = cases.groupby(keys)[values].sum().sort_index()
+        pd.testing.assert_frame_equal(got.astype(float), want.astype(float), check_names=False)
+
+
+def check_pivot_parts(path):
+    """
+    What Excel would "repair": every workbook <pivotCache> has its own relationship to an existing,
+    distinct cache definition; cacheIds are unique; each PivotTable points at one of those caches
+    under its cacheId; every pivot part has a content type. Then an openpyxl load / save / load.
+    """
+    with zipfile.ZipFile(path) as zf:
+        workbook = _workbook_part(zf)
+        rels = {rel_id: target for rel_id, rel_type, target in _relationships(zf, workbook)
+                if rel_type == PIVOT_CACHE_REL}
+        nodes = list(ET.fromstring(zf.read(workbook)).iter(f"{{{MAIN_NS}}}pivotCache"))
+        entries = {int(node.get("cacheId")): node.get(f"{{{DOC_REL_NS}}}id") for node in nodes}
+        problems = []
+        if len(entries) != len(nodes):
+            problems.append("duplicate cacheIds")
+        if sorted(entries.values()) != sorted(rels):
+            problems.append(f"<pivotCache> ids {sorted(entries.values())} vs relationships {sorted(rels)}")
+        targets = [rels.get(rel_id) for rel_id in entries.values()]
+        if len(set(targets)) != len(targets):
+            problems.append(f"cache parts shared by several cacheIds: {targets}")
+        problems += [f"missing cache part {target}" for target in targets if target not in zf.NameToInfo]
+
+        cache_of = {rels.get(rel_id): cache_id for cache_id, rel_id in entries.items()}
+        tables = [table for _, _, part, _ in _sheets(zf, workbook)
+                  for _, rel_type, table in _relationships(zf, part) if rel_type == PIVOT_TABLE_REL]
+        for table in tables:
+            caches = [target for _, rel_type, target in _relationships(zf, table) if rel_type == PIVOT_CACHE_REL]
+            cache_id = int(ET.fromstring(zf.read(table)).get("cacheId"))
+            if len(caches) != 1 or cache_of.get(caches[0]) != cache_id:
+                problems.append(f"{table}: cacheId {cache_id}, cache {caches} (workbook: {cache_of})")
+        types = zf.read(CONTENT_TYPES).decode("utf-8")
+        problems += [f"no content type for {part}" for part in [*targets, *tables]
+                     if f'PartName="/{part}"' not in types]
+    if problems:
+        raise AssertionError(f"{path}: " + "; ".join(problems))
+
+    buffer = io.BytesIO()
+    load_workbook(path).save(buffer)
+    load_workbook(buffer)
+
+
+def pivot_specs(path):
+    """{pivot sheet: add_pivot_tables spec} read back from the file's PivotTables and their caches."""
+    with zipfile.ZipFile(path) as zf:
+        specs = {}
+        for name, _, part, _ in _sheets(zf, _workbook_part(zf)):
+            for _, rel_type, table in _relationships(zf, part):
+                if rel_type != PIVOT_TABLE_REL:
+                    continue
+                cache = next(target for _, t, target in _relationships(zf, table) if t == PIVOT_CACHE_REL)
+                root, cache_root = ET.fromstring(zf.read(table)), ET.fromstring(zf.read(cache))
+                source = cache_root.find(f".//{{{MAIN_NS}}}worksheetSource")
+                columns = [node.get("name") for node in cache_root.iter(f"{{{MAIN_NS}}}cacheField")]
+                specs[name] = dict(
+                    source=source.get("sheet"), columns=columns,
+                    rows=int(re.search(r"(\d+)$", source.get("ref")).group(1)) - 1,
+                    row_fields=[columns[int(field.get("x"))] for node in root.iter(f"{{{MAIN_NS}}}rowFields")
+                                for field in node.iter(f"{{{MAIN_NS}}}field")],
+                    value_fields=[columns[int(node.get("fld"))] for node in root.iter(f"{{{MAIN_NS}}}dataField")],
+                    subtotals=any(node.get("axis") == "axisRow" and node.get("defaultSubtotal") not in ("0", "false")
+                                  for node in root.iter(f"{{{MAIN_NS}}}pivotField")),
+                    name=root.get("name"))
+        return specs
+
+
+def check_rerun(excel_path, tmp):
+    """add_pivot_tables run again on the excel file: all pivots as they are, each pivot sheet alone
+    over the next one's source, then as they were. The pivot parts stay consistent throughout."""
+    path = Path(tmp) / "rerun.xlsx"
+    shutil.copyfile(excel_path, path)
+    specs = pivot_specs(path)
+    check_pivot_parts(path)
+    add_pivot_tables(path, specs)
+    check_pivot_parts(path)
+    names = list(specs)
+    for name, other in zip(names, names[1:] + names[:1]):
+        # one row short of the other pivot's range: openpyxl merges equal caches on save and leaves
+        # the second table's cacheId pointing nowhere
+        add_pivot_tables(path, {name: {**specs[other], "rows": specs[other]["rows"] - 1, "name": specs[name]["name"]}})
+        check_pivot_parts(path)
+    add_pivot_tables(path, specs)
+    check_pivot_parts(path)
+    if pivot_specs(path) != specs:
+        raise AssertionError(f"{path}: PivotTables not restored")
+    path.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Computed pivot sheets vs native Excel PivotTables.")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--data-dir", help="keep generated extracts here (reused on the next run)")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}  {'script':<15}  {'rows s':>7}  {'excel s':>7}  {'x':>5}  "
+          f"{'rows MB':>7}  {'excel MB':>8}  {'size':>5}")
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(args.data_dir) if args.data_dir else Path(tmp)
+        data_dir.mkdir(parents=True, exist_ok=True)
+
+        for n_rows in args.rows:
+            csv_path = data_dir / f"synthetic_{n_rows}_seed{SEED}.csv"
+            if not csv_path.exists():
+                write_extract(csv_path, n_rows, seed=SEED)
+
+            for name in SCRIPTS:
+                rows_path, excel_path = Path(tmp) / f"{name}_rows.xlsx", Path(tmp) / f"{name}_excel.xlsx"
+                _, t_rows = best_run(name, "rows", csv_path, rows_path)
+                m, t_excel = best_run(name, "excel", csv_path, excel_path)
+                check_labels(m, excel_path, rows_path)
+                check_rerun(excel_path, tmp)
+
+                mb_rows, mb_excel = rows_path.stat().st_size / 1e6, excel_path.stat().st_size / 1e6
+                print(f"{n_rows:>10,}  {name:<15}  {t_rows:>7.2f}  {t_excel:>7.2f}  {t_rows / t_excel:>5.2f}  "
+                      f"{mb_rows:>7.2f}  {mb_excel:>8.2f}  {mb_excel / mb_rows:>5.2f}")
+
+    print("✅ Done. Case sheets sum to the computed pivots; pivot parts consistent across reruns.")
+
+
+if __name__ == "__main__":
+    main()
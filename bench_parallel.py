@@ -0,0 +1,102 @@
+"""
+Scaling of the drug-partitioned pivots (parallel_pivot) over the worker count.
+
+    python bench_parallel.py
+    python bench_parallel.py --rows 1000000 --workers 1 2 4
+
+Times the Summary subtotal pivot and the aging bucket pivot on the same synthetic frame
+for every worker count (1 = the single-process builders), checks each result against the
+single-process table and prints the speedup. The first call per worker count starts the
+pool; that start-up is timed separately and left out of the pivot times.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import parallel_pivot
+from aging import BUCKET_INDEX_COL, bucket_pivot
+from parallel_pivot import parallel_bucket_pivot, parallel_subtotal_pivot
+from pivot_subtotals import build_subtotal_pivot
+
+# ---------------- CONFIG ----------------
+ROW_COUNTS = [1_000_000, 5_000_000]
+WORKERS = [1, 2, 4, 8]
+N_DRUGS = 400
+N_STATUSES = 8
+N_REASONS = 60
+REPEAT = 3                       # best of
+SEED = 42
+
+COL_DRUG = "drug"
+COL_STATUS = "case_sub_status"
+COL_REASON = "case_sub_status_reason_code"
+COL_COUNT = "case_count"
+BUCKETS = [("0-15", 0, 15), ("15-30", 15, 30), ("30-45", 30, 45), ("45-60", 45, 60),
+           ("60-75", 60, 75), ("75-90", 75, 90), ("90+", 90, None)]
+# ----------------------------------------
+
+
+def make_frame(n_rows, rng):
+    """Normalized pivot input: skewed drugs / reasons (like the real extracts) + a bucket index."""
+    drugs = np.array([f"Drug {i:03d}" for i in range(N_DRUGS)], dtype=object)
+    statuses = np.array([f"Status {i}" for i in range(N_STATUSES)], dtype=object)
+    reasons = np.array([f"Reason {i:02d}" for i in range(N_REASONS)], dtype=object)
+    drug_p = 1.0 / np.arange(1, N_DRUGS + 1)
+    reason_p = 1.0 / np.arange(1, N_REASONS + 1)
+    return pd.DataFrame({
+        COL_DRUG: rng.choice(drugs, n_rows, p=drug_p / drug_p.sum()),
+        COL_STATUS: rng.choice(statuses, n_rows),
+        COL_REASON: rng.choice(reasons, n_rows, p=reason_p / reason_p.sum()),
+        COL_COUNT: rng.integers(0, 5, n_rows).astype(float),
+        BUCKET_INDEX_COL: rng.integers(-1, len(BUCKETS), n_rows).astype(np.int8),
+    })
+
+
+def best_time(fn, *args, **kwargs):
+    best, out = float("inf"), None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        out = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel pivot scaling by worker count.")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--workers", type=int, nargs="+", default=WORKERS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+    print(f"CPUs: {os.cpu_count()}")
+    print(f"{'rows':>10}  {'workers':>7}  {'pool s':>7}  {'summary s':>9}  {'x':>5}  {'aging s':>8}  {'x':>5}")
+    for n_rows in args.rows:
+        df = make_frame(n_rows, rng)
+        levels, keys = [COL_DRUG, COL_REASON], [COL_DRUG, COL_STATUS, COL_REASON]
+
+        summary_1, t_summary_1 = best_time(build_subtotal_pivot, df, levels, COL_COUNT, order="key")
+        aging_1, t_aging_1 = best_time(bucket_pivot, df, keys, BUCKETS)
+
+        for workers in args.workers:
+            t_pool = 0.0
+            if workers > 1:
+                start = time.perf_counter()
+                parallel_pivot._pool(workers).submit(int).result()    # start the workers up front
+                t_pool = time.perf_counter() - start
+
+            summary, t_summary = best_time(parallel_subtotal_pivot, df, levels, COL_COUNT, workers, order="key")
+            aging, t_aging = best_time(parallel_bucket_pivot, df, keys, BUCKETS, workers)
+            pd.testing.assert_frame_equal(summary, summary_1)
+            pd.testing.assert_frame_equal(aging, aging_1)
+
+            print(f"{n_rows:>10,}  {workers:>7}  {t_pool:>7.2f}  {t_summary:>9.3f}  {t_summary_1 / t_summary:>5.2f}"
+                  f"  {t_aging:>8.3f}  {t_aging_1 / t_aging:>5.2f}")
+
+    print("✅ Done. Parallel output matches the single-process pivots.")
+
+
+if __name__ == "__main__":
+    main()
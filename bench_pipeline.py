@@ -0,0 +1,263 @@
+"""
+Stage-by-stage benchmark of the three report scripts on synthetic extracts.
+
+    python bench_pipeline.py                                   # every size in ROW_COUNTS
+    python bench_pipeline.py --rows 10000 100000 --out results.json
+    python bench_pipeline.py --rows 100000 --baseline baseline.json   # exit code 1 on regressions
+
+Every (script, size) runs in a fresh process through the script's own functions, timing
+read / clean / bucket / pivot / excel write / format pass, with the peak RSS after each stage.
+With the streaming writer (the scripts' default for a new file) cells are formatted as they
+are written, so there is no separate format stage; --legacy-write times the
+to_excel + load_workbook formatting path instead.
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from csv_source import load_csv, pyarrow_available, read_csv_header
+from report_plan import SharedSource, merge_schemas
+from stage_log import peak_rss_mb
+from synthetic_extract import write_extract
+
+# ---------------- CONFIG ----------------
+ROW_COUNTS = [10_000, 100_000, 1_000_000, 5_000_000]
+SCRIPTS = ["1st_cumulative", "All_pending", "final_regalo"]
+SEED = 7
+EXCEL_MAX_ROWS = 1_048_576           # rows per sheet incl. header; bigger sources skip the write stages
+REGRESSION_RATIO = 1.25              # stage slower than baseline x this -> regression
+MIN_COMPARE_S = 0.05                 # stages faster than this in both runs are noise, not compared
+# ----------------------------------------
+
+HERE = Path(__file__).resolve().parent
+
+
+def load_script(name):
+    """Script modules by file name (1st_cumulative.py isn't importable as a plain module name)."""
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", HERE / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextmanager
+def stage(stages, name):
+    start = time.perf_counter()
+    yield
+    stages[name] = dict(s=round(time.perf_counter() - start, 4), peak_rss_mb=round(peak_rss_mb(), 1))
+
+
+def timed_write(stages, module, write):
+    """Run write(); with the legacy writer, everything from load_workbook on is the format pass."""
+    format_start = []
+    load_workbook = module.load_workbook
+
+    def timed_load_workbook(*args, **kwargs):
+        format_start.append(time.perf_counter())
+        return load_workbook(*args, **kwargs)
+
+    module.load_workbook = timed_load_workbook
+    try:
+        start = time.perf_counter()
+        write()
+        end = time.perf_counter()
+    finally:
+        module.load_workbook = load_workbook
+
+    split = format_start[0] if format_start else end
+    peak = round(peak_rss_mb(), 1)
+    stages["excel_write"] = dict(s=round(split - start, 4), peak_rss_mb=peak)
+    if format_start:
+        stages["format"] = dict(s=round(end - split, 4), peak_rss_mb=peak)
+
+
+# ---------------- per-script stages (same calls, same order as each main()) ----------------
+def run_1st_cumulative(m, csv_path, out_path, stages, write):
+    with stage(stages, "read"):
+        df = load_csv(csv_path, m.CSV_SCHEMA, engine=m.CSV_ENGINE, header=read_csv_header(csv_path))
+    with stage(stages, "clean"):
+        df = m.clean_source(df)
+    with stage(stages, "pivot"):
+        pivot_out = m.build_excel_like_pivot(df)
+    if write:
+        timed_write(stages, m, lambda: m.write_output(out_path, df, pivot_out))
+
+
+def run_all_pending(m, csv_path, out_path, stages, write):
+    with stage(stages, "read"):
+        df = load_csv(csv_path, m.csv_schema(), engine=m.CSV_ENGINE, header=read_csv_header(csv_path))
+    with stage(stages, "bucket"):
+        sheet1 = m.build_sheet1(df)
+    with stage(stages, "clean"):
+        keys = m.build_pivot_keys(sheet1)
+    with stage(stages, "pivot"):
+        sheet2 = m.build_sheet2_pivot(sheet1, keys)
+    with stage(stages, "bucket_flags"):
+        sheet1 = m.with_bucket_flags(sheet1, m.BUCKETS)
+    if write:
+        timed_write(stages, m, lambda: m.write_excel(sheet1, sheet2, out_path))
+
+
+def run_final_regalo(m, csv_path, out_path, stages, write):
+    # one extract for both reports (what run_plan does), reports built one after the other
+    with stage(stages, "read"):
+        schema = merge_schemas([m.R1_SCHEMA, m.r2_schema()])
+        src = SharedSource(load_csv(csv_path, schema, engine=m.CSV_ENGINE, header=read_csv_header(csv_path)))
+    with stage(stages, "clean"):
+        # shared clean-ups, memoized on the source: the builders below reuse them
+        src.derived(m.R1_COL_DRUG, m.strip_text)
+        src.derived(m.R1_COL_REASON, m.strip_text)
+        src.derived(m.R1_COL_COUNT, m.to_count)
+        src.derived(m.R2_COL_STATUS, m.clean_text_col)
+        src.derived(m.R2_COL_REASON, m.clean_text_col)
+    with stage(stages, "bucket"):
+        r2_sheet1 = m.build_r2_sheet1(src.frame)
+    with stage(stages, "pivot"):
+        r1_source, r1_pivot = m.build_report_1(src)
+        r2_pivot = m.build_r2_sheet2_pivot(r2_sheet1, src)
+    with stage(stages, "bucket_flags"):
+        r2_sheet1 = m.with_bucket_flags(r2_sheet1, m.R2_BUCKETS)
+    if write:
+        sheets = {m.R1_SOURCE_SHEET: r1_source, m.R1_PIVOT_SHEET: r1_pivot,
+                  m.R2_SHEET1: r2_sheet1, m.R2_SHEET2: r2_pivot}
+        timed_write(stages, m, lambda: m.write_all_sheets(out_path, sheets))
+
+
+RUNNERS = {
+    "1st_cumulative": run_1st_cumulative,
+    "All_pending": run_all_pending,
+    "final_regalo": run_final_regalo,
+}
+
+
+def measure(script, csv_path, out_path, n_rows, legacy_write):
+    """Runs in a fresh process, so the peak RSS belongs to this script and size only."""
+    m = load_script(script)
+    m.STREAMING_WRITE = not legacy_write
+    m.INPLACE_UPDATE = not legacy_write
+    write = n_rows < EXCEL_MAX_ROWS
+
+    stages = {}
+    start = time.perf_counter()
+    RUNNERS[script](m, Path(csv_path), Path(out_path), stages, write)
+    total = time.perf_counter() - start
+
+    print(json.dumps(dict(
+        script=script,
+        rows=n_rows,
+        write_mode="legacy" if legacy_write else "streaming",
+        stages=stages,
+        skipped=[] if write else ["excel_write", "format"],
+        total_s=round(total, 4),
+        peak_rss_mb=round(peak_rss_mb(), 1),
+    )))
+
+
+# ---------------- baseline comparison ----------------
+def result_key(r):
+    return r["script"], r["rows"], r["write_mode"]
+
+
+def compare(results, baseline):
+    """Per stage new/baseline time ratio; returns the regressions (stage slower than REGRESSION_RATIO)."""
+    old = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'script':<16} {'rows':>10} {'stage':<13} {'base s':>9} {'new s':>9} {'ratio':>7}")
+    for r in results:
+        b = old.get(result_key(r))
+        if b is None:
+            continue
+        for name, st in list(r["stages"].items()) + [("total", dict(s=r["total_s"]))]:
+            base_s = b["total_s"] if name == "total" else b["stages"].get(name, {}).get("s")
+            if base_s is None:
+                continue
+            ratio = st["s"] / base_s if base_s else float("inf")
+            flag = ""
+            if max(st["s"], base_s) >= MIN_COMPARE_S and ratio > REGRESSION_RATIO:
+                flag = "  <-- slower"
+                regressions.append((r["script"], r["rows"], name, ratio))
+            print(f"{r['script']:<16} {r['rows']:>10,} {name:<13} {base_s:>9.3f} {st['s']:>9.3f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        script, csv_path, out_path, n_rows, write_mode = sys.argv[2:7]
+        measure(script, csv_path, out_path, int(n_rows), write_mode == "legacy")
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the report scripts stage by stage.")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--scripts", nargs="+", default=SCRIPTS, choices=SCRIPTS)
+    parser.add_argument("--legacy-write", action="store_true", help="to_excel + openpyxl format pass")
+    parser.add_argument("--data-dir", help="keep generated extracts here (reused on the next run)")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(args.data_dir) if args.data_dir else Path(tmp)
+        data_dir.mkdir(parents=True, exist_ok=True)
+
+        for n_rows in args.rows:
+            csv_path = data_dir / f"synthetic_{n_rows}_seed{SEED}.csv"
+            if not csv_path.exists():
+                write_extract(csv_path, n_rows, seed=SEED)
+
+            for script in args.scripts:
+                out_path = Path(tmp) / f"{script}_{n_rows}.xlsx"
+                out_path.unlink(missing_ok=True)
+                out = subprocess.run(
+                    [sys.executable, __file__, "--measure", script, str(csv_path), str(out_path), str(n_rows),
+                     "legacy" if args.legacy_write else "streaming"],
+                    capture_output=True, text=True,
+                )
+                if out.returncode != 0:
+                    print(f"{script} {n_rows:,} rows failed:\n{out.stderr.strip()}")
+                    continue
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                results.append(r)
+                parts = "  ".join(f"{k}={v['s']:.2f}s" for k, v in r["stages"].items())
+                print(f"{script:<16} {n_rows:>10,} rows  total={r['total_s']:.2f}s  "
+                      f"peak={r['peak_rss_mb']:.0f} MB  {parts}")
+
+    report = dict(
+        meta=dict(
+            created=pd.Timestamp.now().isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            pandas=pd.__version__,
+            numpy=np.__version__,
+            openpyxl=openpyxl.__version__,
+            pyarrow=pyarrow_available(),
+            machine=platform.platform(),
+            seed=SEED,
+        ),
+        results=results,
+    )
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Results written to: {args.out}")
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()))
+        print(f"\n{len(regressions)} stage(s) slower than {REGRESSION_RATIO}x baseline")
+
+    print("✅ Done.")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+pandas vs DuckDB for final_regalo's two pivots (PIVOT_BACKEND), on synthetic extracts.
+
+    python bench_pivot_backend.py
+    python bench_pivot_backend.py --rows 1000000 --data-dir bench_data
+
+Per size, best of REPEAT:
+  csv -> pivots     pandas: read the extract + clean-ups + buckets + both pivots
+                    duckdb: the two grouped queries over the CSV (+ clean-ups on the groups)
+  frame -> pivots   pandas: clean-ups + buckets + both pivots on an already parsed extract
+                    duckdb: the same queries (they always read the CSV themselves)
+Both backends' tables are checked to be equal.
+
+"csv -> pivots" is the cost when nothing else needs the whole extract in pandas; "frame -> pivots"
+is final_regalo today, where the per-case sheets need the parsed extract anyway and only the pivot
+stages change. DuckDB's edge grows with rows and cores (it scans and groups in parallel); on small
+extracts or a single core the query set-up and second read of the file can make it slower.
+"""
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from csv_source import load_csv, read_csv_header
+from duckdb_pivots import duckdb_available
+from report_plan import SharedSource, merge_schemas
+from synthetic_extract import write_extract
+
+# ---------------- CONFIG ----------------
+ROW_COUNTS = [100_000, 1_000_000, 5_000_000]
+REPEAT = 3                       # best of
+SEED = 7
+# ----------------------------------------
+
+HERE = Path(__file__).resolve().parent
+
+
+def load_final_regalo():
+    spec = importlib.util.spec_from_file_location("bench_final_regalo", HERE / "final_regalo.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def best_time(fn, *args):
+    best, out = float("inf"), None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def read_source(m, csv_path):
+    schema = merge_schemas([m.R1_SCHEMA, m.r2_schema()])
+    return SharedSource(load_csv(csv_path, schema, engine=m.CSV_ENGINE, header=read_csv_header(csv_path)),
+                        path=csv_path)
+
+
+def pandas_pivots(m, src, today):
+    # a fresh source each time: the memoized clean-ups are part of the cost
+    src = SharedSource(src.frame, path=src.path)
+    _, r1_pivot = m.build_report_1(src)
+    r2_pivot = m.build_r2_sheet2_pivot(m.build_r2_sheet1(src.frame, today), src)
+    return r1_pivot, r2_pivot
+
+
+def pandas_from_csv(m, csv_path, today):
+    return pandas_pivots(m, read_source(m, csv_path), today)
+
+
+def duckdb_pivots(m, csv_path, today):
+    return m.build_r1_pivot_duckdb(csv_path), m.build_r2_pivot_duckdb(csv_path, today)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pandas vs DuckDB pivot backend.")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--data-dir", help="keep generated extracts here (reused on the next run)")
+    args = parser.parse_args()
+
+    if not duckdb_available():
+        raise ImportError("bench_pivot_backend.py needs duckdb (pip install duckdb)")
+
+    m = load_final_regalo()
+    m.PIVOT_BACKEND = "pandas"          # build_report_1 below is the pandas pivot
+    today = pd.Timestamp.today().normalize()
+
+    print(f"CPUs: {os.cpu_count()}")
+    print(f"{'rows':>10}  {'csv->pivots pandas s':>20}  {'duckdb s':>8}  {'x':>5}  "
+          f"{'frame->pivots pandas s':>22}  {'duckdb s':>8}  {'x':>5}")
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(args.data_dir) if args.data_dir else Path(tmp)
+        data_dir.mkdir(parents=True, exist_ok=True)
+
+        for n_rows in args.rows:
+            csv_path = data_dir / f"synthetic_{n_rows}_seed{SEED}.csv"
+            if not csv_path.exists():
+                write_extract(csv_path, n_rows, seed=SEED)
+
+            want, t_pandas_csv = best_time(pandas_from_csv, m, csv_path, today)
+            got, t_duckdb = best_time(duckdb_pivots, m, csv_path, today)
+            for a, b in zip(want, got):
+                pd.testing.assert_frame_equal(a, b)
+
+            src = read_source(m, csv_path)
+            _, t_pandas_frame = best_time(pandas_pivots, m, src, today)
+            del src
+
+            print(f"{n_rows:>10,}  {t_pandas_csv:>20.3f}  {t_duckdb:>8.3f}  {t_pandas_csv / t_duckdb:>5.2f}  "
+                  f"{t_pandas_frame:>22.3f}  {t_duckdb:>8.3f}  {t_pandas_frame / t_duckdb:>5.2f}")
+
+    print("✅ Done. DuckDB pivots match the pandas backend.")
+
+
+if __name__ == "__main__":
+    main()
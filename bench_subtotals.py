@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from pivot_subtotals import build_subtotal_pivot
+
+# ---------------- CONFIG ----------------
+ROW_COUNTS = [10_000, 100_000, 1_000_000, 5_000_000]
+N_DRUGS = 400
+N_REASONS = 60
+LEGACY_MAX_ROWS = 1_000_000      # old per-drug loop gets too slow above this
+SEED = 42
+
+COL_DRUG = "drug"
+COL_REASON = "case_sub_status_reason_code"
+COL_COUNT = "case_count"
+# ----------------------------------------
+
+
+def make_frame(n_rows, rng):
+    drugs = np.array([f"Drug {i:03d}" for i in range(N_DRUGS)], dtype=object)
+    reasons = np.array([f"Reason {i:02d}" for i in range(N_REASONS)], dtype=object)
+    # skewed like the real extracts: a few drugs/reasons dominate
+    drug_p = 1.0 / np.arange(1, N_DRUGS + 1)
+    reason_p = 1.0 / np.arange(1, N_REASONS + 1)
+    return pd.DataFrame({
+        COL_DRUG: rng.choice(drugs, n_rows, p=drug_p / drug_p.sum()),
+        COL_REASON: rng.choice(reasons, n_rows, p=reason_p / reason_p.sum()),
+        COL_COUNT: rng.integers(0, 5, n_rows).astype(float),
+    })
+
+
+def legacy_excel_like_pivot(df: pd.DataFrame) -> pd.DataFrame:
+    """The old iterrows builder (final_regalo.py before the shared engine), kept for comparison."""
+    detail = (
+        df.groupby([COL_DRUG, COL_REASON], as_index=False)[COL_COUNT]
+        .sum()
+        .sort_values([COL_DRUG, COL_REASON], ascending=[True, True])
+    )
+    totals = (
+        df.groupby(COL_DRUG, as_index=False)[COL_COUNT]
+        .sum()
+        .sort_values(COL_DRUG, ascending=True)
+    )
+
+    rows = []
+    for _, t in totals.iterrows():
+        drug = t[COL_DRUG]
+        rows.append([drug, "", int(t[COL_COUNT])])
+        sub = detail[detail[COL_DRUG] == drug]
+        for _, r in sub.iterrows():
+            rows.append(["", "  " + str(r[COL_REASON]), int(r[COL_COUNT])])
+        rows.append(["", "", ""])
+
+    rows.append(["Grand Total", "", int(df[COL_COUNT].sum())])
+    return pd.DataFrame(rows, columns=[COL_DRUG, COL_REASON, COL_COUNT])
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+
+    print(f"{'rows':>10}  {'legacy s':>9}  {'engine s':>9}  {'engine ns/row':>13}")
+    for n_rows in ROW_COUNTS:
+        df = make_frame(n_rows, rng)
+
+        new, t_new = timed(build_subtotal_pivot, df, [COL_DRUG, COL_REASON], COL_COUNT, order="key")
+
+        t_old = float("nan")
+        if n_rows <= LEGACY_MAX_ROWS:
+            old, t_old = timed(legacy_excel_like_pivot, df)
+            pd.testing.assert_frame_equal(old, new)
+
+        print(f"{n_rows:>10,}  {t_old:>9.3f}  {t_new:>9.3f}  {t_new / n_rows * 1e9:>13.1f}")
+
+    print("✅ Done. Engine output matches legacy builder where both ran.")
+
+
+if __name__ == "__main__":
+    main()
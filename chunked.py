@@ -0,0 +1,157 @@
+"""
+Chunked (out-of-core) mode: extracts are read in blocks of chunk_rows rows, so peak memory
+follows the block size, not the file size.
+
+A chunked plan is a list of report specs, like report_plan's but with the build split in two:
+
+    dict(
+        name="Report2",                       # used in error messages
+        source=Path("extract.csv"),           # reports with the same file share each read
+        schema=R2_SCHEMA,                     # csv_source schema
+        chunk=fn(block) -> (rows, partial),   # rows: {sheet: frame}, this block's per-case rows
+                                              # partial: group columns + columns to sum
+        keys=[...],                           # group columns of partial
+        finish=fn(totals) -> {sheet: frame},  # pivot sheets from the merged partials
+        sheets=[SHEET_A, SHEET_B],            # workbook order of all the report's sheets
+    )
+
+Two passes over each file:
+  1. every block through chunk(): partials summed group by group (associative, so block size
+     and order don't change the totals); column widths / alignment kinds of the row sheets
+  2. every block through chunk() again, its rows streamed straight into a write-only workbook
+     (openpyxl needs the widths before the first row goes out, hence the first pass)
+
+An existing output keeps its other sheets: the new sheets are swapped into it (xlsx_parts).
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook
+
+from csv_source import iter_csv_chunks, read_csv_header
+from excel_output import ShardedSheet, column_kinds, column_widths, merge_kinds, merge_widths, stream_sheet
+from incremental import ROWS_COL
+from report_plan import merge_schemas
+from stage_log import stage
+from xlsx_parts import swap_sheets
+
+CHUNK_ROWS = 250_000
+
+
+# ------------------ Partial aggregates ------------------
+def count_rows(df: pd.DataFrame, keys, name=ROWS_COL) -> pd.DataFrame:
+    """Partial for count pivots: rows per group (missing keys stay a group of their own)."""
+    return df.groupby(keys, dropna=False, sort=False, observed=True).size().rename(name).reset_index()
+
+
+def sum_rows(df: pd.DataFrame, keys, value_col) -> pd.DataFrame:
+    """Partial for sum pivots: value_col summed per group."""
+    return df.groupby(keys, dropna=False, sort=False, observed=True)[value_col].sum().reset_index()
+
+
+def merge_partials(total, partial: pd.DataFrame, keys) -> pd.DataFrame:
+    """Add partial into the running total, group by group (total None = first block)."""
+    both = partial if total is None else pd.concat([total, partial], ignore_index=True)
+    return both.groupby(keys, dropna=False, sort=False, observed=True).sum().reset_index()
+
+
+# ------------------ Runner ------------------
+def _blocks(path, reports, headers, chunk_rows):
+    schema = merge_schemas(r["schema"] for r in reports)
+    return iter_csv_chunks(path, schema, chunk_rows, header=headers[path])
+
+
+def run_chunked(out_path, plan, chunk_rows=CHUNK_ROWS, total_sheets=None, max_col=None, max_width=60,
+                **sheet_kwargs) -> dict:
+    """
+    Run a chunked plan and write its workbook (sheets in plan order) to out_path.
+    Returns {sheet_name: rows written}.
+
+    total_sheets: {sheet_name: label} for sheets that get a bold total row
+    max_col / max_width: auto-fit settings (as stream_sheet); sheet_kwargs go to every sheet
+    """
+    out_path = Path(out_path)
+    total_sheets = total_sheets or {}
+
+    by_source = {}
+    for report in plan:
+        by_source.setdefault(Path(report["source"]).resolve(), []).append(report)
+
+    # validate every report against its file's header before reading anything
+    headers = {}
+    for path, reports in by_source.items():
+        if not path.exists():
+            raise FileNotFoundError(f"CSV not found: {path}")
+        headers[path] = read_csv_header(path)
+        for report in reports:
+            missing = set(report["schema"]["required"]) - set(headers[path])
+            if missing:
+                raise ValueError(f"[{report['name']}] Missing columns: {missing}. Found: {headers[path]}")
+
+    # ---- pass 1: partial aggregates + column stats of the row sheets ----
+    totals = {}
+    stats = {}          # row sheet -> dict(columns, widths, kinds, rows)
+    source_rows = 0
+    with stage("chunk_scan") as st:
+        for path, reports in by_source.items():
+            for block in _blocks(path, reports, headers, chunk_rows):
+                source_rows += len(block)
+                for report in reports:
+                    rows, partial = report["chunk"](block)
+                    totals[report["name"]] = merge_partials(totals.get(report["name"]), partial, report["keys"])
+
+                    for name, frame in rows.items():
+                        widths = column_widths(frame, max_width=max_width, max_col=max_col)
+                        kinds = column_kinds(frame)
+                        seen = stats.setdefault(name, dict(columns=frame.columns, widths=widths, kinds=kinds, rows=0))
+                        seen["widths"] = merge_widths(seen["widths"], widths)
+                        seen["kinds"] = merge_kinds(seen["kinds"], kinds)
+                        seen["rows"] += len(frame)
+        st["rows_out"] = source_rows
+
+    with stage("pivot", rows_in=source_rows) as st:
+        finished = {}
+        for report in plan:
+            finished.update(report["finish"](totals[report["name"]]))
+        st["rows_out"] = sum(len(df) for df in finished.values())
+
+    # ---- pass 2: stream the row sheets block by block ----
+    tmp_path = out_path.with_name(out_path.stem + ".tmp" + out_path.suffix)
+    written = {}
+    with stage("excel_write", rows_in=source_rows) as st:
+        wb = Workbook(write_only=True)
+        streams = {}
+        for report in plan:
+            for name in report["sheets"]:
+                label = total_sheets.get(name)
+                if name in finished:
+                    stream_sheet(wb, name, finished[name], max_col=max_col, max_width=max_width,
+                                 total_label=label, **sheet_kwargs)
+                    written[name] = len(finished[name])
+                else:
+                    seen = stats[name]
+                    # over Excel's row limit -> numbered sheets (row count known from pass 1)
+                    streams[name] = ShardedSheet(wb, name, seen["columns"], seen["widths"], seen["kinds"],
+                                                 seen["rows"], total_label=label, **sheet_kwargs)
+                    written[name] = 0
+
+        for path, reports in by_source.items():
+            for block in _blocks(path, reports, headers, chunk_rows):
+                for report in reports:
+                    rows, _ = report["chunk"](block)
+                    for name, frame in rows.items():
+                        streams[name].append(frame)
+                        written[name] += len(frame)
+
+        wb.save(tmp_path)
+        if out_path.exists():
+            # other sheets of the file kept: only these sheets' parts swapped in
+            try:
+                swap_sheets(out_path, tmp_path, shards_of=list(written))
+            finally:
+                tmp_path.unlink()
+        else:
+            os.replace(tmp_path, out_path)
+        st["rows_out"] = sum(written.values())
+    return written
@@ -0,0 +1,177 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import frame_cache
+from date_parse import parse_date_columns
+from stage_log import stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:          # optional: falls back to the pandas C parser
+    pa = None
+    pa_csv = None
+
+# Rows read with the pandas parser to learn passthrough column types for pyarrow
+SNIFF_ROWS = 10_000
+
+# Same strings pandas read_csv treats as NaN by default
+PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def pyarrow_available() -> bool:
+    return pa_csv is not None
+
+
+def read_csv_header(csv_path) -> list:
+    """Column names from the first line only (same names read_csv would give)."""
+    return pd.read_csv(csv_path, nrows=0).columns.tolist()
+
+
+def schema_columns(schema: dict, header: list):
+    """Columns to read: everything (passthrough) or only the ones the report uses."""
+    if schema.get("passthrough", True):
+        return None
+    wanted = set(schema.get("required", [])) | set(schema.get("dates", [])) | set(schema.get("categories", []))
+    return [c for c in header if c in wanted]
+
+
+def _missing_as_nan(df: pd.DataFrame) -> pd.DataFrame:
+    # Arrow gives None for missing values in object columns; read_csv gives NaN
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col].to_numpy(dtype=object, copy=True)
+            missing = pd.isna(values)
+            if missing.any():
+                values[missing] = np.nan
+                df[col] = values
+    return df
+
+
+def _finish(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    # pyarrow dictionaries keep first-seen order; match the C parser's sorted categories
+    for col in schema.get("categories", []):
+        if col in df.columns and not df[col].cat.categories.is_monotonic_increasing:
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+
+    # same coercion build_sheet1 applies (unparseable -> NaT), once per distinct text
+    dates = [col for col in schema.get("dates", []) if col in df.columns]
+    if dates:
+        with stage("to_datetime", rows_in=len(df)) as st:
+            st["dates"] = parse_date_columns(df, dates, fallback=schema.get("date_fallback", False))
+    return df
+
+
+def _read_c(csv_path, schema, usecols, categories):
+    return pd.read_csv(csv_path, usecols=usecols, dtype={c: "category" for c in categories})
+
+
+def _arrow_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return pa.bool_()
+    if pd.api.types.is_integer_dtype(dtype):
+        return pa.int64()
+    if pd.api.types.is_float_dtype(dtype):
+        return pa.float64()
+    return pa.string()
+
+
+def _read_pyarrow(csv_path, schema, usecols, categories):
+    """
+    pyarrow.csv with every column type pinned from a pandas sample, so pyarrow's own
+    inference (e.g. ISO text -> timestamps) can't change what the source sheets show.
+    """
+    sample = pd.read_csv(csv_path, nrows=SNIFF_ROWS, usecols=usecols)
+    column_types = {}
+    for col, dtype in sample.dtypes.items():
+        if col in categories:
+            column_types[col] = pa.dictionary(pa.int32(), pa.string())
+        elif col in schema.get("dates", []):
+            column_types[col] = pa.string()
+        elif dtype == object and pd.api.types.infer_dtype(sample[col], skipna=True) == "boolean":
+            column_types[col] = pa.bool_()             # True/False with blanks: read_csv keeps bools
+        else:
+            column_types[col] = _arrow_type(dtype)
+
+    table = pa_csv.read_csv(
+        csv_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            include_columns=list(sample.columns),
+            null_values=PANDAS_NA_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ),
+    )
+    return _missing_as_nan(table.to_pandas())
+
+
+def load_csv(csv_path, schema: dict, engine="auto", header=None, cache_dir=None, cache_bypass=False) -> pd.DataFrame:
+    """
+    Typed CSV read for one report.
+
+    schema keys:
+      required     columns the report needs (checked by the caller against read_csv_header)
+      dates        parsed like to_datetime(errors="coerce") (date_parse.parse_dates)
+      date_fallback  True -> date values in other formats than the first value's are kept too
+      categories   read as category (drug / status / reason: few distinct values)
+      passthrough  True (default) -> keep every column for the source sheet;
+                   False -> usecols = only the columns above
+    engine: "auto" (pyarrow when installed), "pyarrow" or "c"
+    cache_dir: reuse the typed frame from an earlier read of the same bytes (frame_cache, needs pyarrow);
+    cache_bypass: parse the CSV anyway and refresh the cache entry
+    """
+    csv_path = Path(csv_path)
+
+    cache_key = None
+    if cache_dir is not None and frame_cache.cache_available():
+        cache_key = frame_cache.cache_key(csv_path, dict(schema=schema))
+        if not cache_bypass:
+            df = frame_cache.get(cache_dir, cache_key)
+            if df is not None:
+                return _missing_as_nan(df)
+
+    header = header if header is not None else read_csv_header(csv_path)
+    usecols = schema_columns(schema, header)
+    categories = [c for c in schema.get("categories", []) if c in header]
+
+    if engine == "auto":
+        engine = "pyarrow" if pyarrow_available() else "c"
+    elif engine == "pyarrow" and not pyarrow_available():
+        raise ImportError("CSV engine 'pyarrow' requested but pyarrow is not installed")
+
+    if engine == "pyarrow":
+        try:
+            df = _read_pyarrow(csv_path, schema, usecols, categories)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # sample types didn't hold for the whole file (e.g. ints turning into text later)
+            df = _read_c(csv_path, schema, usecols, categories)
+    else:
+        df = _read_c(csv_path, schema, usecols, categories)
+
+    df = _finish(df, schema)
+    if cache_key is not None:
+        frame_cache.put(cache_dir, cache_key, df)
+    return df
+
+
+def iter_csv_chunks(csv_path, schema: dict, chunk_rows, header=None):
+    """
+    load_csv in blocks of chunk_rows rows (pandas C parser), for extracts too big to hold at once.
+    Each block is typed the same way (categories of its own, dates parsed); no cache.
+    A header-only file still gives one (empty) block.
+    """
+    header = header if header is not None else read_csv_header(csv_path)
+    usecols = schema_columns(schema, header)
+    categories = [c for c in schema.get("categories", []) if c in header]
+
+    reader = pd.read_csv(csv_path, usecols=usecols, dtype={c: "category" for c in categories},
+                         chunksize=chunk_rows)
+    with reader:
+        for block in reader:
+            yield _finish(block, schema)
@@ -0,0 +1,105 @@
+"""
+Date columns parsed once per distinct text.
+
+parse_dates(s) gives the same values as pd.to_datetime(s, errors="coerce"): the distinct values
+are converted in first-seen order (so pandas guesses the format from the same first value) and
+mapped back to the rows with one take. Receipt timestamps repeat heavily, and when no format can
+be guessed pandas parses value by value (dateutil), so it pays to do that once per distinct text.
+
+Values that don't match the guessed format come out NaT, as before; they are counted (stats, which
+the callers put in the run log), and the formats guessed for them are tried in turn, most common first. Only with fallback=True
+are those extra dates kept (that changes which rows get an age, so it is opt-in).
+"""
+import warnings
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+SNIFF_VALUES = 1_000             # unparsed distinct values looked at for other formats
+MISSING_TEXT = {"", "nat", "nan", "none", "null", "<na>"}     # NaT by design: not counted as failed
+
+
+def _first_text(values):
+    # the value pandas guesses the format from: first non-blank text
+    for value in values:
+        if isinstance(value, str) and value.strip().lower() not in MISSING_TEXT:
+            return value
+    return None
+
+
+def sniff_formats(values, limit=SNIFF_VALUES) -> list:
+    """Formats guessed for up to `limit` values, most common first (tz-aware formats left out)."""
+    counts = Counter()
+    for value in values[:limit]:
+        fmt = guess_datetime_format(value) if isinstance(value, str) else None
+        if fmt and "%z" not in fmt and "%Z" not in fmt:
+            counts[fmt] += 1
+    return [fmt for fmt, _ in counts.most_common()]
+
+
+def _to_datetime(values) -> pd.Series:
+    with warnings.catch_warnings():
+        # "Could not infer format": pandas parses value by value, here once per distinct value
+        warnings.simplefilter("ignore", UserWarning)
+        return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
+
+
+def parse_dates(values, fallback=False, stats=None) -> pd.Series:
+    """
+    pd.to_datetime(values, errors="coerce"), converted once per distinct value.
+
+    fallback: also keep dates from the other formats found among the unparsed values
+    stats: dict filled with format (guessed from the first value), unique (distinct values),
+           failed (non-blank rows left NaT), recoverable (rows another format would parse)
+    """
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    stats = stats if stats is not None else {}
+    stats.update(format=None, unique=None, failed=0, recoverable=0, fallback_formats=[])
+
+    is_text = isinstance(s.dtype, pd.CategoricalDtype) or (
+        s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"))
+    if not is_text:
+        # datetimes pass through; numbers / mixed Python types keep pandas' own handling
+        return pd.to_datetime(s, errors="coerce")
+
+    codes, uniques = pd.factorize(s)                   # first-seen order, missing -> -1
+    uniques = np.asarray(uniques, dtype=object)
+    parsed = _to_datetime(uniques)
+    first = _first_text(uniques)
+    stats.update(format=guess_datetime_format(first) if first else None, unique=len(uniques))
+
+    blank = pd.Series(uniques, dtype=object).astype(str).str.strip().str.lower().isin(MISSING_TEXT).to_numpy()
+    bad = parsed.isna().to_numpy() & ~blank
+    if bad.any():
+        rows = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        extra = pd.Series(pd.NaT, index=np.flatnonzero(bad), dtype="datetime64[ns]")
+        if parsed.dtype == "datetime64[ns]":       # naive dates only: other formats can't mix with tz-aware
+            unparsed = uniques[bad]
+            for fmt in sniff_formats(unparsed):
+                todo = extra.isna().to_numpy()
+                if not todo.any():
+                    break
+                more = pd.to_datetime(pd.Series(unparsed[todo], dtype=object), format=fmt, errors="coerce")
+                if more.notna().any():
+                    stats["fallback_formats"].append(fmt)
+                    extra[todo] = more.to_numpy()
+        found = extra.notna()
+        stats["recoverable"] = int(rows[extra.index[found]].sum())
+        if fallback and found.any():
+            parsed[extra.index[found]] = extra[found]
+            bad[extra.index[found]] = False
+        stats["failed"] = int(rows[bad].sum())
+
+    dates = pd.Index(parsed).take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(dates, index=s.index, name=s.name)
+
+
+def parse_date_columns(df: pd.DataFrame, columns, fallback=False) -> dict:
+    """parse_dates for each column, in place. Returns stats per column (failed = values left blank)."""
+    stats = {}
+    for col in columns:
+        stats[col] = {}
+        df[col] = parse_dates(df.get(col), fallback=fallback, stats=stats[col])
+    return stats
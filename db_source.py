@@ -0,0 +1,293 @@
+"""
+Database source for the pivots: the Summary sums and aging counts are computed in the database
+(GROUP BY with the date COALESCE and CASE buckets in SQL) and only the grouped rows come back,
+through a server-side cursor. Case-level rows (the per-case sheets) are exported with
+COPY ... TO STDOUT into a CSV only when a report needs them, then read like any extract.
+
+    db = DbSource("postgresql://user@host/dbname")        # psycopg2, or psycopg 3
+    db = DbSource("sqlite:///stand_in.db")                 # local stand-in (stdlib sqlite3)
+
+`source` arguments are what goes after FROM: a table / view name, or "(SELECT ...) AS src".
+
+The SQL text clean-up only merges spellings the Python rules would merge anyway (trim, and for
+folded columns also lower case + single spaces); the callers run the usual clean-ups on the
+grouped rows, so the tables match the CSV path. Values are read the way the CSV path reads them:
+on Postgres, text columns are cast only where the text looks like a number / date (anything else
+counts as missing: 0 in sums, NaT for dates) - a date-shaped value that is no real day, e.g.
+2025-02-30, still stops the query. Typed columns are cast as they are; the SQLite stand-in keeps
+everything as text (its casts never fail).
+
+Stand-in from an extract:  python db_source.py extract.csv stand_in.db table_name
+"""
+import csv
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psycopg2
+except ImportError:          # optional: psycopg 3, or the SQLite stand-in only
+    psycopg2 = None
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+FETCH_ROWS = 50_000              # grouped rows per round trip (server-side cursor)
+SQLITE_PREFIX = "sqlite:///"
+
+# text values the Postgres casts are tried on (others -> NULL, like to_numeric / to_datetime coerce)
+NUMBER_PATTERN = r"^[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?$"
+DATE_PATTERN = (r"^[0-9]{1,4}[-/.][0-9]{1,2}[-/.][0-9]{1,4}"
+                r"([ T][0-9]{1,2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?( ?[AaPp][Mm])?)?$")
+TEXT_OIDS = {25, 1042, 1043}     # Postgres text, char(n), varchar(n)
+
+
+def _checked_cast(pattern, sql_type) -> str:
+    # template for text columns: trimmed, cast only when it matches (braces of the pattern escaped for format)
+    pattern = pattern.replace("{", "{{").replace("}", "}}")
+    return f"CASE WHEN BTRIM({{0}}) ~ '{pattern}' THEN CAST(BTRIM({{0}}) AS {sql_type}) END"
+
+
+# per dialect: parameter marker and the SQL for trim / fold / number / timestamp / whole days
+# (number_text / timestamp_text: the same casts for text columns, see the module docstring)
+DIALECTS = {
+    "postgres": dict(
+        param="%s",
+        trim="BTRIM({})",
+        fold=r"LOWER(REGEXP_REPLACE(BTRIM({}), '\s+', ' ', 'g'))",
+        number="CAST({} AS double precision)",
+        timestamp="CAST({} AS timestamp)",
+        number_text=_checked_cast(NUMBER_PATTERN, "double precision"),
+        timestamp_text=_checked_cast(DATE_PATTERN, "timestamp"),
+        # whole days from ts to today, rounded down like pandas .dt.days
+        days="CAST(FLOOR(EXTRACT(EPOCH FROM (CAST({today} AS timestamp) - {ts})) / 86400) AS integer)",
+    ),
+    "sqlite": dict(
+        param="?",
+        trim="TRIM({}, ' ')",
+        fold="pivot_fold({})",
+        number="CAST({} AS REAL)",
+        timestamp="julianday({})",
+        # in whole milliseconds first (julianday is a float); rounded toward 0, fine once clipped at 0
+        days="CAST(ROUND((julianday({today}) - {ts}) * 86400000) AS INTEGER) / 86400000",
+    ),
+}
+
+
+def _fold(text):
+    # lower case + single spaces (SQLite has no REGEXP_REPLACE)
+    return None if text is None else " ".join(str(text).split()).lower()
+
+
+def _ident(name) -> str:
+    return ".".join('"' + part.replace('"', '""') + '"' for part in str(name).split("."))
+
+
+def _source(source) -> str:
+    source = str(source).strip()
+    return source if source.startswith("(") else _ident(source)
+
+
+def bucket_case(days_sql, buckets) -> str:
+    """
+    SQL for aging.bucket_index: position of the bucket holding days_sql, -1 for none / NULL.
+    Same rules: (name, lo, hi) -> lo <= days < hi, (name, lo, None) -> days > lo, and the
+    last bucket whose lower edge is <= days decides.
+    """
+    whens = []
+    for i, (_, lo, hi) in reversed(list(enumerate(buckets))):
+        inside = f"{days_sql} > {lo}" if hi is None else f"{days_sql} < {hi}"
+        whens.append(f"WHEN {days_sql} >= {lo} THEN CASE WHEN {inside} THEN {i} ELSE -1 END")
+    return f"CASE WHEN {days_sql} IS NULL THEN -1 {' '.join(whens)} ELSE -1 END"
+
+
+class DbSource:
+    """Connection + SQL dialect for one database (see the module docstring for DSNs)."""
+
+    def __init__(self, dsn, fetch_rows=FETCH_ROWS, readonly=True):
+        self.dsn = str(dsn)
+        self.fetch_rows = fetch_rows
+        if self.dsn.startswith(SQLITE_PREFIX):
+            self.dialect = "sqlite"
+            self.conn = sqlite3.connect(self.dsn[len(SQLITE_PREFIX):], check_same_thread=False)
+            self.conn.create_function("pivot_fold", 1, _fold, deterministic=True)
+        elif psycopg2 is not None:
+            # readonly: one read-only snapshot for every query, so pivots and case rows agree
+            self.dialect = "postgres"
+            self.conn = psycopg2.connect(self.dsn)
+            if readonly:
+                self.conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        elif psycopg is not None:
+            self.dialect = "postgres"
+            self.conn = psycopg.connect(self.dsn)
+            if readonly:
+                self.conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+                self.conn.read_only = True
+        else:
+            raise ImportError("Postgres sources need psycopg2 or psycopg (pip install psycopg2-binary)")
+        self.sql = DIALECTS[self.dialect]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _psycopg2(self) -> bool:
+        return psycopg2 is not None and isinstance(self.conn, psycopg2.extensions.connection)
+
+    # ---- queries ----
+    def execute(self, sql, params=()) -> int:
+        """Run one statement (no result rows); returns the row count it reports."""
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.rowcount
+        finally:
+            cur.close()
+
+    def _cursor(self):
+        if self.dialect == "postgres":
+            # named cursor = server-side: rows come over in fetch_rows batches, not all at once
+            cur = self.conn.cursor(name="pivot_groups")
+            cur.itersize = self.fetch_rows
+            return cur
+        return self.conn.cursor()
+
+    def query(self, sql, params=(), columns=None) -> pd.DataFrame:
+        """Run sql and collect its rows batch by batch (missing text -> NaN, like read_csv)."""
+        cur = self._cursor()
+        try:
+            cur.execute(sql, params)
+            batches = []
+            while True:
+                rows = cur.fetchmany(self.fetch_rows)
+                if not rows:
+                    break
+                batches.append(rows)
+            columns = columns or [d[0] for d in cur.description]
+        finally:
+            cur.close()
+        df = pd.DataFrame.from_records([row for batch in batches for row in batch], columns=columns)
+        return df.where(df.notna(), np.nan)
+
+    def text_columns(self, source) -> set:
+        """Postgres: the columns of source stored as text (no rows fetched); SQLite: none (casts never fail)."""
+        if self.dialect != "postgres":
+            return set()
+        cur = self.conn.cursor()
+        try:
+            cur.execute(f"SELECT * FROM {_source(source)} LIMIT 0")
+            return {d[0] for d in cur.description if d[1] in TEXT_OIDS}
+        finally:
+            cur.close()
+
+    def _cast_sql(self, kind, col, text_cols):
+        template = self.sql[f"{kind}_text"] if col in text_cols else self.sql[kind]
+        return template.format(_ident(col))
+
+    def _key_sql(self, col, trim, fold):
+        if col in fold:
+            return self.sql["fold"].format(_ident(col))
+        if col in trim:
+            return self.sql["trim"].format(_ident(col))
+        return _ident(col)
+
+    def grouped_sums(self, source, keys, value_col, trim=(), fold=()) -> pd.DataFrame:
+        """
+        Key columns + value_col summed per group (missing / non-numeric values count as 0).
+        trim: key columns trimmed in SQL; fold: trimmed, lower-cased, single-spaced.
+        """
+        keys_sql = [f"{self._key_sql(k, trim, fold)} AS {_ident(k)}" for k in keys]
+        value = f"COALESCE({self._cast_sql('number', value_col, self.text_columns(source))}, 0)"
+        positions = ", ".join(str(i + 1) for i in range(len(keys)))
+        sql = (f"SELECT {', '.join(keys_sql)}, SUM({value}) AS {_ident(value_col)} "
+               f"FROM {_source(source)} GROUP BY {positions}")
+        return self.query(sql, columns=list(keys) + [value_col])
+
+    def grouped_bucket_counts(self, source, keys, date_cols, today, buckets, index_col, rows_col,
+                              trim=(), fold=()) -> pd.DataFrame:
+        """
+        Key columns + index_col (bucket of the whole days until today from the first non-missing
+        date in date_cols, clipped at 0; -1 if none) + rows_col (rows per group).
+        """
+        text_cols = self.text_columns(source)
+        stamps = ", ".join(self._cast_sql("timestamp", c, text_cols) for c in date_cols)
+        days = self.sql["days"].format(today=self.sql["param"], ts=f"COALESCE({stamps})")
+        keys_sql = [f"{self._key_sql(k, trim, fold)} AS {_ident(k)}" for k in keys]
+        key_names = ", ".join(_ident(k) for k in keys)
+        positions = ", ".join(str(i + 1) for i in range(len(keys) + 1))
+        sql = (f"SELECT {key_names}, {bucket_case('days', buckets)} AS {_ident(index_col)}, "
+               f"COUNT(*) AS {_ident(rows_col)} "
+               f"FROM (SELECT {', '.join(keys_sql)}, CASE WHEN d < 0 THEN 0 ELSE d END AS days "
+               f"FROM (SELECT *, {days} AS d FROM {_source(source)}) AS aged) AS clipped "
+               f"GROUP BY {positions}")
+        today = pd.Timestamp(today).strftime("%Y-%m-%d %H:%M:%S")
+        counts = self.query(sql, (today,), columns=list(keys) + [index_col, rows_col])
+        counts[index_col] = counts[index_col].astype(np.int8)
+        return counts
+
+    # ---- COPY (case-level export, staging) ----
+    def copy_csv(self, source, csv_path) -> Path:
+        """Every row and column of source into csv_path (header + rows, missing -> empty)."""
+        csv_path = Path(csv_path)
+        select = f"SELECT * FROM {_source(source)}"
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            if self.dialect == "postgres":
+                copy_sql = f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+                with self.conn.cursor() as cur:
+                    if self._psycopg2():
+                        cur.copy_expert(copy_sql, f)
+                    else:
+                        with cur.copy(copy_sql) as copy:
+                            for data in copy:
+                                f.write(bytes(data).decode("utf-8"))
+            else:
+                cur = self.conn.execute(select)
+                writer = csv.writer(f)
+                writer.writerow([d[0] for d in cur.description])
+                while True:
+                    rows = cur.fetchmany(self.fetch_rows)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+        return csv_path
+
+    def copy_from(self, table, columns, csv_file):
+        """Postgres COPY ... FROM STDIN: csv_file (open text file, header row first) into table's columns."""
+        if self.dialect != "postgres":
+            raise ValueError("copy_from needs a Postgres connection")
+        copy_sql = f"COPY {_ident(table)} ({', '.join(_ident(c) for c in columns)}) FROM STDIN WITH (FORMAT csv, HEADER)"
+        with self.conn.cursor() as cur:
+            if self._psycopg2():
+                cur.copy_expert(copy_sql, csv_file)
+            else:
+                with cur.copy(copy_sql) as copy:
+                    while data := csv_file.read(1 << 20):
+                        copy.write(data)
+
+
+def load_sqlite(csv_path, db_path, table, chunk_rows=250_000):
+    """SQLite stand-in: the extract as an all-text table (read_csv's NA strings -> NULL), replaced if present."""
+    conn = sqlite3.connect(db_path)
+    try:
+        for i, block in enumerate(pd.read_csv(csv_path, dtype=str, chunksize=chunk_rows)):
+            block.to_sql(table, conn, if_exists="replace" if i == 0 else "append", index=False)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        raise SystemExit("usage: python db_source.py extract.csv stand_in.db table_name")
+    load_sqlite(sys.argv[1], sys.argv[2], sys.argv[3])
+    print(f"✅ Done. {sys.argv[1]} loaded into {sys.argv[2]} as table {sys.argv[3]}")
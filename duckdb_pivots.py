@@ -0,0 +1,126 @@
+"""
+Optional DuckDB backend for the pivot stages: read -> normalize -> bucket -> group as DuckDB
+queries over the CSV. Only the columns a pivot needs are parsed (projection pushdown), the
+grouping runs on all cores, and nothing but the grouped result is materialized in pandas.
+
+The queries group on the raw text, so what comes back is small (one row per distinct
+drug / status / reason [/ bucket]). The pandas clean-ups and pivot builders then run on
+those groups, so both backends share one set of text rules and give the same tables.
+
+Dates and counts are converted by pandas itself (pd.to_datetime / pd.to_numeric / bucket_index),
+once per distinct text, and joined back in the query: DuckDB's strptime and casts accept more
+than pandas does (2-digit %Y, "1_000", ...), so they'd change what gets counted.
+Needs duckdb; without it duckdb_available() is False.
+"""
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aging import bucket_index
+from csv_source import PANDAS_NA_VALUES
+from date_parse import parse_dates
+
+try:
+    import duckdb
+except ImportError:          # optional: pivots stay on pandas
+    duckdb = None
+
+# read_csv's default true / false spellings
+BOOL_TEXT = {"True": 1, "TRUE": 1, "true": 1, "False": 0, "FALSE": 0, "false": 0}
+
+
+def duckdb_available() -> bool:
+    return duckdb is not None
+
+
+def _ident(name) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(text) -> str:
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _load(con, csv_path, columns):
+    """Table src: the named columns of the CSV as text (file order), same NA strings and quoting as read_csv."""
+    nulls = ", ".join(_literal(v) for v in PANDAS_NA_VALUES)
+    cols = ", ".join(_ident(c) for c in dict.fromkeys(columns))
+    con.execute(f"CREATE TEMP TABLE src AS SELECT {cols} FROM read_csv({_literal(Path(csv_path))}, "
+                f"header = true, all_varchar = true, delim = ',', quote = '\"', escape = '\"', "
+                f"nullstr = [{nulls}])")
+
+
+def _frame(con, sql) -> pd.DataFrame:
+    df = con.execute(sql).df()
+    # DuckDB gives None for missing text; read_csv gives NaN
+    return df.where(df.notna(), np.nan)
+
+
+def _register_mapped(con, col, rule, name):
+    """
+    Table `name` (raw, value): every distinct text of src.col and rule(those texts as a Series).
+    The file's first value goes first, so rules that guess a format from it (to_datetime) guess
+    the same one as on the whole column.
+    """
+    c = _ident(col)
+    first = con.execute(f"SELECT {c} FROM src WHERE {c} IS NOT NULL LIMIT 1").fetchone()
+    values = con.execute(f"SELECT DISTINCT {c} AS raw FROM src WHERE {c} IS NOT NULL").df()["raw"]
+    if first is not None:
+        values = pd.concat([pd.Series([first[0]], dtype=object), values[values != first[0]]], ignore_index=True)
+    con.register(name, pd.DataFrame({"raw": values.to_numpy(dtype=object), "value": rule(values)}))
+
+
+def _to_number(values: pd.Series) -> pd.Series:
+    # read_csv turns a column of nothing but true/false into booleans, which count as 1 / 0
+    if values.isin(BOOL_TEXT).all():
+        return values.map(BOOL_TEXT)
+    return pd.to_numeric(values, errors="coerce")
+
+
+def grouped_sums(csv_path, keys, value_col) -> pd.DataFrame:
+    """
+    Raw key columns + value_col summed per group, the value read like
+    pd.to_numeric(errors="coerce").fillna(0). Missing keys stay groups of their own.
+    """
+    con = duckdb.connect()
+    try:
+        _load(con, csv_path, list(keys) + [value_col])
+        _register_mapped(con, value_col, _to_number, "numbers")
+        cols = ", ".join(f"src.{_ident(k)}" for k in keys)
+        return _frame(con, f"SELECT {cols}, SUM(COALESCE(numbers.value, 0)) AS {_ident(value_col)} "
+                           f"FROM src LEFT JOIN numbers ON src.{_ident(value_col)} = numbers.raw GROUP BY ALL")
+    finally:
+        con.close()
+
+
+def _bucket_of_date(today, buckets, fallback, values: pd.Series) -> pd.Series:
+    # bucket of the (clipped) age in days; unparseable dates stay missing so the next column is tried
+    days = (today - parse_dates(values, fallback=fallback)).dt.days.clip(lower=0)
+    return pd.Series(bucket_index(days, buckets), dtype=float).where(days.notna().to_numpy())
+
+
+def grouped_bucket_counts(csv_path, keys, date_cols, today, buckets, index_col, rows_col,
+                          date_fallback=False) -> pd.DataFrame:
+    """
+    Raw key columns + index_col (aging.bucket_index of the whole days until today from the first
+    parseable date in date_cols, clipped at 0; -1 if none) + rows_col (rows per group).
+    date_fallback: as date_parse.parse_dates(fallback=)
+    """
+    today = pd.Timestamp(today)
+    con = duckdb.connect()
+    try:
+        _load(con, csv_path, list(keys) + list(date_cols))
+        joins, chosen = [], []
+        for i, col in enumerate(date_cols):
+            _register_mapped(con, col, partial(_bucket_of_date, today, buckets, date_fallback), f"dates_{i}")
+            joins.append(f"LEFT JOIN dates_{i} ON src.{_ident(col)} = dates_{i}.raw")
+            chosen.append(f"dates_{i}.value")
+
+        cols = ", ".join(f"src.{_ident(k)}" for k in keys)
+        return _frame(con, f"SELECT {cols}, CAST(COALESCE({', '.join(chosen)}, -1) AS TINYINT) "
+                           f"AS {_ident(index_col)}, COUNT(*) AS {_ident(rows_col)} "
+                           f"FROM src {' '.join(joins)} GROUP BY ALL")
+    finally:
+        con.close()
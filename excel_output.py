@@ -0,0 +1,436 @@
+import datetime as dt
+from copy import copy
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.dimensions import RowDimension
+from openpyxl.worksheet.properties import Outline
+
+# pandas' own number formats for datetimes written with to_excel
+DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+DATE_FORMAT = "YYYY-MM-DD"
+
+# to_excel puts a thin border around header cells; format_sheet_basic keeps it
+_THIN = Side(style="thin")
+HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+
+STREAM_CHUNK_ROWS = 50_000
+EXCEL_MAX_ROWS = 1_048_576            # rows per sheet, header included
+SHEET_NAME_MAX = 31                   # characters in a sheet name
+
+
+# ------------------ Column statistics ------------------
+def _max_display_len(s: pd.Series) -> int:
+    """Longest str(value) Excel will show for this column (blank cells ignored)."""
+    s = s[s.notna()]
+    if s.empty:
+        return 0
+
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+        return int(s.astype(str).str.len().max())
+
+    if pd.api.types.is_float_dtype(s):
+        # whole floats come back from the xlsx as ints ("3", not "3.0")
+        whole = s == np.floor(s)
+        lens = s.astype(str).str.len()
+        if whole.any():
+            lens[whole] = s[whole].astype("int64").astype(str).str.len()
+        return int(lens.max())
+
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return len("2000-01-01 00:00:00")
+
+    text = s.astype(str)
+    return int(text.str.len().max())
+
+
+def column_widths(df: pd.DataFrame, max_width=60, max_col=None):
+    """Auto-fit widths (like autosize_columns) computed from the DataFrame instead of the cells."""
+    columns = list(df.columns)
+    if max_col is not None:
+        columns = columns[:max_col]
+
+    widths = {}
+    for col_idx, col in enumerate(columns, start=1):
+        max_len = max(len(str(col)), _max_display_len(df[col]))
+        widths[get_column_letter(col_idx)] = min(max_len + 3, max_width)
+    return widths
+
+
+def column_kinds(df: pd.DataFrame):
+    """
+    Per-column alignment kind, decided once from the dtype:
+    "number" (right), "text" (left), "date" (left + date format)
+    or "mixed" (numbers and text in one column -> decided per cell).
+    """
+    kinds = []
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            kinds.append("date")
+        elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            kinds.append("number")
+        else:
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                s = pd.Series(s.cat.remove_unused_categories().cat.categories)
+            values = s[s.notna() & (s.astype(str) != "")]
+            inferred = pd.api.types.infer_dtype(values, skipna=True)
+            if inferred in ("integer", "floating", "mixed-integer-float", "boolean"):
+                kinds.append("number")
+            elif inferred in ("datetime", "datetime64", "date"):
+                kinds.append("date")
+            elif inferred in ("string", "empty", "bytes"):
+                kinds.append("text")
+            else:
+                kinds.append("mixed")
+    return kinds
+
+
+def merge_widths(a: dict, b: dict) -> dict:
+    """Widths for two blocks of the same columns written as one sheet (widest wins)."""
+    return {letter: max(a.get(letter, 0), b.get(letter, 0)) for letter in {**a, **b}}
+
+
+def merge_kinds(a: list, b: list) -> list:
+    """Kinds for two blocks of the same columns: blocks that disagree -> "mixed" (decided per cell)."""
+    return [x if x == y else "mixed" for x, y in zip(a, b)]
+
+
+# ------------------ Sheets over Excel's row limit ------------------
+def shard_bounds(rows, max_rows=None) -> list:
+    """(start, stop) of the frame rows on each sheet: at most max_rows - 1 per sheet (the header is repeated)."""
+    per_sheet = (max_rows or EXCEL_MAX_ROWS) - 1
+    return [(start, min(start + per_sheet, rows)) for start in range(0, max(rows, 1), per_sheet)]
+
+
+def shard_name(sheet_name, n) -> str:
+    """Name of the n-th sheet of a split frame: the name itself, then "name (2)", "name (3)", ... (within 31 chars)."""
+    if n == 1:
+        return sheet_name
+    suffix = f" ({n})"
+    return sheet_name[:SHEET_NAME_MAX - len(suffix)].rstrip() + suffix
+
+
+def shard_frames(sheets: dict, max_rows=None) -> dict:
+    """{sheet: frame} with every frame over Excel's row limit split over numbered sheets (shard_name)."""
+    out = {}
+    for sheet_name, df in sheets.items():
+        for n, (start, stop) in enumerate(shard_bounds(len(df), max_rows), start=1):
+            out[shard_name(sheet_name, n)] = df if stop - start == len(df) else df.iloc[start:stop]
+    return out
+
+
+# ------------------ Formatting an already written sheet ------------------
+def apply_column_widths(ws, df: pd.DataFrame, max_width=60, max_col=None):
+    """Set auto-fit widths from the DataFrame (no pass over the worksheet cells)."""
+    for letter, width in column_widths(df, max_width=max_width, max_col=max_col).items():
+        ws.column_dimensions[letter].width = width
+
+
+def apply_column_alignment(ws, df: pd.DataFrame, vertical="center", left_cols=None, min_row=2):
+    """
+    Align the data cells with one style per column, decided from the dtype (column_kinds):
+    numbers right, text/dates left. Only "mixed" columns fall back to a per-cell check.
+
+    left_cols: None -> align by kind (empty cells left alone); otherwise 1-based columns aligned
+               left, rest right, empty cells of the sheet's rows included
+    """
+    for col_idx, kind in enumerate(column_kinds(df), start=1):
+        if left_cols is not None:
+            horizontal = "left" if col_idx in left_cols else "right"
+        elif kind == "number":
+            horizontal = "right"
+        elif kind in ("text", "date"):
+            horizontal = "left"
+        else:
+            horizontal = None
+
+        style = None
+        for (cell,) in ws.iter_rows(min_row=min_row, min_col=col_idx, max_col=col_idx):
+            if cell.value is None and left_cols is None:
+                continue
+            if horizontal is None:
+                side = "right" if isinstance(cell.value, (int, float)) else "left"
+                cell.alignment = Alignment(horizontal=side, vertical=vertical)
+            elif style is None:
+                cell.alignment = Alignment(horizontal=horizontal, vertical=vertical)
+                style = cell._style
+            else:
+                # own copy: later edits (e.g. bold Grand Total) must not leak to the whole column
+                cell._style = copy(style)
+
+
+def _blank_to_none(s: pd.Series) -> np.ndarray:
+    """Object array of the column with NaN / NA / NaT / "" turned into None (no cell written)."""
+    values = s.to_numpy(dtype=object, copy=True)
+    blank = s.isna().to_numpy()
+    if s.dtype == object or pd.api.types.is_string_dtype(s):
+        blank = blank | (s.astype(str).to_numpy() == "")
+    values[blank] = None
+    return values
+
+
+# ------------------ Streaming (write-only) writer ------------------
+class _SheetStyles:
+    """Shared style arrays so each cell only gets a reference, not a new style lookup."""
+
+    def __init__(self, ws, vertical):
+        self.ws = ws
+        self.vertical = vertical
+        self._cache = {}
+
+    def get(self, horizontal, bold=False, number_format=None, border=None):
+        key = (horizontal, bold, number_format, border is not None)
+        if key not in self._cache:
+            cell = WriteOnlyCell(self.ws)
+            if horizontal is not None:
+                cell.alignment = Alignment(horizontal=horizontal, vertical=self.vertical)
+            if bold:
+                cell.font = Font(bold=True)
+            if number_format is not None:
+                cell.number_format = number_format
+            if border is not None:
+                cell.border = border
+            self._cache[key] = cell._style
+        return self._cache[key]
+
+    def for_value(self, value, bold=False):
+        """Per-cell rule used by format_sheet_basic: numbers right, text left."""
+        if isinstance(value, (dt.datetime, dt.date)):
+            fmt = DATETIME_FORMAT if isinstance(value, dt.datetime) else DATE_FORMAT
+            return self.get("left", bold, fmt)
+        if isinstance(value, (int, float, np.number)):
+            return self.get("right", bold)
+        return self.get("left", bold)
+
+
+def _column_styles(styles: _SheetStyles, kinds, left_cols, bold=False):
+    """Style per column (None = decide per cell)."""
+    out = []
+    for col_idx, kind in enumerate(kinds, start=1):
+        if left_cols is not None:
+            horizontal = "left" if col_idx in left_cols else "right"
+            fmt = DATETIME_FORMAT if kind == "date" else None
+            out.append(styles.get(horizontal, bold, fmt))
+        elif kind == "number":
+            out.append(styles.get("right", bold))
+        elif kind == "text":
+            out.append(styles.get("left", bold))
+        elif kind == "date":
+            out.append(styles.get("left", bold, DATETIME_FORMAT))
+        else:
+            out.append(None)
+    return out
+
+
+def _cell(ws, value, style, styles, bold=False):
+    cell = WriteOnlyCell(ws, value=value)
+    if style is None:
+        style = styles.for_value(value, bold)
+    cell._style = style
+    return cell
+
+
+class StreamedSheet:
+    """
+    One write-only sheet whose rows can arrive in several blocks (e.g. CSV chunks).
+    Widths and kinds (column_widths / column_kinds of all the rows) must be known up front:
+    openpyxl writes the column widths before the first row.
+
+    outline_depth: deepest Excel outline level append() will get (row grouping, summary rows
+    above their detail); 0 = no outline.
+    """
+
+    def __init__(self, wb, sheet_name, columns, widths, kinds, freeze_cell="A2", vertical="center",
+                 left_cols=None, total_label=None, outline_depth=0):
+        ws = self.ws = wb.create_sheet(sheet_name)
+        styles = self.styles = _SheetStyles(ws, vertical)
+        self.total_label = total_label
+        self.next_row = 2
+
+        # widths, panes and outline settings must be set before the first row is streamed out
+        for letter, width in widths.items():
+            ws.column_dimensions[letter].width = width
+        if freeze_cell:
+            ws.freeze_panes = freeze_cell
+        if outline_depth:
+            ws.sheet_properties.outlinePr = Outline(summaryBelow=False)
+            ws.sheet_format.outlineLevelRow = outline_depth
+
+        header_style = styles.get("left", bold=True, border=HEADER_BORDER)
+        ws.append([_cell(ws, str(col), header_style, styles) for col in columns])
+
+        self.col_styles = _column_styles(styles, kinds, left_cols)
+        self.bold_styles = _column_styles(styles, kinds, left_cols, bold=True) if total_label is not None else None
+        self.bold_blank = styles.get(None, bold=True)
+        # aligned by position: empty cells get their column's style too (apply_column_alignment)
+        self.style_blanks = left_cols is not None
+
+    def register_cell_styles(self):
+        """Register now every per-cell style append() may pick ("mixed" columns), in a fixed order."""
+        for bold in (False, True):
+            for value in (dt.datetime(2000, 1, 1), dt.date(2000, 1, 1), 0, ""):
+                self.styles.for_value(value, bold)
+
+    def append(self, df: pd.DataFrame, levels=None, hide_from=None):
+        """
+        Stream the rows of df (same columns as the header) out to the sheet.
+        levels: outline level per row (needs outline_depth); rows at level >= hide_from start collapsed.
+        """
+        ws, styles, col_styles, total_label = self.ws, self.styles, self.col_styles, self.total_label
+        skip_blank = not self.style_blanks
+
+        for start in range(0, len(df), STREAM_CHUNK_ROWS):
+            block = df.iloc[start:start + STREAM_CHUNK_ROWS]
+            columns = [_blank_to_none(block[col]) for col in block.columns]
+            block_levels = None if levels is None else levels[start:start + STREAM_CHUNK_ROWS]
+
+            for i, row in enumerate(zip(*columns)):
+                row_no, self.next_row = self.next_row, self.next_row + 1
+                if block_levels is not None:
+                    # the writer reads a row's dimension as the row goes out: only one kept at a time
+                    ws.row_dimensions.clear()
+                    level = int(block_levels[i])
+                    collapsed = hide_from is not None and level == hide_from - 1   # summary row of hidden rows
+                    if level or collapsed:
+                        ws.row_dimensions[row_no] = RowDimension(
+                            ws, index=row_no, outlineLevel=level, collapsed=collapsed,
+                            hidden=hide_from is not None and level >= hide_from,
+                        )
+                if total_label is not None and row and row[0] == total_label:
+                    cells = []
+                    for j, v in enumerate(row):
+                        if j >= 3:
+                            cells.append(None if v is None and skip_blank else _cell(ws, v, col_styles[j], styles))
+                        elif v is None and skip_blank:
+                            cells.append(_cell(ws, None, self.bold_blank, styles))
+                        else:
+                            cells.append(_cell(ws, v, self.bold_styles[j], styles, bold=True))
+                    ws.append(cells)
+                    continue
+
+                ws.append([
+                    None if v is None and skip_blank else _cell(ws, v, col_styles[j], styles)
+                    for j, v in enumerate(row)
+                ])
+
+
+class ShardedSheet:
+    """
+    StreamedSheet for `rows` rows that may be over Excel's row limit: the numbered sheets
+    (shard_name) are all opened up front, append() fills them in turn.
+    """
+
+    def __init__(self, wb, sheet_name, columns, widths, kinds, rows, **sheet_kwargs):
+        self.sheets = [StreamedSheet(wb, shard_name(sheet_name, n), columns, widths, kinds, **sheet_kwargs)
+                       for n in range(1, len(shard_bounds(rows)) + 1)]
+        self.per_sheet = EXCEL_MAX_ROWS - 1
+        self.written = 0
+
+    def append(self, df: pd.DataFrame):
+        start = 0
+        while start < len(df):
+            n, used = divmod(self.written, self.per_sheet)
+            if n >= len(self.sheets):
+                raise ValueError(f"Sheet '{self.sheets[0].ws.title}': more rows than the {self.written:,} announced")
+            block = df.iloc[start:start + self.per_sheet - used]
+            self.sheets[n].append(block)
+            start += len(block)
+            self.written += len(block)
+
+
+def sheet_specs(sheets: dict, total_sheets=None, outlines=None, max_col=None, max_width=60) -> list:
+    """
+    The sheets write_sheets_streaming writes, in order: dict(name, source (key in sheets), start,
+    stop (its rows of the frame), columns, widths, kinds, total_label, outline_depth, hide_from).
+    A frame over Excel's row limit gets numbered sheets, each with the header; their widths and
+    alignment come from the whole frame, so they all look the same.
+    """
+    total_sheets = total_sheets or {}
+    outlines = outlines or {}
+    specs = []
+    for source, df in sheets.items():
+        levels, hide_from = outlines.get(source, (None, None))
+        common = dict(
+            source=source,
+            columns=list(df.columns),
+            widths=column_widths(df, max_width=max_width, max_col=max_col),
+            kinds=column_kinds(df),
+            total_label=total_sheets.get(source),
+            hide_from=hide_from,
+        )
+        for n, (start, stop) in enumerate(shard_bounds(len(df)), start=1):
+            part = None if levels is None else levels[start:stop]
+            specs.append(dict(common, name=shard_name(source, n), start=start, stop=stop,
+                              outline_depth=0 if part is None or not len(part) else int(np.max(part))))
+    return specs
+
+
+def open_sheet(wb, spec: dict, **sheet_kwargs) -> StreamedSheet:
+    """The (still empty) StreamedSheet of one sheet_specs entry."""
+    return StreamedSheet(wb, spec["name"], spec["columns"], spec["widths"], spec["kinds"],
+                         total_label=spec["total_label"], outline_depth=spec["outline_depth"], **sheet_kwargs)
+
+
+def stream_sheet(
+    wb,
+    sheet_name,
+    df: pd.DataFrame,
+    freeze_cell="A2",
+    vertical="center",
+    left_cols=None,
+    max_col=None,
+    max_width=60,
+    total_label=None,
+    outline=None,
+    hide_from=None,
+):
+    """
+    Write one sheet in a single pass with the same look as to_excel + format_sheet_basic:
+    bold header, numbers right / text left, freeze panes, auto-fit widths.
+
+    left_cols: None -> align by value type; otherwise 1-based columns aligned left, rest right
+    max_col: only auto-fit the first N columns
+    total_label: bold the first 3 cells of rows whose first value equals it (e.g. "Grand Total")
+    outline: Excel outline level per row (grouped rows, summary above); hide_from: first level shown collapsed
+    """
+    sheet = StreamedSheet(
+        wb, sheet_name, df.columns,
+        widths=column_widths(df, max_width=max_width, max_col=max_col),
+        kinds=column_kinds(df),
+        freeze_cell=freeze_cell,
+        vertical=vertical,
+        left_cols=left_cols,
+        total_label=total_label,
+        outline_depth=0 if outline is None or not len(outline) else int(np.max(outline)),
+    )
+    sheet.append(df, levels=outline, hide_from=hide_from)
+    return sheet.ws
+
+
+def write_sheets_streaming(out_path, sheets: dict[str, pd.DataFrame], total_sheets=None, outlines=None,
+                           **sheet_kwargs):
+    """
+    Create a new workbook with every sheet streamed out once (openpyxl write-only mode).
+    No load_workbook / second save, and rows are flushed to disk as they are written.
+
+    A frame over Excel's row limit goes on numbered sheets: "name", "name (2)", ... (sheet_specs).
+
+    total_sheets: {sheet_name: label} for sheets that get a bold total row
+    outlines: {sheet_name: (levels, hide_from)} for sheets written as an Excel outline (see stream_sheet)
+    sheet_kwargs: passed to stream_sheet for every sheet
+    """
+    outlines = outlines or {}
+    max_col, max_width = sheet_kwargs.pop("max_col", None), sheet_kwargs.pop("max_width", 60)
+    wb = Workbook(write_only=True)
+    for spec in sheet_specs(sheets, total_sheets, outlines, max_col=max_col, max_width=max_width):
+        levels = outlines.get(spec["source"], (None, None))[0]
+        rows = sheets[spec["source"]]
+        rows = rows if spec["stop"] - spec["start"] == len(rows) else rows.iloc[spec["start"]:spec["stop"]]
+        open_sheet(wb, spec, **sheet_kwargs).append(
+            rows, levels=None if levels is None else levels[spec["start"]:spec["stop"]], hide_from=spec["hide_from"])
+    wb.save(out_path)
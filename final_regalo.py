@@ -1,13 +1,54 @@
+import tempfile
+from functools import partial
 from pathlib import Path
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+
+from aging import BUCKET_INDEX_COL, bucket_index, with_bucket_flags
+from chunked import ROWS_COL, count_rows, run_chunked, sum_rows
+from csv_source import load_csv, read_csv_header
+from date_parse import parse_date_columns
+from db_source import DbSource
+from duckdb_pivots import duckdb_available, grouped_bucket_counts, grouped_sums
+from excel_output import EXCEL_MAX_ROWS, apply_column_alignment, apply_column_widths, shard_frames
+from parallel_pivot import parallel_bucket_pivot, parallel_subtotal_pivot
+from report_plan import SharedSource, run_plan
+from stage_log import StageLog, stage
+from text_cleanup import clean_reason, clean_series, clean_text
+from xlsx_parts import add_pivot_tables, replace_sheets, write_sheets_parallel
 
 # ===================== CONFIG =====================
 CSV1_PATH = r"C:\path\to\source_1.csv"          # report 1 source
 CSV2_PATH = r"C:\path\to\source_2.csv"          # report 2 source
 OUTPUT_XLSX = r"C:\path\to\final_output.xlsx"   # single combined output
+STREAMING_WRITE = True                          # new file -> write-only, one pass (no reload)
+INPLACE_UPDATE = True                           # existing file -> only our sheets swapped inside the xlsx
+                                                # (other sheets copied as they are, never loaded)
+CSV_ENGINE = "auto"                             # "auto" (pyarrow if installed) | "pyarrow" | "c"
+CSV_CACHE_DIR = None                            # e.g. r"C:\path\to\csv_cache" -> reuse parsed extracts (needs pyarrow)
+CSV_CACHE_BYPASS = False                        # True -> parse the CSV again and refresh its cache entry
+RUN_LOG = True                                  # per-stage timings appended to <output>.runlog.jsonl
+PLAN_WORKERS = 2                                # reports built concurrently (threads)
+PIVOT_WORKERS = 1                               # >1 -> pivots split by drug over this many processes
+WRITE_WORKERS = 1                               # >1 -> sheets written by this many processes at once (streamed
+                                                # writes; sheets over 1,048,576 rows go on "name (2)", ...)
+DATE_FALLBACK = False                           # True -> dates in other formats than the file's first one are
+                                                # aged too (default: blank, counted in the run log)
+CHUNK_ROWS = None                               # e.g. 250_000 -> chunked mode for extracts bigger than RAM:
+                                                # read in blocks, per-case sheets streamed to a new workbook
+PIVOT_BACKEND = "pandas"                        # "pandas" | "duckdb" -> pivots grouped by one DuckDB query over
+                                                # the CSV (needs duckdb; see bench_pivot_backend.py)
+PIVOT_OUTPUT = "rows"                           # "rows" -> pivot sheets computed and written here | "excel" -> native
+                                                # PivotTables over the case sheets, computed by Excel when the file
+                                                # opens (no pivot rows in the file; see bench_native_pivot.py)
+
+# ---- Database source (instead of the CSVs) ----
+DB_DSN = None                                   # e.g. "postgresql://user@host/dbname" or "sqlite:///C:/path/stand_in.db":
+                                                # pivots grouped in the database, only grouped rows fetched
+DB_SOURCE_1 = "schema.report_1_view"            # report 1 rows: table / view / "(SELECT ...) AS src"
+DB_SOURCE_2 = "schema.report_2_view"            # report 2 rows
+DB_CASE_SHEETS = True                           # False -> pivot sheets only (no case-level COPY)
 
 # ---- Report 1 sheet names ----
 R1_SOURCE_SHEET = "Cumulative Regalo Pending"
@@ -18,6 +59,13 @@ R1_COL_DRUG   = "drug"
 R1_COL_REASON = "case_sub_status_reason_code"
 R1_COL_COUNT  = "case_count"
 
+# ---- Report 1 CSV read (passthrough keeps every column for the source sheet) ----
+R1_SCHEMA = dict(
+    required=[R1_COL_DRUG, R1_COL_REASON, R1_COL_COUNT],
+    categories=[R1_COL_DRUG, R1_COL_REASON],
+    passthrough=True,
+)
+
 # ---- Report 2 sheet names ----
 R2_SHEET1 = "All Pending Cases by Case ID"
 R2_SHEET2 = "Aging by Status & Drug"
@@ -29,6 +77,14 @@ R2_COL_REASON     = "case_sub_status_reason_code"
 R2_COL_FILE_RCPT  = "file_receipt_date_time"
 R2_COL_ELIG_START = "eligibility_start_date"
 
+# ---- Report 2 CSV read (passthrough keeps every column for Sheet1) ----
+R2_SCHEMA = dict(
+    required=[R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, R2_COL_FILE_RCPT, R2_COL_ELIG_START],
+    dates=[R2_COL_FILE_RCPT, R2_COL_ELIG_START],          # date_fallback: DATE_FALLBACK, added by r2_schema()
+    categories=[R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON],
+    passthrough=True,
+)
+
 R2_DAYS_COL = "File Receipt Date Until Today"
 R2_BUCKETS = [
     ("0-15", 0, 15),
@@ -43,194 +99,361 @@ R2_BUCKETS = [
 
 
 # ------------------ Formatting helpers ------------------
-def autosize_columns(ws, max_width=60):
-    for col_idx in range(1, ws.max_column + 1):
-        col_letter = get_column_letter(col_idx)
-        max_len = 0
-        for cell in ws[col_letter]:
-            if cell.value is not None:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = min(max_len + 3, max_width)
+def autosize_columns(ws, df: pd.DataFrame, max_width=60):
+    """Auto-fit widths from the DataFrame (max str length per column) instead of every cell."""
+    apply_column_widths(ws, df, max_width=max_width)
 
 
-def format_sheet_basic(ws, freeze_cell="A2"):
+def format_sheet_basic(ws, df: pd.DataFrame, freeze_cell="A2"):
     # header bold
     for cell in ws[1]:
         cell.font = Font(bold=True)
         cell.alignment = Alignment(horizontal="left", vertical="center")
 
-    # align: numbers right, text left
-    for row in ws.iter_rows(min_row=2):
-        for cell in row:
-            if cell.value is None:
-                continue
-            if isinstance(cell.value, (int, float)):
-                cell.alignment = Alignment(horizontal="right", vertical="center")
-            else:
-                cell.alignment = Alignment(horizontal="left", vertical="center")
+    # align: numbers right, text left (one style per column, from the dtype)
+    apply_column_alignment(ws, df, vertical="center")
 
     ws.freeze_panes = freeze_cell
-    autosize_columns(ws)
+    autosize_columns(ws, df)
 
 
-# ------------------ Report 1 logic ------------------
-def r1_clean_reason(text):
-    if pd.isna(text):
-        return "Unknown"
-    text = str(text).strip()
-    text = " ".join(text.split())
-    text = text.lower()
-    return text.title()
+# ------------------ Shared column clean-ups ------------------
+# module-level functions so SharedSource.derived runs each one once per extract
+def strip_text(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.strip()
+
+
+def to_count(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").fillna(0)
 
 
+def clean_text_col(s: pd.Series) -> pd.Series:
+    return clean_series(s, clean_text)
+
+
+# ------------------ Report 1 logic ------------------
 def build_r1_excel_like_pivot(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df[R1_COL_REASON] = df[R1_COL_REASON].apply(r1_clean_reason)
+    # only the three pivot columns (no copy of the whole source frame)
+    df = pd.DataFrame({
+        R1_COL_DRUG: df[R1_COL_DRUG],
+        R1_COL_REASON: clean_series(df[R1_COL_REASON], clean_reason),
+        R1_COL_COUNT: df[R1_COL_COUNT],
+    })
 
-    detail = (
-        df.groupby([R1_COL_DRUG, R1_COL_REASON], as_index=False)[R1_COL_COUNT]
-        .sum()
-        .sort_values([R1_COL_DRUG, R1_COL_REASON], ascending=[True, True])
-    )
+    return parallel_subtotal_pivot(df, [R1_COL_DRUG, R1_COL_REASON], R1_COL_COUNT, PIVOT_WORKERS, order="key")
 
-    totals = (
-        df.groupby(R1_COL_DRUG, as_index=False)[R1_COL_COUNT]
-        .sum()
-        .sort_values(R1_COL_DRUG, ascending=True)
-    )
 
-    rows = []
-    grand_total = df[R1_COL_COUNT].sum()
+def use_duckdb(src: SharedSource) -> bool:
+    if PIVOT_BACKEND not in ("pandas", "duckdb"):
+        raise ValueError(f"PIVOT_BACKEND must be 'pandas' or 'duckdb', not {PIVOT_BACKEND!r}")
+    if PIVOT_BACKEND == "duckdb" and not duckdb_available():
+        raise ImportError("PIVOT_BACKEND = 'duckdb' needs duckdb (pip install duckdb)")
+    return PIVOT_BACKEND == "duckdb" and src.path is not None
 
-    for _, t in totals.iterrows():
-        drug = t[R1_COL_DRUG]
-        drug_total = int(t[R1_COL_COUNT])
-        rows.append([drug, "", drug_total])
 
-        sub = detail[detail[R1_COL_DRUG] == drug]
-        for _, r in sub.iterrows():
-            rows.append(["", "  " + str(r[R1_COL_REASON]), int(r[R1_COL_COUNT])])
+def native_pivots() -> bool:
+    if PIVOT_OUTPUT not in ("rows", "excel"):
+        raise ValueError(f"PIVOT_OUTPUT must be 'rows' or 'excel', not {PIVOT_OUTPUT!r}")
+    return PIVOT_OUTPUT == "excel"
 
-        rows.append(["", "", ""])
 
-    rows.append(["Grand Total", "", int(grand_total)])
-    return pd.DataFrame(rows, columns=[R1_COL_DRUG, R1_COL_REASON, R1_COL_COUNT])
+def check_case_rows(src: SharedSource, sheet):
+    """PIVOT_OUTPUT = 'excel': the PivotTable's range is one sheet, so the case rows must fit on one."""
+    if native_pivots() and len(src.frame) > EXCEL_MAX_ROWS - 1:
+        raise ValueError(f"PIVOT_OUTPUT = 'excel' needs each case sheet on one sheet; '{sheet}' would have "
+                         f"{len(src.frame):,} rows, more than {EXCEL_MAX_ROWS - 1:,} (set PIVOT_OUTPUT = 'rows')")
 
 
-def run_report_1(csv_path: Path):
-    df = pd.read_csv(csv_path)
+def r1_pivot_from_sums(sums: pd.DataFrame) -> pd.DataFrame:
+    # drug x reason sums grouped elsewhere (DuckDB / database); the text clean-ups run on the (few) groups
+    sums[R1_COL_DRUG] = strip_text(sums[R1_COL_DRUG])
+    sums[R1_COL_REASON] = strip_text(sums[R1_COL_REASON])
+    return build_r1_excel_like_pivot(sums)
 
-    required = {R1_COL_DRUG, R1_COL_REASON, R1_COL_COUNT}
-    missing = required - set(df.columns)
-    if missing:
-        raise ValueError(f"[Report1] Missing columns: {missing}. Found: {list(df.columns)}")
 
-    df[R1_COL_DRUG] = df[R1_COL_DRUG].astype(str).str.strip()
-    df[R1_COL_REASON] = df[R1_COL_REASON].astype(str).str.strip()
-    df[R1_COL_COUNT] = pd.to_numeric(df[R1_COL_COUNT], errors="coerce").fillna(0)
+def build_r1_pivot_duckdb(csv_path: Path) -> pd.DataFrame:
+    return r1_pivot_from_sums(grouped_sums(csv_path, [R1_COL_DRUG, R1_COL_REASON], R1_COL_COUNT))
+
 
-    pivot_out = build_r1_excel_like_pivot(df)
+def clean_r1_source(src: SharedSource) -> pd.DataFrame:
+    # shallow copy: cleaned columns replace the shared ones without touching them
+    df = src.frame.copy(deep=False)
+    df[R1_COL_DRUG] = src.derived(R1_COL_DRUG, strip_text)
+    df[R1_COL_REASON] = src.derived(R1_COL_REASON, strip_text)
+    df[R1_COL_COUNT] = src.derived(R1_COL_COUNT, to_count)
+    return df
+
+
+def build_report_1(src: SharedSource):
+    check_case_rows(src, R1_SOURCE_SHEET)
+    with stage("r1_clean", rows_in=len(src.frame)):
+        df = clean_r1_source(src)
+
+    if native_pivots():
+        # Excel builds the Summary from the source sheet: it carries the reasons the pivot groups by
+        df[R1_COL_REASON] = clean_series(df[R1_COL_REASON], clean_reason)
+        return df, None
+
+    with stage("r1_pivot", rows_in=len(df)) as st:
+        if use_duckdb(src):
+            pivot_out = build_r1_pivot_duckdb(src.path)
+        else:
+            pivot_out = build_r1_excel_like_pivot(df)
+        st["rows_out"] = len(pivot_out)
     return df, pivot_out
 
 
+def run_report_1(csv_path: Path):
+    header = read_csv_header(csv_path)
+
+    required = set(R1_SCHEMA["required"])
+    missing = required - set(header)
+    if missing:
+        raise ValueError(f"[Report1] Missing columns: {missing}. Found: {header}")
+
+    df = load_csv(csv_path, R1_SCHEMA, engine=CSV_ENGINE, header=header,
+                  cache_dir=CSV_CACHE_DIR, cache_bypass=CSV_CACHE_BYPASS)
+    return build_report_1(SharedSource(df, path=csv_path))
+
+
 # ------------------ Report 2 logic ------------------
-def r2_clean_text(x, unknown="Unknown"):
-    if pd.isna(x):
-        return unknown
-    s = str(x).strip()
-    if s == "" or s.lower() == "nan":
-        return unknown
-    s = " ".join(s.split())
-    s = s.lower()
-    return s.title()
-
-
-def build_r2_sheet1(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df[R2_COL_FILE_RCPT] = pd.to_datetime(df.get(R2_COL_FILE_RCPT), errors="coerce")
-    df[R2_COL_ELIG_START] = pd.to_datetime(df.get(R2_COL_ELIG_START), errors="coerce")
+def r2_schema() -> dict:
+    """R2_SCHEMA with DATE_FALLBACK as set when the read starts (not when the module was imported)."""
+    return dict(R2_SCHEMA, date_fallback=DATE_FALLBACK)
+
+
+def build_r2_sheet1(df: pd.DataFrame, today=None) -> pd.DataFrame:
+    # shallow copy: only whole columns are replaced/added, the caller's frame stays as is
+    df = df.copy(deep=False)
+    with stage("to_datetime", rows_in=len(df)) as st:
+        st["dates"] = parse_date_columns(df, [R2_COL_FILE_RCPT, R2_COL_ELIG_START], fallback=DATE_FALLBACK)
 
     chosen_date = df[R2_COL_FILE_RCPT].where(df[R2_COL_FILE_RCPT].notna(), df[R2_COL_ELIG_START])
-    today = pd.Timestamp.today().normalize()
+    today = today if today is not None else pd.Timestamp.today().normalize()
 
     days = (today - chosen_date).dt.days
     days = days.where(days.notna(), other=pd.NA).clip(lower=0)
 
     df[R2_DAYS_COL] = days
 
-    # bucket columns as 1 or blank "" (Excel-like)
-    for name, lo, hi in R2_BUCKETS:
-        if hi is None:
-            mask = df[R2_DAYS_COL].notna() & (df[R2_DAYS_COL] > lo)
-        else:
-            mask = df[R2_DAYS_COL].notna() & (df[R2_DAYS_COL] >= lo) & (df[R2_DAYS_COL] < hi)
-
-        df[name] = ""
-        df.loc[mask, name] = 1
+    # bucket position per row, one searchsorted (1/blank columns are made at write time)
+    df[BUCKET_INDEX_COL] = bucket_index(df[R2_DAYS_COL], R2_BUCKETS)
 
     return df
 
 
-def build_r2_sheet2_pivot(df_sheet1: pd.DataFrame) -> pd.DataFrame:
-    df = df_sheet1.copy()
-
-    df[R2_COL_DRUG] = df[R2_COL_DRUG].astype(str).str.strip()
-    df[R2_COL_STATUS] = df[R2_COL_STATUS].apply(r2_clean_text)
-    df[R2_COL_REASON] = df[R2_COL_REASON].apply(r2_clean_text)
-
-    # numeric versions of buckets for sums
-    for name, _, _ in R2_BUCKETS:
-        df[name] = df[name].apply(lambda v: 1 if v == 1 else 0)
-
-    pivot = pd.pivot_table(
-        df,
-        index=[R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON],
-        values=[b[0] for b in R2_BUCKETS],
-        aggfunc="sum",
-        fill_value=0
-    ).sort_index(level=[0, 1, 2], ascending=[True, True, True]).reset_index()
+def build_r2_sheet2_pivot(df_sheet1: pd.DataFrame, src: SharedSource = None, weight_col=None) -> pd.DataFrame:
+    # clean-ups come from the shared source when there is one (done once for all reports);
+    # clean_text runs once per distinct value (memoized), then maps back to every row
+    src = src if src is not None else SharedSource(df_sheet1)
+    df = pd.DataFrame({
+        R2_COL_DRUG: src.derived(R2_COL_DRUG, strip_text),
+        R2_COL_STATUS: src.derived(R2_COL_STATUS, clean_text_col),
+        R2_COL_REASON: src.derived(R2_COL_REASON, clean_text_col),
+        BUCKET_INDEX_COL: df_sheet1[BUCKET_INDEX_COL],
+    })
+    if weight_col is not None:
+        df[weight_col] = df_sheet1[weight_col]
+
+    # counts per bucket straight from the bucket index (sorted by drug/status/reason)
+    return parallel_bucket_pivot(df, [R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON], R2_BUCKETS, PIVOT_WORKERS,
+                                 weight_col=weight_col)
+
+
+def build_r2_pivot_duckdb(csv_path: Path, today) -> pd.DataFrame:
+    # rows per raw drug/status/reason and bucket from the CSV; the clean-ups run on the groups
+    counts = grouped_bucket_counts(csv_path, [R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON],
+                                   [R2_COL_FILE_RCPT, R2_COL_ELIG_START], today, R2_BUCKETS,
+                                   BUCKET_INDEX_COL, ROWS_COL, date_fallback=DATE_FALLBACK)
+    return build_r2_sheet2_pivot(counts, weight_col=ROWS_COL)
+
+
+def build_report_2(src: SharedSource):
+    check_case_rows(src, R2_SHEET1)
+    today = pd.Timestamp.today().normalize()        # one "today" for Sheet1 and the pivot
+    with stage("r2_bucket", rows_in=len(src.frame)):
+        sheet1 = build_r2_sheet1(src.frame, today)
+
+    if native_pivots():
+        # Excel builds the pivot from Sheet1: it carries the drug / status / reason labels the pivot groups by
+        with stage("r2_bucket_flags", rows_in=len(sheet1)):
+            sheet1[R2_COL_DRUG] = src.derived(R2_COL_DRUG, strip_text)
+            sheet1[R2_COL_STATUS] = src.derived(R2_COL_STATUS, clean_text_col)
+            sheet1[R2_COL_REASON] = src.derived(R2_COL_REASON, clean_text_col)
+            sheet1 = with_bucket_flags(sheet1, R2_BUCKETS)
+        return sheet1, None
+
+    with stage("r2_pivot", rows_in=len(sheet1)) as st:
+        if use_duckdb(src):
+            sheet2 = build_r2_pivot_duckdb(src.path, today)
+        else:
+            sheet2 = build_r2_sheet2_pivot(sheet1, src)
+        st["rows_out"] = len(sheet2)
 
-    return pivot
+    # 1/blank bucket columns only for the Excel copy of Sheet1
+    with stage("r2_bucket_flags", rows_in=len(sheet1)):
+        sheet1 = with_bucket_flags(sheet1, R2_BUCKETS)
+    return sheet1, sheet2
 
 
 def run_report_2(csv_path: Path):
-    df = pd.read_csv(csv_path)
+    header = read_csv_header(csv_path)
 
-    required = {R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, R2_COL_FILE_RCPT, R2_COL_ELIG_START}
-    missing = required - set(df.columns)
+    required = set(R2_SCHEMA["required"])
+    missing = required - set(header)
     if missing:
-        raise ValueError(f"[Report2] Missing columns: {missing}. Found: {list(df.columns)}")
+        raise ValueError(f"[Report2] Missing columns: {missing}. Found: {header}")
+
+    df = load_csv(csv_path, r2_schema(), engine=CSV_ENGINE, header=header,
+                  cache_dir=CSV_CACHE_DIR, cache_bypass=CSV_CACHE_BYPASS)
+    return build_report_2(SharedSource(df, path=csv_path))
+
+
+def excel_pivots(sheets: dict) -> dict:
+    """Native PivotTables (xlsx_parts.add_pivot_tables) for the pivot sheets: same rows and sums as the computed ones."""
+    r1_source, r2_sheet1 = sheets[R1_SOURCE_SHEET], sheets[R2_SHEET1]
+    return {
+        R1_PIVOT_SHEET: dict(source=R1_SOURCE_SHEET, columns=list(r1_source.columns), rows=len(r1_source),
+                             row_fields=[R1_COL_DRUG, R1_COL_REASON], value_fields=[R1_COL_COUNT], subtotals=True),
+        R2_SHEET2: dict(source=R2_SHEET1, columns=list(r2_sheet1.columns), rows=len(r2_sheet1),
+                        row_fields=[R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON],
+                        value_fields=[name for name, _, _ in R2_BUCKETS]),
+    }
 
-    sheet1 = build_r2_sheet1(df)
-    sheet2 = build_r2_sheet2_pivot(sheet1)
-    return sheet1, sheet2
+
+# ------------------ Report plan ------------------
+def report_plan(csv1: Path, csv2: Path):
+    """The 4-sheet workbook as data: each report's source, read schema, builder and sheets."""
+    return [
+        dict(name="Report1", source=csv1, schema=R1_SCHEMA, build=build_report_1,
+             sheets=[R1_SOURCE_SHEET, R1_PIVOT_SHEET]),
+        dict(name="Report2", source=csv2, schema=r2_schema(), build=build_report_2,
+             sheets=[R2_SHEET1, R2_SHEET2]),
+    ]
+
+
+# ------------------ Chunked mode ------------------
+def r1_chunk(block: pd.DataFrame):
+    """Report 1 for one block: cleaned source rows + drug x reason sums (reason clean-up at the end)."""
+    df = block.copy(deep=False)
+    df[R1_COL_DRUG] = strip_text(df[R1_COL_DRUG])
+    df[R1_COL_REASON] = strip_text(df[R1_COL_REASON])
+    df[R1_COL_COUNT] = to_count(df[R1_COL_COUNT])
+    return {R1_SOURCE_SHEET: df}, sum_rows(df, [R1_COL_DRUG, R1_COL_REASON], R1_COL_COUNT)
+
+
+def r2_chunk(block: pd.DataFrame, today):
+    """Report 2 for one block: Sheet1 rows + rows per raw drug/status/reason and bucket."""
+    sheet1 = build_r2_sheet1(block, today)
+    counts = count_rows(sheet1, [R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, BUCKET_INDEX_COL])
+    return {R2_SHEET1: with_bucket_flags(sheet1, R2_BUCKETS)}, counts
+
+
+def chunked_plan(csv1: Path, csv2: Path, today):
+    """The same 4 sheets as report_plan, for run_chunked (pivots built from merged per-block partials)."""
+    return [
+        dict(name="Report1", source=csv1, schema=R1_SCHEMA, chunk=r1_chunk,
+             keys=[R1_COL_DRUG, R1_COL_REASON],
+             finish=lambda sums: {R1_PIVOT_SHEET: build_r1_excel_like_pivot(sums)},
+             sheets=[R1_SOURCE_SHEET, R1_PIVOT_SHEET]),
+        dict(name="Report2", source=csv2, schema=r2_schema(), chunk=partial(r2_chunk, today=today),
+             keys=[R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, BUCKET_INDEX_COL],
+             finish=lambda counts: {R2_SHEET2: build_r2_sheet2_pivot(counts, weight_col=ROWS_COL)},
+             sheets=[R2_SHEET1, R2_SHEET2]),
+    ]
+
+
+# ------------------ Database source ------------------
+def db_sheets(db: DbSource) -> dict:
+    """
+    The 4 sheets from the database: both pivots grouped in SQL (only the groups come back),
+    the per-case sheets from a COPY of the rows when DB_CASE_SHEETS is on.
+    """
+    today = pd.Timestamp.today().normalize()
+    with stage("r1_pivot") as st:
+        sums = db.grouped_sums(DB_SOURCE_1, [R1_COL_DRUG, R1_COL_REASON], R1_COL_COUNT,
+                               trim=[R1_COL_DRUG], fold=[R1_COL_REASON])
+        r1_pivot = r1_pivot_from_sums(sums)
+        st["rows_out"] = len(r1_pivot)
+    with stage("r2_pivot") as st:
+        counts = db.grouped_bucket_counts(DB_SOURCE_2, [R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON],
+                                          [R2_COL_FILE_RCPT, R2_COL_ELIG_START], today, R2_BUCKETS,
+                                          BUCKET_INDEX_COL, ROWS_COL,
+                                          trim=[R2_COL_DRUG], fold=[R2_COL_STATUS, R2_COL_REASON])
+        r2_pivot = build_r2_sheet2_pivot(counts, weight_col=ROWS_COL)
+        st["rows_out"] = len(r2_pivot)
+
+    if not DB_CASE_SHEETS:
+        return {R1_PIVOT_SHEET: r1_pivot, R2_SHEET2: r2_pivot}
+
+    # case rows as CSV (COPY TO STDOUT), then read like an extract
+    with tempfile.TemporaryDirectory() as tmp:
+        with stage("db_copy"):
+            csv1 = db.copy_csv(DB_SOURCE_1, Path(tmp) / "report_1.csv")
+            csv2 = csv1 if DB_SOURCE_2 == DB_SOURCE_1 else db.copy_csv(DB_SOURCE_2, Path(tmp) / "report_2.csv")
+        with stage("read") as st:
+            r1_source = clean_r1_source(SharedSource(load_csv(csv1, R1_SCHEMA, engine=CSV_ENGINE)))
+            r2_source = load_csv(csv2, r2_schema(), engine=CSV_ENGINE)
+            st["rows_out"] = len(r1_source) + len(r2_source)
+    with stage("r2_bucket", rows_in=len(r2_source)):
+        sheet1 = with_bucket_flags(build_r2_sheet1(r2_source, today), R2_BUCKETS)
+
+    return {R1_SOURCE_SHEET: r1_source, R1_PIVOT_SHEET: r1_pivot, R2_SHEET1: sheet1, R2_SHEET2: r2_pivot}
 
 
 # ------------------ Main writer ------------------
-def write_all_sheets(out_path: Path, sheets: dict[str, pd.DataFrame]):
+def write_all_sheets(out_path: Path, sheets: dict[str, pd.DataFrame], pivots=None):
+    """Write the sheets; pivots: {sheet: spec} -> those sheets are left empty and get a native PivotTable."""
+    if pivots:
+        sheets = {name: pd.DataFrame() if name in pivots else df for name, df in sheets.items()}
+        write_all_sheets(out_path, sheets)
+        with stage("excel_pivots", rows_in=sum(spec["rows"] for spec in pivots.values())):
+            add_pivot_tables(out_path, pivots)
+        return
+
+    # new file: stream every sheet out already formatted (no load_workbook / second save)
+    rows = sum(len(df) for df in sheets.values())
+    if STREAMING_WRITE and not out_path.exists():
+        with stage("excel_write", rows_in=rows):
+            write_sheets_parallel(
+                out_path, sheets, WRITE_WORKERS, total_sheets={R1_PIVOT_SHEET: "Grand Total"}, freeze_cell="A2"
+            )
+        return
+
+    # existing file: same streamed sheets, swapped in place of the old ones (other sheets not parsed)
+    if INPLACE_UPDATE and out_path.exists():
+        with stage("excel_write", rows_in=rows):
+            replace_sheets(out_path, sheets, total_sheets={R1_PIVOT_SHEET: "Grand Total"}, workers=WRITE_WORKERS,
+                           freeze_cell="A2")
+        return
+
     mode = "a" if out_path.exists() else "w"
     writer_kwargs = dict(engine="openpyxl", mode=mode)
     if mode == "a":
         writer_kwargs["if_sheet_exists"] = "replace"
 
-    with pd.ExcelWriter(out_path, **writer_kwargs) as writer:
-        for sheet_name, df in sheets.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    # sheets over Excel's row limit go on "name (2)", ... (to_excel can't write them in one)
+    sheets = shard_frames(sheets)
+    with stage("excel_write", rows_in=rows):
+        with pd.ExcelWriter(out_path, **writer_kwargs) as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
 
     # apply formatting
-    wb = load_workbook(out_path)
-    for sheet_name in sheets.keys():
-        ws = wb[sheet_name]
-        format_sheet_basic(ws, freeze_cell="A2")
+    with stage("format", rows_in=rows):
+        wb = load_workbook(out_path)
+        for sheet_name, df in sheets.items():
+            ws = wb[sheet_name]
+            format_sheet_basic(ws, df, freeze_cell="A2")
 
-        # bold "Grand Total" row for Report1 Summary if present
-        if sheet_name == R1_PIVOT_SHEET:
-            for row in ws.iter_rows():
-                if row[0].value == "Grand Total":
-                    for c in row[:3]:
-                        c.font = Font(bold=True)
+            # bold "Grand Total" row for Report1 Summary if present
+            if sheet_name == R1_PIVOT_SHEET:
+                for row in ws.iter_rows():
+                    if row[0].value == "Grand Total":
+                        for c in row[:3]:
+                            c.font = Font(bold=True)
 
-    wb.save(out_path)
+        wb.save(out_path)
 
 
 def main():
@@ -238,24 +461,39 @@ def main():
     csv2 = Path(CSV2_PATH)
     out = Path(OUTPUT_XLSX)
 
+    if native_pivots() and (DB_DSN or CHUNK_ROWS):
+        raise ValueError("PIVOT_OUTPUT = 'excel' builds the PivotTables over the case sheets of a CSV run "
+                         "(set DB_DSN and CHUNK_ROWS to None)")
+
+    if DB_DSN:
+        with StageLog(out, "final_regalo", enabled=RUN_LOG):
+            with DbSource(DB_DSN) as db:
+                sheets = db_sheets(db)
+            write_all_sheets(out, sheets)
+        print(f"✅ Done. {len(sheets)} sheets written to: {out} (from the database)")
+        return
+
     if not csv1.exists():
         raise FileNotFoundError(f"CSV1 not found: {csv1}")
     if not csv2.exists():
         raise FileNotFoundError(f"CSV2 not found: {csv2}")
 
-    # Build all dataframes
-    r1_source, r1_summary = run_report_1(csv1)
-    r2_all_cases, r2_aging_pivot = run_report_2(csv2)
-
-    # Write 4 sheets into one workbook
-    sheets = {
-        R1_SOURCE_SHEET: r1_source,
-        R1_PIVOT_SHEET:  r1_summary,
-        R2_SHEET1:       r2_all_cases,
-        R2_SHEET2:       r2_aging_pivot
-    }
-
-    write_all_sheets(out, sheets)
+    # Build all 4 sheets (same extract for both reports -> parsed and cleaned once;
+    # the two reports run side by side)
+    with StageLog(out, "final_regalo", enabled=RUN_LOG):
+        if CHUNK_ROWS:
+            plan = chunked_plan(csv1, csv2, pd.Timestamp.today().normalize())
+            run_chunked(out, plan, chunk_rows=CHUNK_ROWS, total_sheets={R1_PIVOT_SHEET: "Grand Total"},
+                        freeze_cell="A2")
+            print(f"✅ Done. 4 sheets written to: {out} (chunked)")
+            return
+
+        # "excel" mode: a case sheet too long for one sheet fails in its builder, right after the read
+        sheets = run_plan(report_plan(csv1, csv2), engine=CSV_ENGINE, max_workers=PLAN_WORKERS,
+                          cache_dir=CSV_CACHE_DIR, cache_bypass=CSV_CACHE_BYPASS)
+
+        # Write 4 sheets into one workbook (pivot sheets as native PivotTables in "excel" mode)
+        write_all_sheets(out, sheets, pivots=excel_pivots(sheets) if native_pivots() else None)
     print(f"✅ Done. 4 sheets written to: {out}")
 
 
@@ -1,18 +1,16 @@
+-- 2025 REGALORX forecast -> forecast_table. One scan of the source (LATERAL VALUES unpivot);
+-- only rows whose value changes are rewritten. Other years / vendors / CSV files: forecast_loader.py
 BEGIN;
 
 WITH src AS (
-    SELECT product, '2025-01'::text AS month, jan_25 AS val FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-02', feb_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-03', mar_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-04', apr_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-05', may_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-06', jun_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-07', jul_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-08', aug_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-09', sep_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-10', oct_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-11', nov_25 FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-12', dec_25 FROM asnfdm.forecasted_application_2025
+    SELECT f.product, m.month, m.val
+    FROM asnfdm.forecasted_application_2025 f
+    CROSS JOIN LATERAL (VALUES
+        ('2025-01', f.jan_25), ('2025-02', f.feb_25), ('2025-03', f.mar_25),
+        ('2025-04', f.apr_25), ('2025-05', f.may_25), ('2025-06', f.jun_25),
+        ('2025-07', f.jul_25), ('2025-08', f.aug_25), ('2025-09', f.sep_25),
+        ('2025-10', f.oct_25), ('2025-11', f.nov_25), ('2025-12', f.dec_25)
+    ) AS m(month, val)
 )
 
 UPDATE asnfdm.forecast_table ft
@@ -21,6 +19,6 @@ FROM src
 WHERE ft.vendor = 'REGALORX'
   AND ft.drug = src.product
   AND ft.month = src.month
-  AND ft.month LIKE '2025-%';
+  AND ft.forecasted_application IS DISTINCT FROM src.val;
 
-COMMIT;
\ No newline at end of file
+COMMIT;
@@ -1,6 +1,14 @@
+-- Old vs new value for every matching 2025 month, unchanged values included
+-- (forecast_loader.py's Excel diff keeps only the rows whose value changes)
 WITH src AS (
-    SELECT product, '2025-01'::text AS month, jan_25 AS val FROM asnfdm.forecasted_application_2025
-    UNION ALL SELECT product, '2025-02', feb_25 FROM asnfdm.forecasted_application_2025
+    SELECT f.product, m.month, m.val
+    FROM asnfdm.forecasted_application_2025 f
+    CROSS JOIN LATERAL (VALUES
+        ('2025-01', f.jan_25), ('2025-02', f.feb_25), ('2025-03', f.mar_25),
+        ('2025-04', f.apr_25), ('2025-05', f.may_25), ('2025-06', f.jun_25),
+        ('2025-07', f.jul_25), ('2025-08', f.aug_25), ('2025-09', f.sep_25),
+        ('2025-10', f.oct_25), ('2025-11', f.nov_25), ('2025-12', f.dec_25)
+    ) AS m(month, val)
 )
 SELECT ft.drug, ft.month, ft.published_quarter,
        ft.forecasted_application AS old_value,
@@ -10,4 +18,4 @@ JOIN src
   ON ft.drug = src.product
  AND ft.month = src.month
 WHERE ft.vendor = 'REGALORX'
-ORDER BY ft.drug, ft.month, ft.published_quarter;
\ No newline at end of file
+ORDER BY ft.drug, ft.month, ft.published_quarter;
@@ -0,0 +1,227 @@
+"""
+Forecast loader: the wide forecast (one row per product, one column per month, e.g. jan_25 ... dec_26)
+into forecast_table, without the hand-written per-month UNION ALL of forecast_app.sql.
+
+1. month columns found from the source's column names (mon_yy / mon_yyyy), any number of years
+2. unpivoted in one scan (CROSS JOIN LATERAL (VALUES ...)) into a temp table; a .csv source is
+   unpivoted in pandas and COPYed into the same temp table
+3. old/new diff (forecast_check.sql's query, changed values only) + staged rows with no target row -> Excel
+4. unless DRY_RUN: UPDATE ... FROM the temp table, BATCH_ROWS staged rows per transaction,
+   only rows whose value changes (short row locks, no rewrite of unchanged rows)
+
+forecast_table should have an index on (vendor, drug, month) for the batched updates.
+Needs Postgres (db_source.DbSource with psycopg2 / psycopg).
+"""
+import re
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from db_source import DbSource, _ident
+from excel_output import write_sheets_streaming
+from stage_log import StageLog, stage
+
+# ---------------- CONFIG ----------------
+DB_DSN = "postgresql://user@host/dbname"          # <-- change
+SOURCE = "asnfdm.forecasted_application_2025"     # forecast table, or a .csv file with the same layout
+PRODUCT_COL = "product"
+VENDOR = "REGALORX"                               # vendor of every forecast row ...
+VENDOR_COL = None                                 # ... or the source column holding it (multi-vendor files)
+
+TARGET_TABLE = "asnfdm.forecast_table"
+TARGET_VALUE_COL = "forecasted_application"
+BATCH_ROWS = 5_000                                # staged rows per UPDATE transaction
+DRY_RUN = True                                    # True -> diff only, forecast_table untouched
+DIFF_XLSX = r"C:\path\to\forecast_diff.xlsx"      # <-- change
+RUN_LOG = True                                    # per-stage timings appended to <output>.runlog.jsonl
+
+DIFF_SHEET = "Changes"
+UNMATCHED_SHEET = "No Target Row"
+# ----------------------------------------
+
+STAGE_TABLE = "forecast_stage"
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+MONTH_COL = re.compile(r"^(" + "|".join(MONTHS) + r")_(\d{2}|\d{4})$", re.IGNORECASE)
+
+
+# ------------------ Month columns ------------------
+def month_columns(columns) -> list:
+    """[(column, "YYYY-MM")] for every mon_yy / mon_yyyy column, in month order."""
+    found = []
+    for col in columns:
+        match = MONTH_COL.match(str(col).strip())
+        if match:
+            year = int(match.group(2))
+            year = year + 2000 if year < 100 else year
+            found.append((col, f"{year:04d}-{MONTHS.index(match.group(1).lower()) + 1:02d}"))
+    if not found:
+        raise ValueError(f"No month columns (e.g. jan_25) found in: {list(columns)}")
+
+    months = [month for _, month in found]
+    duplicated = sorted({m for m in months if months.count(m) > 1})
+    if duplicated:
+        raise ValueError(f"More than one column for months {duplicated}: {found}")
+    return sorted(found, key=lambda pair: pair[1])
+
+
+def table_columns(db: DbSource, table) -> list:
+    schema, _, name = table.rpartition(".")
+    rows = db.query(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = %s AND table_schema = COALESCE(NULLIF(%s, ''), current_schema()) "
+        "ORDER BY ordinal_position",
+        (name, schema),
+    )
+    if rows.empty:
+        raise ValueError(f"Table not found (or no columns visible): {table}")
+    return list(rows["column_name"])
+
+
+# ------------------ Staging ------------------
+def create_stage(db: DbSource):
+    db.execute(f"DROP TABLE IF EXISTS {STAGE_TABLE}")
+    db.execute(f"CREATE TEMP TABLE {STAGE_TABLE} (vendor text, drug text, month text, val numeric, batch_no integer)")
+
+
+def stage_from_table(db: DbSource, table) -> int:
+    """Unpivot the forecast table into the stage table in one scan of it."""
+    columns = table_columns(db, table)
+    for col in [PRODUCT_COL] + ([VENDOR_COL] if VENDOR_COL else []):
+        if col not in columns:
+            raise ValueError(f"Missing column {col!r} in {table}. Found: {columns}")
+
+    values = ", ".join(f"('{month}', src.{_ident(col)})" for col, month in month_columns(columns))
+    vendor = f"src.{_ident(VENDOR_COL)}" if VENDOR_COL else "%s"
+    create_stage(db)
+    return db.execute(
+        f"INSERT INTO {STAGE_TABLE} (vendor, drug, month, val) "
+        f"SELECT {vendor}, src.{_ident(PRODUCT_COL)}, m.month, m.val "
+        f"FROM {_ident(table)} AS src CROSS JOIN LATERAL (VALUES {values}) AS m(month, val)",
+        () if VENDOR_COL else (VENDOR,),
+    )
+
+
+def stage_from_csv(db: DbSource, csv_path: Path) -> int:
+    """Unpivot a forecast CSV in pandas and COPY it into the stage table."""
+    wide = pd.read_csv(csv_path)
+    for col in [PRODUCT_COL] + ([VENDOR_COL] if VENDOR_COL else []):
+        if col not in wide.columns:
+            raise ValueError(f"Missing column {col!r} in {csv_path}. Found: {list(wide.columns)}")
+
+    months = month_columns(wide.columns)
+    long = wide.melt(
+        id_vars=[PRODUCT_COL] + ([VENDOR_COL] if VENDOR_COL else []),
+        value_vars=[col for col, _ in months], var_name="month", value_name="val",
+    )
+    long["month"] = long["month"].map(dict(months))
+    long = pd.DataFrame({
+        "vendor": long[VENDOR_COL] if VENDOR_COL else VENDOR,
+        "drug": long[PRODUCT_COL],
+        "month": long["month"],
+        "val": long["val"],
+    })
+
+    create_stage(db)
+    with tempfile.TemporaryFile("w+", newline="", encoding="utf-8") as f:
+        long.to_csv(f, index=False)
+        f.seek(0)
+        db.copy_from(STAGE_TABLE, list(long.columns), f)
+    return len(long)
+
+
+def finish_stage(db: DbSource) -> int:
+    """Refuse duplicate keys, number the batches, index + analyze. Returns the batch count."""
+    dupes = db.query(f"SELECT vendor, drug, month, COUNT(*) AS n FROM {STAGE_TABLE} "
+                     f"GROUP BY vendor, drug, month HAVING COUNT(*) > 1 ORDER BY vendor, drug, month")
+    if not dupes.empty:
+        raise ValueError(f"Forecast has {len(dupes)} vendor/drug/month keys more than once, e.g.:\n"
+                         f"{dupes.head(10).to_string(index=False)}")
+
+    db.execute(f"UPDATE {STAGE_TABLE} AS s SET batch_no = b.batch_no FROM ("
+               f"SELECT ctid, (ROW_NUMBER() OVER (ORDER BY vendor, drug, month) - 1) / %s AS batch_no "
+               f"FROM {STAGE_TABLE}) AS b WHERE s.ctid = b.ctid", (BATCH_ROWS,))
+    db.execute(f"CREATE INDEX ON {STAGE_TABLE} (batch_no)")
+    db.execute(f"CREATE INDEX ON {STAGE_TABLE} (vendor, drug, month)")
+    db.execute(f"ANALYZE {STAGE_TABLE}")
+    return int(db.query(f"SELECT COALESCE(MAX(batch_no) + 1, 0) AS n FROM {STAGE_TABLE}")["n"].iat[0])
+
+
+# ------------------ Diff + update ------------------
+def _matches(target="ft", staged="s"):
+    return f"{target}.vendor = {staged}.vendor AND {target}.drug = {staged}.drug AND {target}.month = {staged}.month"
+
+
+def forecast_diff(db: DbSource) -> pd.DataFrame:
+    """Target rows whose value the forecast changes: old vs new (forecast_check.sql without the unchanged rows)."""
+    value = _ident(TARGET_VALUE_COL)
+    return db.query(
+        f"SELECT ft.vendor, ft.drug, ft.month, ft.published_quarter, ft.{value} AS old_value, s.val AS new_value "
+        f"FROM {_ident(TARGET_TABLE)} AS ft JOIN {STAGE_TABLE} AS s ON {_matches()} "
+        f"WHERE ft.{value} IS DISTINCT FROM s.val "
+        f"ORDER BY ft.vendor, ft.drug, ft.month, ft.published_quarter"
+    )
+
+
+def unmatched_rows(db: DbSource) -> pd.DataFrame:
+    """Staged rows with no target row to update (new drug / month / vendor in the forecast)."""
+    return db.query(
+        f"SELECT s.vendor, s.drug, s.month, s.val AS new_value FROM {STAGE_TABLE} AS s "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {_ident(TARGET_TABLE)} AS ft WHERE {_matches()}) "
+        f"ORDER BY s.vendor, s.drug, s.month"
+    )
+
+
+def apply_forecast(db: DbSource, n_batches) -> int:
+    """UPDATE ... FROM the stage, one committed transaction per batch. Returns rows updated."""
+    value = _ident(TARGET_VALUE_COL)
+    sql = (f"UPDATE {_ident(TARGET_TABLE)} AS ft SET {value} = s.val FROM {STAGE_TABLE} AS s "
+           f"WHERE s.batch_no = %s AND {_matches()} AND ft.{value} IS DISTINCT FROM s.val")
+    updated = 0
+    for batch in range(n_batches):
+        try:
+            updated += db.execute(sql, (batch,))
+            db.conn.commit()
+        except Exception:
+            db.conn.rollback()
+            raise
+    return updated
+
+
+def main():
+    out = Path(DIFF_XLSX)
+    source = Path(SOURCE)
+
+    with StageLog(out, "forecast_loader", enabled=RUN_LOG):
+        with DbSource(DB_DSN, readonly=False) as db:
+            if db.dialect != "postgres":
+                raise ValueError("forecast_loader needs a Postgres DB_DSN")
+
+            with stage("stage") as st:
+                if source.suffix.lower() == ".csv":
+                    st["rows_out"] = stage_from_csv(db, source)
+                else:
+                    st["rows_out"] = stage_from_table(db, SOURCE)
+                n_batches = finish_stage(db)
+            db.conn.commit()                         # temp table stays for the session
+
+            with stage("diff") as st:
+                diff = forecast_diff(db)
+                unmatched = unmatched_rows(db)
+                st["rows_out"] = len(diff)
+            with stage("excel_write", rows_in=len(diff) + len(unmatched)):
+                write_sheets_streaming(out, {DIFF_SHEET: diff, UNMATCHED_SHEET: unmatched})
+
+            if DRY_RUN:
+                print(f"✅ Done. {len(diff):,} changes, {len(unmatched):,} rows without a target row -> {out} "
+                      f"(dry run, {TARGET_TABLE} untouched)")
+                return
+
+            with stage("update", rows_in=len(diff)) as st:
+                st["rows_out"] = updated = apply_forecast(db, n_batches)
+
+    print(f"✅ Done. {updated:,} rows of {TARGET_TABLE} updated in {n_batches} batches; diff -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+On-disk cache of parsed source frames (Feather, uncompressed so reads can be memory-mapped).
+
+Entries are keyed by a hash of the CSV's bytes plus the read settings (schema, cache version,
+pandas / pyarrow versions), so an edited extract or a schema change never hits a stale entry.
+Least recently used entries are removed once the directory is over CACHE_MAX_BYTES.
+Needs pyarrow; without it every call is a miss and nothing is written.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+except ImportError:          # optional: no cache without pyarrow
+    pa = None
+    pa_feather = None
+
+CACHE_VERSION = 1
+CACHE_MAX_BYTES = 2 * 2**30      # whole cache directory; oldest-used entries go first
+HASH_CHUNK = 2**20
+SUFFIX = ".feather"
+
+
+def cache_available() -> bool:
+    return pa_feather is not None
+
+
+def file_digest(path) -> str:
+    """Content hash of the file (same bytes -> same key, whatever the name or mtime)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(path, params: dict) -> str:
+    settings = json.dumps(
+        dict(params, cache_version=CACHE_VERSION, pandas=pd.__version__, pyarrow=pa.__version__),
+        sort_keys=True, default=str,
+    )
+    return hashlib.blake2b((file_digest(path) + settings).encode(), digest_size=16).hexdigest()
+
+
+def get(cache_dir, key):
+    """Cached frame for key, or None. A hit marks the entry as recently used."""
+    if not cache_available():
+        return None
+    path = Path(cache_dir) / f"{key}{SUFFIX}"
+    if not path.exists():
+        return None
+    try:
+        table = pa_feather.read_table(path, memory_map=True)
+        df = table.to_pandas()
+    except (OSError, pa.ArrowException):
+        path.unlink(missing_ok=True)        # unreadable entry: drop it, parse again
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return df
+
+
+def put(cache_dir, key, df: pd.DataFrame, max_bytes=CACHE_MAX_BYTES) -> bool:
+    """Store df under key (written to a temp file, then swapped in). False if it can't be stored."""
+    if not cache_available():
+        return False
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"{key}{SUFFIX}"
+    tmp_path = cache_dir / f"{key}.tmp"
+    try:
+        df.to_feather(tmp_path, compression="uncompressed")
+    except (ValueError, TypeError, pa.ArrowException):
+        # e.g. object columns mixing numbers and text: keep parsing this extract from CSV
+        tmp_path.unlink(missing_ok=True)
+        return False
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes)
+    return True
+
+
+def evict(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    """Remove least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    for path in Path(cache_dir).glob(f"*{SUFFIX}"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:           # removed by another run meanwhile
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries[:-1]:      # the newest entry always stays
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:                     # still open elsewhere (e.g. memory-mapped on Windows)
+            continue
+        total -= size
@@ -0,0 +1,193 @@
+"""
+Pivots computed per drug partition in a process pool.
+
+Every drug's subtree of the Summary / aging pivots only depends on that drug's rows, so the
+normalized pivot frame is split by drug (whole drugs per partition, balanced by row count),
+each partition is pivoted in a worker process and the pieces are put back in the order the
+single-process builders produce.
+
+Frames go to the workers as Arrow IPC streams in shared memory (one segment per partition,
+read in place by the worker); without pyarrow, or for columns Arrow can't hold, they are
+pickled instead. The pool is started once per worker count and reused for the rest of the run.
+"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from aging import BUCKET_INDEX_COL, bucket_pivot
+from pivot_subtotals import build_subtotal_pivot, _level_totals
+
+try:
+    import pyarrow as pa
+except ImportError:          # optional: partitions are pickled instead
+    pa = None
+
+PARALLEL_MIN_ROWS = 100_000      # smaller frames are pivoted in-process (pool overhead > gain)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(workers):
+    # spawn: safe from the report threads (no fork of a threaded parent), same on Windows
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pools[workers]
+
+
+@atexit.register
+def _shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+
+
+# ------------------ Partitioning ------------------
+def partition_rows(values, n_parts):
+    """
+    Row positions per partition: every distinct value in one partition, biggest values first
+    onto the least loaded partition (drug mixes are skewed, plain hashing piles them up).
+    Row order within a partition is kept. Empty partitions are left out.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    sizes = np.bincount(codes, minlength=len(uniques))
+
+    part_of = np.empty(len(uniques), dtype=np.int64)
+    load = np.zeros(n_parts, dtype=np.int64)
+    for code in np.argsort(-sizes, kind="stable"):
+        part = int(np.argmin(load))
+        part_of[code] = part
+        load[part] += sizes[code]
+
+    row_part = part_of[codes]
+    return [rows for rows in (np.flatnonzero(row_part == p) for p in range(n_parts)) if len(rows)]
+
+
+# ------------------ Shared-memory transport ------------------
+def _share(df: pd.DataFrame):
+    """df as an Arrow IPC stream in a new shared memory segment -> (segment, payload for the worker)."""
+    if pa is None:
+        return None, ("pickle", df)
+    # text as dictionaries: codes + the few distinct labels, no per-row strings to build again
+    text = [col for col in df.columns if df[col].dtype == object]
+    try:
+        table = pa.Table.from_pandas(df.astype({col: "category" for col in text}), preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None, ("pickle", df)       # e.g. object column mixing numbers and text (sent as it is)
+
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    sink.close()
+    return shm, ("arrow", shm.name, size, text)
+
+
+def _receive(payload) -> pd.DataFrame:
+    if payload[0] == "pickle":
+        return payload[1]
+
+    _, name, size, text = payload
+    # pool workers share the parent's resource tracker: the parent's unlink is the only cleanup
+    shm = SharedMemory(name=name)
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(shm.buf)[:size]).read_all()
+        df = table.to_pandas()
+        # back to plain object columns (missing -> NaN) so the builders group exactly as in-process;
+        # also drops the categorical codes that still point into the segment
+        for col in text:
+            df[col] = np.asarray(df[col], dtype=object)
+        del table
+    finally:
+        shm.close()
+    return df
+
+
+def _run_part(fn, payload, kwargs):
+    return fn(_receive(payload), **kwargs)
+
+
+def map_partitions(df: pd.DataFrame, by, fn, workers, **kwargs):
+    """fn(partition, **kwargs) for every partition of df by column `by`, in the pool; results in partition order."""
+    segments, futures = [], []
+    try:
+        for rows in partition_rows(df[by], workers):
+            shm, payload = _share(df.iloc[rows])
+            if shm is not None:
+                segments.append(shm)
+            futures.append(_pool(workers).submit(_run_part, fn, payload, kwargs))
+        return [f.result() for f in futures]
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+
+# ------------------ Parallel pivots ------------------
+def parallel_bucket_pivot(df: pd.DataFrame, keys, buckets, workers, index_col=BUCKET_INDEX_COL,
+                          weight_col=None) -> pd.DataFrame:
+    """aging.bucket_pivot with the first key's groups split over `workers` processes (same table)."""
+    if workers <= 1 or len(df) < PARALLEL_MIN_ROWS:
+        return bucket_pivot(df, keys, buckets, index_col=index_col, weight_col=weight_col)
+
+    columns = list(keys) + [index_col] + ([weight_col] if weight_col is not None else [])
+    parts = map_partitions(df[columns], keys[0], bucket_pivot, workers,
+                           keys=keys, buckets=buckets, index_col=index_col, weight_col=weight_col)
+    if not parts:
+        return bucket_pivot(df, keys, buckets, index_col=index_col, weight_col=weight_col)
+
+    # each part is sorted by all keys and holds whole first-key groups: a stable sort on it is enough
+    out = pd.concat(parts, ignore_index=True)
+    return out.sort_values(keys[0], kind="stable", ignore_index=True)
+
+
+def _subtotal_part(df: pd.DataFrame, levels, value_col, **pivot_kwargs):
+    """Worker: the partition's pivot + its top-level totals (unrounded, for the final ordering)."""
+    pivot = build_subtotal_pivot(df, levels, value_col, **pivot_kwargs)
+    return pivot, df.groupby(levels[0], as_index=False)[value_col].sum()
+
+
+def _top_level_blocks(pivot: pd.DataFrame, levels, value_col):
+    """{top-level label: its rows (header, children, spacer)} of a build_subtotal_pivot result, grand total dropped."""
+    body = pivot.iloc[:-1]
+    header = body[value_col].ne("")
+    for col in levels[1:]:
+        header &= body[col].eq("")
+    starts = np.flatnonzero(header.to_numpy())
+    ends = list(starts[1:]) + [len(body)]
+    return {body.iat[s, 0]: body.iloc[s:e] for s, e in zip(starts, ends)}
+
+
+def parallel_subtotal_pivot(df: pd.DataFrame, levels, value_col, workers, order="key",
+                            grand_total_label="Grand Total", **pivot_kwargs) -> pd.DataFrame:
+    """build_subtotal_pivot with the top level's groups split over `workers` processes (same table)."""
+    levels = list(levels)
+    pivot_kwargs = dict(pivot_kwargs, order=order, grand_total_label=grand_total_label)
+    if workers <= 1 or len(df) < PARALLEL_MIN_ROWS:
+        return build_subtotal_pivot(df, levels, value_col, **pivot_kwargs)
+
+    parts = map_partitions(df[levels + [value_col]], levels[0], _subtotal_part, workers,
+                           levels=levels, value_col=value_col, **pivot_kwargs)
+    blocks = {}
+    for pivot, _ in parts:
+        blocks.update(_top_level_blocks(pivot, levels, value_col))
+
+    # top-level order: the same sort build_subtotal_pivot does, on the same per-drug totals
+    totals = pd.concat([t for _, t in parts], ignore_index=True)
+    ranked = _level_totals(totals, levels[:1], value_col, 0, order)
+
+    grand_total = int(df[value_col].sum())
+    gt_row = pd.DataFrame([[grand_total_label] + [""] * (len(levels) - 1) + [grand_total]],
+                          columns=levels + [value_col])
+    out = pd.concat([blocks[label] for label in ranked[levels[0]]] + [gt_row], ignore_index=True)
+    return out.infer_objects()
@@ -0,0 +1,270 @@
+"""
+Distinct patients per external_source / case_status / enrollment_status, patients listed in
+d_phi left out (phir.sql), as a reusable report.
+
+Database mode: d_phi's patient IDs are kept trimmed, de-duplicated and primary-keyed in
+KEY_TABLE, so the NOT EXISTS is an index / hash anti-join on one side's BTRIM only. The key
+table is refreshed before each run: with PHI_CHANGE_COL only the d_phi rows changed since the
+last refresh are read; a full refresh (KEYS_FULL_REFRESH, or no change column) rebuilds it and
+is what drops patients deleted from d_phi.
+
+Local mode: the same counts from exported CSVs (COPY ... TO STDOUT WITH (FORMAT csv, HEADER)),
+read in blocks. Patient IDs are compared as 64-bit hashes: exact up to hash collisions
+(~n^2 / 2^65), or with APPROXIMATE as a HyperLogLog per group (fixed memory, ~0.8% error at
+the default precision) for volumes whose (group, patient) pairs don't fit in memory.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from date_parse import parse_dates
+from db_source import DbSource, _ident
+from excel_output import write_sheets_streaming
+from stage_log import StageLog, stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:          # optional: local mode reads with pandas (quoted "" then reads as missing too)
+    pa = None
+
+# ---------------- CONFIG ----------------
+MODE = "db"                                       # "db" | "local"
+OUTPUT_XLSX = r"C:\path\to\phir_distinct_patients.xlsx"   # <-- change
+RUN_LOG = True                                    # per-stage timings appended to <output>.runlog.jsonl
+
+CASE_CREATED_FROM = "2023-10-01"
+EXCLUDED_STATUSES = ["CANCELLED", "NOT APPROVED"]  # compared upper-cased and trimmed
+
+# ---- database mode ----
+DB_DSN = "postgresql://user@host/dbname"          # <-- change
+CASES_TABLE = "asnfdm.f_pcd2_detailed_report_vw"
+PHI_TABLE = "asnfdm.d_phi"
+KEY_TABLE = "asnfdm.d_phi_patient_keys"           # trimmed d_phi patient IDs (created if missing)
+PHI_CHANGE_COL = None                             # e.g. "updated_at" -> incremental key refresh
+KEYS_FULL_REFRESH = False                         # True -> rebuild the key table (drops deleted patients)
+
+# ---- local mode (exported CSVs) ----
+CASES_CSV = r"C:\path\to\f_pcd2_detailed_report.csv"
+PHI_CSV = r"C:\path\to\d_phi.csv"
+APPROXIMATE = False                               # True -> HyperLogLog counts (fixed memory)
+HLL_PRECISION = 14                                # 2^14 registers per group, ~0.8% standard error
+BLOCK_ROWS = 1_000_000
+
+# ---- columns ----
+COL_SOURCE = "external_source"
+COL_STATUS = "case_status"
+COL_ENROLLMENT = "enrollment_status"
+COL_PATIENT = "patient_id"
+COL_CREATED = "case_created_date"
+COL_COUNT = "distinct_patients"
+SHEET_NAME = "Distinct Patients"
+# ----------------------------------------
+
+GROUP_COLS = [COL_SOURCE, COL_STATUS, COL_ENROLLMENT]
+
+
+# ------------------ Database mode ------------------
+def refresh_patient_keys(db: DbSource, full=False) -> int:
+    """Bring KEY_TABLE up to date with PHI_TABLE (one transaction). Returns keys added."""
+    keys, phi = _ident(KEY_TABLE), _ident(PHI_TABLE)
+    state = _ident(KEY_TABLE + "_state")
+    patient = f"BTRIM(dp.{_ident(COL_PATIENT)})"
+
+    db.execute(f"CREATE TABLE IF NOT EXISTS {keys} (patient_key text PRIMARY KEY)")
+    if not PHI_CHANGE_COL:
+        full = True
+    else:
+        change = _ident(PHI_CHANGE_COL)
+        # watermark typed like the change column; one row
+        db.execute(f"CREATE TABLE IF NOT EXISTS {state} AS "
+                   f"SELECT MAX({change}) AS watermark FROM {phi} WHERE false")
+        db.execute(f"INSERT INTO {state} SELECT NULL WHERE NOT EXISTS (SELECT 1 FROM {state})")
+        if db.query(f"SELECT watermark FROM {state}")["watermark"].isna().all():
+            full = True
+        db.execute(f"CREATE TEMP TABLE key_mark ON COMMIT DROP AS SELECT MAX({change}) AS hi FROM {phi}")
+
+    select = (f"SELECT DISTINCT {patient} FROM {phi} AS dp "
+              f"WHERE NULLIF({patient}, '') IS NOT NULL")
+    if full:
+        db.execute(f"TRUNCATE {keys}")
+        added = db.execute(f"INSERT INTO {keys} (patient_key) {select}")
+    else:
+        # changed rows up to the mark taken above (later ones wait for the next refresh)
+        added = db.execute(
+            f"INSERT INTO {keys} (patient_key) {select} "
+            f"AND dp.{change} > (SELECT watermark FROM {state}) AND dp.{change} <= (SELECT hi FROM key_mark) "
+            f"ON CONFLICT (patient_key) DO NOTHING"
+        )
+    if PHI_CHANGE_COL:
+        db.execute(f"UPDATE {state} SET watermark = COALESCE((SELECT hi FROM key_mark), watermark)")
+    db.conn.commit()
+    db.execute(f"ANALYZE {keys}")
+    db.conn.commit()
+    return added
+
+
+def db_counts(db: DbSource) -> pd.DataFrame:
+    """phir.sql with the anti-join on the trimmed key table."""
+    a = {col: f"a.{_ident(col)}" for col in GROUP_COLS + [COL_PATIENT, COL_CREATED]}
+    patient = f"NULLIF(BTRIM({a[COL_PATIENT]}), '')"
+    groups = ", ".join(a[col] for col in GROUP_COLS)
+    sql = (f"SELECT {groups}, COUNT(DISTINCT {patient}) AS {_ident(COL_COUNT)} "
+           f"FROM {_ident(CASES_TABLE)} AS a "
+           f"WHERE {a[COL_CREATED]} >= CAST(%s AS date) "
+           f"AND UPPER(BTRIM({a[COL_STATUS]})) <> ALL(%s) "
+           f"AND {patient} IS NOT NULL "
+           f"AND NOT EXISTS (SELECT 1 FROM {_ident(KEY_TABLE)} AS k WHERE k.patient_key = BTRIM({a[COL_PATIENT]})) "
+           f"GROUP BY {groups} ORDER BY {groups}")
+    return db.query(sql, (CASE_CREATED_FROM, list(EXCLUDED_STATUSES)), columns=GROUP_COLS + [COL_COUNT])
+
+
+# ------------------ Local mode ------------------
+def read_text_blocks(csv_path, columns, block_rows=BLOCK_ROWS):
+    """
+    Blocks of the named columns as text, as Postgres exported them: only an unquoted empty
+    field is NULL ("" stays an empty string, "NA" stays text). Without pyarrow, "" is missing too.
+    """
+    if pa is not None:
+        reader = pa_csv.open_csv(
+            csv_path,
+            read_options=pa_csv.ReadOptions(block_size=1 << 26),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(columns),
+                column_types={col: pa.string() for col in columns},
+                null_values=[""],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+        for batch in reader:
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(csv_path, usecols=list(columns), dtype=str, keep_default_na=False,
+                           na_values=[""], chunksize=block_rows)
+
+
+def trimmed_ids(s: pd.Series) -> pd.Series:
+    """NULLIF(BTRIM(id), ''): spaces trimmed (BTRIM's default), empty -> missing."""
+    s = s.str.strip(" ")
+    return s.where(s != "")
+
+
+def hash_ids(ids: pd.Series) -> np.ndarray:
+    return pd.util.hash_array(ids.to_numpy(dtype=object))
+
+
+def phi_hashes(csv_path) -> np.ndarray:
+    """Sorted distinct hashes of the trimmed d_phi patient IDs."""
+    parts = []
+    for block in read_text_blocks(csv_path, [COL_PATIENT]):
+        ids = trimmed_ids(block[COL_PATIENT]).dropna()
+        parts.append(np.unique(hash_ids(ids)))
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+
+
+def case_blocks(csv_path, phi):
+    """Per block: group columns + patient hash of the rows phir.sql counts."""
+    created_from = pd.Timestamp(CASE_CREATED_FROM)
+    excluded = {s.upper() for s in EXCLUDED_STATUSES}
+    for block in read_text_blocks(csv_path, GROUP_COLS + [COL_PATIENT, COL_CREATED]):
+        ids = trimmed_ids(block[COL_PATIENT])
+        status = block[COL_STATUS].str.strip(" ").str.upper()
+        keep = (
+            (parse_dates(block[COL_CREATED]) >= created_from)
+            & status.notna() & ~status.isin(excluded)        # NULL NOT IN (...) is not true in SQL either
+            & ids.notna()
+        ).to_numpy()
+        block, ids = block.loc[keep, GROUP_COLS], ids[keep]
+
+        hashes = hash_ids(ids)
+        pos = np.searchsorted(phi, hashes).clip(max=max(len(phi) - 1, 0))
+        in_phi = (phi[pos] == hashes) if len(phi) else np.zeros(len(hashes), dtype=bool)
+        block = block.loc[~in_phi].reset_index(drop=True)
+        block["_hash"] = hashes[~in_phi]
+        yield block
+
+
+def _hll_ranks(hashes, precision):
+    """Register index + rank (position of the first 1 bit after the index bits) per hash."""
+    width = 64 - precision
+    index = (hashes >> np.uint64(width)).astype(np.int64)
+    rest = hashes & np.uint64((1 << width) - 1)
+    # bit length from frexp: rest < 2^50 fits a float64 exactly
+    bit_length = np.frexp(rest.astype(np.float64))[1]
+    return index, (width - bit_length + 1).astype(np.uint8)
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """HyperLogLog cardinality per row of registers (with the small-range correction)."""
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, linear, raw)
+
+
+def local_counts(cases_csv, phi_csv, approximate=False, precision=HLL_PRECISION) -> pd.DataFrame:
+    phi = phi_hashes(phi_csv)
+    groups = pd.DataFrame(columns=GROUP_COLS + ["_group"])      # group columns -> row in registers
+    registers = np.zeros((0, 1 << precision), dtype=np.uint8)
+    pairs = []
+
+    for block in case_blocks(cases_csv, phi):
+        if not approximate:
+            pairs.append(block.drop_duplicates())
+            continue
+        # block groups in first-seen order (missing values a group of their own, as in the merge below),
+        # matched to the running group table; groups not seen before get the next rows
+        keys = block[GROUP_COLS]
+        local = keys.groupby(GROUP_COLS, dropna=False, sort=False).ngroup().to_numpy()
+        seen = keys.drop_duplicates().merge(groups, on=GROUP_COLS, how="left")
+        new = seen["_group"].isna().to_numpy()
+        seen.loc[new, "_group"] = np.arange(len(groups), len(groups) + new.sum())
+        groups = pd.concat([groups, seen.loc[new]], ignore_index=True) if len(groups) else seen
+        codes = seen["_group"].to_numpy(dtype=np.int64)[local]
+        if len(groups) > len(registers):
+            registers = np.vstack([registers, np.zeros((len(groups) - len(registers), 1 << precision), np.uint8)])
+        index, rank = _hll_ranks(block["_hash"].to_numpy(), precision)
+        np.maximum.at(registers, (codes, index), rank)
+
+    if approximate:
+        counts = groups.sort_values("_group")[GROUP_COLS].reset_index(drop=True)
+        counts[COL_COUNT] = np.rint(hll_estimate(registers)).astype(np.int64) if len(counts) else []
+    else:
+        both = pd.concat(pairs, ignore_index=True) if pairs else pd.DataFrame(columns=GROUP_COLS + ["_hash"])
+        counts = (both.groupby(GROUP_COLS, dropna=False, sort=False)["_hash"].nunique()
+                  .rename(COL_COUNT).reset_index())
+    counts = counts.where(counts.notna(), np.nan)
+    return counts.sort_values(GROUP_COLS, na_position="last", kind="stable", ignore_index=True)
+
+
+def main():
+    out = Path(OUTPUT_XLSX)
+    with StageLog(out, "phir_report", enabled=RUN_LOG):
+        if MODE == "db":
+            with DbSource(DB_DSN, readonly=False) as db:
+                with stage("refresh_keys") as st:
+                    st["rows_out"] = refresh_patient_keys(db, full=KEYS_FULL_REFRESH)
+                with stage("query") as st:
+                    counts = db_counts(db)
+                    st["rows_out"] = len(counts)
+        elif MODE == "local":
+            with stage("local_counts") as st:
+                counts = local_counts(Path(CASES_CSV), Path(PHI_CSV), approximate=APPROXIMATE)
+                st["rows_out"] = len(counts)
+        else:
+            raise ValueError(f"MODE must be 'db' or 'local', not {MODE!r}")
+
+        with stage("excel_write", rows_in=len(counts)):
+            write_sheets_streaming(out, {SHEET_NAME: counts})
+
+    note = " (approximate, HyperLogLog)" if MODE == "local" and APPROXIMATE else ""
+    print(f"✅ Done. {len(counts):,} groups written to: {out}{note}")
+
+
+if __name__ == "__main__":
+    main()
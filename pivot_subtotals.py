@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+
+def _level_totals(df: pd.DataFrame, levels, value_col, depth, order):
+    """Group totals for levels[:depth+1], sorted the same way the old per-drug loops sorted them."""
+    keys = list(levels[:depth + 1])
+    agg = df.groupby(keys, as_index=False)[value_col].sum()
+
+    if order == "value":
+        # biggest first (top level), biggest first within parent (lower levels)
+        if depth == 0:
+            agg = agg.sort_values(value_col, ascending=False)
+        else:
+            agg = agg.sort_values(keys[:-1] + [value_col], ascending=[True] * depth + [False])
+    else:
+        agg = agg.sort_values(keys, ascending=[True] * len(keys))
+
+    agg = agg.reset_index(drop=True)
+    agg[f"_rank{depth}"] = np.arange(len(agg), dtype=np.int64)
+    return agg
+
+
+def _label(frame: pd.DataFrame, col, depth, indent):
+    if depth == 0:
+        return frame[col].to_numpy(dtype=object)
+    return (indent * depth + frame[col].astype(str)).to_numpy(dtype=object)
+
+
+def build_subtotal_pivot(
+    df: pd.DataFrame,
+    levels,
+    value_col,
+    order="key",
+    indent="  ",
+    spacer=True,
+    grand_total_label="Grand Total",
+) -> pd.DataFrame:
+    """
+    Creates an Excel-like pivot table output for any number of row levels:
+    - For each top-level value, show its total row
+    - Then each lower level indented under its parent, with its sum
+    - Blank spacer row after each top-level group
+    - Finally grand total row
+
+    order="key"   -> every level sorted ascending by its label
+    order="value" -> every level sorted by sum descending (within its parent)
+
+    Built with groupby/merge/lexsort only (no per-row Python), so cost grows
+    linearly with input rows instead of (top-level values x rows).
+    """
+    levels = list(levels)
+    n_levels = len(levels)
+    columns = levels + [value_col]
+
+    frames = [_level_totals(df, levels, value_col, d, order) for d in range(n_levels)]
+
+    # attach ancestor ranks to every level so children sort under their parent
+    for d in range(1, n_levels):
+        for a in range(d):
+            ranks = frames[a][levels[:a + 1] + [f"_rank{a}"]]
+            frames[d] = frames[d].merge(ranks, on=levels[:a + 1], how="left", sort=False)
+
+    n_top = len(frames[0])
+    big = np.iinfo(np.int64).max
+
+    sort_keys = [[] for _ in range(n_levels)]
+    kinds = []
+    labels = [[] for _ in range(n_levels)]
+    values = []
+
+    def add_block(n, keys, kind, block_labels, block_values):
+        for i in range(n_levels):
+            sort_keys[i].append(keys[i])
+        kinds.append(np.full(n, kind, dtype=np.int64))
+        for i in range(n_levels):
+            labels[i].append(block_labels[i])
+        values.append(block_values)
+
+    # header rows (every level but the last) and leaf rows (last level)
+    for d, frame in enumerate(frames):
+        n = len(frame)
+        keys = [
+            frame[f"_rank{i}"].to_numpy() if i <= d else np.full(n, -1, dtype=np.int64)
+            for i in range(n_levels)
+        ]
+        block_labels = [
+            _label(frame, levels[i], d, indent) if i == d else np.full(n, "", dtype=object)
+            for i in range(n_levels)
+        ]
+        block_values = frame[value_col].astype("int64").to_numpy().astype(object)
+        add_block(n, keys, 0, block_labels, block_values)
+
+    # blank spacer row after each top-level group
+    if spacer:
+        keys = [frames[0]["_rank0"].to_numpy()] + [np.full(n_top, big, dtype=np.int64)] * (n_levels - 1)
+        blanks = [np.full(n_top, "", dtype=object)] * n_levels
+        add_block(n_top, keys, 1, blanks, np.full(n_top, "", dtype=object))
+
+    # grand total row
+    grand_total = int(df[value_col].sum())
+    keys = [np.array([n_top], dtype=np.int64)] + [np.zeros(1, dtype=np.int64)] * (n_levels - 1)
+    gt_labels = [np.array([grand_total_label], dtype=object)] + [np.array([""], dtype=object)] * (n_levels - 1)
+    add_block(1, keys, 0, gt_labels, np.array([grand_total], dtype=object))
+
+    # lexsort: last key is primary -> (rank0, rank1, ..., kind)
+    lex = [np.concatenate(kinds)] + [np.concatenate(sort_keys[i]) for i in reversed(range(n_levels))]
+    order_idx = np.lexsort(lex)
+
+    data = {col: np.concatenate(labels[i])[order_idx] for i, col in enumerate(levels)}
+    data[value_col] = np.concatenate(values)[order_idx]
+
+    # same dtype inference as building the frame from a list of row lists
+    return pd.DataFrame(data, columns=columns).infer_objects()
@@ -0,0 +1,279 @@
+"""
+Resident report worker: libraries and report scripts loaded once, jobs run as they arrive.
+
+    python report_daemon.py                                     # INBOX_DIR / OUTPUT_DIR / PORT below
+    python report_daemon.py --inbox D:\\drop --out-dir D:\\reports --port 8765
+    python report_daemon.py --submit D:\\extracts\\regalo_0930.csv --wait   # send a job to a running daemon
+    python report_daemon.py --run D:\\extracts\\regalo_0930.csv            # one job here, no daemon (cold)
+
+A fresh `python final_regalo.py` starts Python, imports pandas / openpyxl / pyarrow and pays the first
+call of every code path before it reads a row; for a small intraday extract that is most of the run.
+The daemon pays it once:
+- each report script is imported once and reused, its CONFIG pointed at the job's files (the same
+  report types as batch_reports: cumulative / aging / regalo)
+- the text clean-up memo (text_cleanup) stays filled from job to job, and with CACHE_DIR parsed
+  extracts are kept in the frame cache (needs pyarrow), so a re-sent extract is not parsed again
+- WARMUP runs every report once on a small synthetic extract at start-up, so the first real job
+  is warm too
+
+Jobs come from:
+- the drop folder: a file in INBOX_DIR is taken once its size and mtime have not changed for
+  SETTLE_SECONDS (a copy still in progress is left alone). Report type from the file name
+  (batch_reports.REPORT_BY_NAME), workbook <OUTPUT_DIR>\\<stem>.xlsx; afterwards the file is moved to
+  INBOX_DIR\\done (or \\failed)
+- a local socket (PORT, 127.0.0.1 only): one JSON line per job, {"source": ..., "report": ...,
+  "output": ..., "wait": true}; the reply is one JSON line: queued, busy, or with "wait" the result
+
+Jobs run one at a time, in arrival order, from a queue of QUEUE_SIZE. When it is full, dropped files
+stay in the inbox until there is room and socket jobs are answered "busy" (the sender retries later).
+"""
+import argparse
+import io
+import json
+import queue
+import shutil
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from batch_reports import REPORTS, job, load_script, report_for
+from synthetic_extract import write_extract
+
+# ---------------- CONFIG ----------------
+INBOX_DIR = r"C:\path\to\drop"                    # <-- change (or --inbox; None -> socket only)
+OUTPUT_DIR = r"C:\path\to\reports"                # drop-folder / socket jobs without an output
+INBOX_PATTERN = "*.csv"
+POLL_SECONDS = 1.0                                # inbox scan interval
+SETTLE_SECONDS = 2.0                              # unchanged this long -> the file is complete
+PORT = None                                       # e.g. 8765 -> also take jobs on 127.0.0.1:8765
+QUEUE_SIZE = 8                                    # jobs waiting; more -> backpressure (see above)
+CACHE_DIR = None                                  # e.g. r"C:\path\to\csv_cache" -> parsed extracts kept (pyarrow)
+WARMUP = True                                     # run every report once on WARMUP_ROWS at start-up
+WARMUP_ROWS = 2_000
+# ----------------------------------------
+
+
+def log(message):
+    # the real stdout: a job's own prints are captured while it runs
+    print(f"{time.strftime('%H:%M:%S')} {message}", file=sys.__stdout__, flush=True)
+
+
+def job_for(source, report=None, output=None, out_dir=OUTPUT_DIR) -> dict:
+    """A batch_reports job for one extract: report type from the name unless given, default output name."""
+    source = Path(source)
+    report = report or report_for(source)
+    if report is None:
+        raise ValueError(f"No report type for {source.name} (see batch_reports.REPORT_BY_NAME)")
+    return job(report, [source], output or Path(out_dir) / f"{source.stem}.xlsx")
+
+
+def _move(path, folder):
+    folder.mkdir(exist_ok=True)
+    target = folder / path.name
+    if target.exists():
+        target = folder / f"{path.stem}.{time.strftime('%Y%m%d-%H%M%S')}{path.suffix}"
+    shutil.move(str(path), str(target))
+
+
+class ReportDaemon:
+    """The job queue and the warm report modules; run() does one job, serve() runs queued jobs until stopped."""
+
+    def __init__(self, out_dir=OUTPUT_DIR, queue_size=QUEUE_SIZE, cache_dir=CACHE_DIR):
+        self.out_dir = Path(out_dir)
+        self.cache_dir = cache_dir
+        self.jobs = queue.Queue(maxsize=max(1, queue_size))
+        self.stop = threading.Event()
+        self.modules = {}                          # report type -> its script, imported once
+
+    # ---- running jobs ----
+    def module(self, report):
+        if report not in self.modules:
+            self.modules[report] = load_script(REPORTS[report]["script"], f"daemon_{report}")
+        return self.modules[report]
+
+    def run(self, j, cache_dir=None) -> dict:
+        """One job in this process (batch_reports.run_job, with the script module kept between jobs)."""
+        start = time.perf_counter()
+        spec = REPORTS[j["report"]]
+        out = Path(j["output"])
+        try:
+            module = self.module(j["report"])
+            for name, source in zip(spec["sources"], j["sources"]):
+                setattr(module, name, source)
+            module.OUTPUT_XLSX = str(out)
+            module.PIVOT_WORKERS = 1              # a process pool would be started cold for every job
+            module.CSV_CACHE_DIR = cache_dir
+            if getattr(module, "INCREMENTAL_STATE", None):
+                module.INCREMENTAL_STATE = str(out.with_name(out.stem + ".state.pkl"))    # one per output
+
+            out.parent.mkdir(parents=True, exist_ok=True)
+            printed = io.StringIO()
+            with redirect_stdout(printed):
+                module.main()
+            lines = printed.getvalue().strip().splitlines()
+            status, message = "done", lines[-1] if lines else ""
+        except Exception as exc:                  # one bad extract doesn't stop the daemon
+            status, message = "failed", f"{type(exc).__name__}: {exc}"
+        return dict(status=status, output=str(out), seconds=round(time.perf_counter() - start, 3), message=message)
+
+    def warm_up(self, rows=WARMUP_ROWS):
+        """Every report once on a small synthetic extract (imports, first calls, memo), output thrown away."""
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "warmup.csv"
+            write_extract(source, rows)
+            for report in REPORTS:
+                result = self.run(job(report, [source], Path(tmp) / f"warmup_{report}.xlsx"))
+                if result["status"] != "done":
+                    log(f"warm-up {report} failed: {result['message']}")
+        log(f"warmed up in {time.perf_counter() - start:.1f}s")
+
+    def serve(self):
+        while not self.stop.is_set():
+            try:
+                j, done = self.jobs.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            result = self.run(j, self.cache_dir)
+            log(f"[{result['status']}] {j['report']} {j['output']} ({result['seconds']}s) {result['message']}")
+            done(result)
+
+    # ---- drop folder ----
+    def watch(self, inbox, pattern=INBOX_PATTERN):
+        """Queue every settled file in the inbox (blocks while the queue is full: the rest waits in the inbox)."""
+        inbox = Path(inbox)
+        seen = {}                                  # path -> (size, mtime_ns, unchanged since)
+        taken = set()                              # queued / running, moved away when done
+        while not self.stop.is_set():
+            for path in sorted(inbox.glob(pattern)):
+                if path in taken or not path.is_file():
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:                    # moved / deleted meanwhile
+                    continue
+                stamp = (st.st_size, st.st_mtime_ns)
+                if seen.get(path, (None, None, 0))[:2] != stamp:
+                    seen[path] = (*stamp, time.monotonic())
+                    continue
+                if time.monotonic() - seen[path][2] < SETTLE_SECONDS:
+                    continue
+
+                seen.pop(path)
+                try:
+                    j = job_for(path, out_dir=self.out_dir)
+                except ValueError as exc:
+                    log(f"[failed] {path.name}: {exc}")
+                    _move(path, inbox / "failed")
+                    continue
+
+                def done(result, path=path):
+                    _move(path, inbox / ("done" if result["status"] == "done" else "failed"))
+                    taken.discard(path)
+
+                taken.add(path)
+                while not self.stop.is_set():
+                    try:
+                        self.jobs.put((j, done), timeout=POLL_SECONDS)
+                        break
+                    except queue.Full:
+                        continue
+            self.stop.wait(POLL_SECONDS)
+
+    # ---- local socket ----
+    def listen(self, port):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                    j = job_for(request["source"], request.get("report"), request.get("output"), daemon.out_dir)
+                except (ValueError, KeyError, TypeError) as exc:
+                    return self.reply(dict(status="error", message=f"{type(exc).__name__}: {exc}"))
+
+                finished, outcome = threading.Event(), {}
+                done = lambda result: (outcome.update(result), finished.set())
+                try:
+                    daemon.jobs.put_nowait((j, done))
+                except queue.Full:
+                    return self.reply(dict(status="busy", message=f"{daemon.jobs.maxsize} jobs waiting"))
+                if not request.get("wait"):
+                    return self.reply(dict(status="queued", output=j["output"], waiting=daemon.jobs.qsize()))
+                finished.wait()
+                self.reply(outcome)
+
+            def reply(self, message):
+                self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        return server
+
+
+def submit(source, report=None, output=None, wait=False, port=PORT, timeout=None) -> dict:
+    """Send one job to a running daemon; with wait, the reply comes when the job is done."""
+    request = dict(source=str(Path(source).resolve()), report=report,
+                   output=str(Path(output).resolve()) if output else None, wait=wait)
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as conn:
+        conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        return json.loads(conn.makefile("rb").readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident report worker (drop folder / local socket).")
+    parser.add_argument("--inbox", default=INBOX_DIR, help="drop folder to watch")
+    parser.add_argument("--out-dir", default=OUTPUT_DIR, help="workbooks of jobs without an output")
+    parser.add_argument("--port", type=int, default=PORT, help="also take jobs on 127.0.0.1:PORT")
+    parser.add_argument("--no-warmup", action="store_true", default=not WARMUP)
+    parser.add_argument("--submit", metavar="SOURCE", help="send SOURCE to the daemon on --port and exit")
+    parser.add_argument("--run", metavar="SOURCE", help="run SOURCE here, without a daemon, and exit")
+    parser.add_argument("--report", choices=sorted(REPORTS), help="report type (default: from the file name)")
+    parser.add_argument("--output", help="workbook for --submit / --run")
+    parser.add_argument("--wait", action="store_true", help="--submit: wait for the job to finish")
+    args = parser.parse_args()
+
+    if args.submit:
+        if not args.port:
+            raise ValueError("--submit needs the daemon's --port")
+        print(json.dumps(submit(args.submit, args.report, args.output, wait=args.wait, port=args.port)))
+        return
+    if args.run:
+        result = ReportDaemon(args.out_dir).run(job_for(args.run, args.report, args.output, args.out_dir), CACHE_DIR)
+        print(json.dumps(result))
+        return
+
+    if not args.inbox and not args.port:
+        raise ValueError("Nothing to watch: give an inbox (--inbox) and/or a port (--port)")
+    if args.inbox and not Path(args.inbox).is_dir():
+        raise FileNotFoundError(f"Inbox not found: {args.inbox}")
+
+    daemon = ReportDaemon(args.out_dir)
+    if not args.no_warmup:
+        daemon.warm_up()
+
+    server = None
+    if args.port:
+        server = daemon.listen(args.port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    if args.inbox:
+        threading.Thread(target=daemon.watch, args=(args.inbox,), daemon=True).start()
+    log(f"ready: inbox {args.inbox or '-'}, port {args.port or '-'}, queue {daemon.jobs.maxsize} (Ctrl+C stops)")
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        daemon.stop.set()
+    finally:
+        if server is not None:
+            server.shutdown()
+    print("✅ Done. Daemon stopped.")
+
+
+if __name__ == "__main__":
+    main()
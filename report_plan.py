@@ -0,0 +1,114 @@
+"""
+Report plan engine: reports are declared as data and run together.
+
+A plan is a list of report specs (plain dicts):
+
+    dict(
+        name="Report1",                 # used in error messages: "[Report1] Missing columns ..."
+        source=Path("extract.csv"),     # reports with the same file share one parse
+        schema=R1_SCHEMA,               # csv_source schema (required / dates / categories / passthrough)
+        build=build_report_1,           # fn(SharedSource) -> tuple of frames, one per sheet
+        sheets=[SHEET_A, SHEET_B],      # sheet names for the frames build returns, in order
+    )
+
+Each distinct source is parsed once, column clean-ups asked for by several reports
+(SharedSource.derived) run once, and independent reports run in a thread pool.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from csv_source import load_csv, read_csv_header
+from stage_log import stage
+
+
+class SharedSource:
+    """One parsed extract shared by every report that reads it (treat .frame as read-only)."""
+
+    def __init__(self, frame: pd.DataFrame, path=None):
+        self.frame = frame
+        self.path = path            # the CSV it was read from (query backends read it themselves)
+        self._derived = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def derived(self, col, rule) -> pd.Series:
+        """rule(frame[col]), computed once per (col, rule) and shared between reports."""
+        key = (col, rule)
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._derived:
+                self._derived[key] = rule(self.frame[col])
+            return self._derived[key]
+
+
+def merge_schemas(schemas) -> dict:
+    """
+    One read schema for several reports on the same file.
+    Dates are only parsed on load when every report wants them parsed, so a report that
+    shows the raw text (e.g. a passthrough source sheet) still gets the raw text.
+    """
+    schemas = list(schemas)
+    dates = set(schemas[0].get("dates", []))
+    for schema in schemas[1:]:
+        dates &= set(schema.get("dates", []))
+
+    required, categories = [], []
+    for schema in schemas:
+        required += [c for c in schema.get("required", []) + schema.get("dates", []) if c not in required]
+        categories += [c for c in schema.get("categories", []) if c not in categories]
+
+    return dict(
+        required=required,
+        dates=[c for c in required if c in dates],
+        categories=categories,
+        passthrough=any(schema.get("passthrough", True) for schema in schemas),
+        date_fallback=any(schema.get("date_fallback", False) for schema in schemas),
+    )
+
+
+def run_plan(plan, engine="auto", max_workers=None, cache_dir=None, cache_bypass=False) -> dict:
+    """
+    Run every report in the plan; returns {sheet_name: frame} in plan order.
+    engine / cache_dir / cache_bypass are passed on to csv_source.load_csv.
+    """
+    by_source = {}
+    for report in plan:
+        by_source.setdefault(Path(report["source"]).resolve(), []).append(report)
+
+    # validate every report against its file's header before parsing anything
+    headers = {}
+    for path, reports in by_source.items():
+        if not path.exists():
+            raise FileNotFoundError(f"CSV not found: {path}")
+        headers[path] = read_csv_header(path)
+        for report in reports:
+            missing = set(report["schema"]["required"]) - set(headers[path])
+            if missing:
+                raise ValueError(f"[{report['name']}] Missing columns: {missing}. Found: {headers[path]}")
+
+    def load(path):
+        schema = merge_schemas(r["schema"] for r in by_source[path])
+        with stage(f"read {path.name}") as st:
+            df = load_csv(path, schema, engine=engine, header=headers[path],
+                          cache_dir=cache_dir, cache_bypass=cache_bypass)
+            st["rows_out"] = len(df)
+        return path, SharedSource(df, path=path)
+
+    def build(report):
+        src = sources[Path(report["source"]).resolve()]
+        with stage(f"build {report['name']}", rows_in=len(src.frame)):
+            return report["build"](src)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        sources = dict(pool.map(load, by_source))
+        results = list(pool.map(build, plan))
+
+    sheets = {}
+    for report, frames in zip(plan, results):
+        for sheet_name, frame in zip(report["sheets"], frames):
+            sheets[sheet_name] = frame
+    return sheets
@@ -1,23 +1,39 @@
-def build_r2_sheet2_pivot(df_sheet1: pd.DataFrame) -> pd.DataFrame:
-    df = df_sheet1.copy()
+from aging import BUCKET_INDEX_COL, bucket_rollups, case_bucket_pivot
+from excel_output import write_sheets_streaming
+from text_cleanup import clean_series, clean_text
 
-    df[R2_COL_DRUG] = df[R2_COL_DRUG].astype(str).str.strip()
-    df[R2_COL_STATUS] = df[R2_COL_STATUS].apply(r2_clean_text)
-    df[R2_COL_REASON] = df[R2_COL_REASON].apply(r2_clean_text)
+R2_OUTLINE_HIDE_FROM = 3      # outline level shown collapsed: 3 = case rows (drug/status/reason totals open)
 
-    # keep case_id as text (don’t title-case it)
-    df[R2_COL_CASE_ID] = df[R2_COL_CASE_ID].astype(str).str.strip()
 
-    # numeric versions of buckets for sums
-    for name, _, _ in R2_BUCKETS:
-        df[name] = df[name].apply(lambda v: 1 if v == 1 else 0)
+def build_r2_sheet2_pivot(df_sheet1: pd.DataFrame) -> pd.DataFrame:
+    df = pd.DataFrame({
+        R2_COL_DRUG: df_sheet1[R2_COL_DRUG].astype(str).str.strip(),
+        R2_COL_STATUS: clean_series(df_sheet1[R2_COL_STATUS], clean_text),
+        R2_COL_REASON: clean_series(df_sheet1[R2_COL_REASON], clean_text),
+        # keep case_id as text (don’t title-case it)
+        R2_COL_CASE_ID: df_sheet1[R2_COL_CASE_ID].astype(str).str.strip(),
+        BUCKET_INDEX_COL: df_sheet1[BUCKET_INDEX_COL],
+    })
 
-    pivot = pd.pivot_table(
+    # one row per case: int-coded keys + lexsort, keys come back as categoricals
+    return case_bucket_pivot(
         df,
-        index=[R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, R2_COL_CASE_ID],  # ✅ added
-        values=[b[0] for b in R2_BUCKETS],
-        aggfunc="sum",
-        fill_value=0
-    ).sort_index(level=[0, 1, 2, 3], ascending=[True, True, True, True]).reset_index()
+        [R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, R2_COL_CASE_ID],  # ✅ added
+        R2_BUCKETS,
+    )
+
+
+def build_r2_sheet2_outline(pivot: pd.DataFrame):
+    # drug / status / reason subtotals summed from the case rows, + outline level per row
+    return bucket_rollups(pivot, [R2_COL_DRUG, R2_COL_STATUS, R2_COL_REASON, R2_COL_CASE_ID], R2_BUCKETS)
+
 
-    return pivot
+def write_r2_sheet2(out_path: Path, pivot: pd.DataFrame):
+    # grouped rows in Excel: drug > status > reason > cases, case rows collapsed
+    sheet2, levels = build_r2_sheet2_outline(pivot)
+    write_sheets_streaming(
+        out_path, {R2_SHEET2: sheet2},
+        total_sheets={R2_SHEET2: "Grand Total"},
+        outlines={R2_SHEET2: (levels, R2_OUTLINE_HIDE_FROM)},
+        freeze_cell="A2",
+    )
@@ -0,0 +1,213 @@
+"""
+Per-stage instrumentation: wall / CPU time, RSS, peak RSS growth and row counts per stage,
+appended as JSON lines next to the output workbook (<output>.runlog.jsonl, one line per stage
+as it finishes + a "total" line per run).
+
+    with StageLog(out_path, "All_pending"):
+        with stage("read") as st:
+            df = load_csv(...)
+            st["rows_out"] = len(df)
+
+stage() does nothing outside an active StageLog, so shared modules can mark their own stages
+(nested stages get their own line). cpu_s is process CPU time (all threads).
+
+Profiling one stage (by name, every time it runs):
+  PIVOT_PROFILE_STAGE=pivot                          -> cProfile: <output>.pivot.prof + top functions
+  PIVOT_PROFILE_STAGE=pivot PIVOT_PROFILE_MODE=tracemalloc -> top allocation sites + traced peak
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:          # Windows: no ru_maxrss (and no /proc) -> GetProcessMemoryInfo below
+    resource = None
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    class _MemoryCounters(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS (psapi.h)
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+PROFILE_STAGE_ENV = "PIVOT_PROFILE_STAGE"
+PROFILE_MODE_ENV = "PIVOT_PROFILE_MODE"      # "cprofile" (default) | "tracemalloc"
+PROFILE_TOP = 20
+SUFFIX = ".runlog.jsonl"
+
+_active = None
+
+
+def _proc_status_mb(field):
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _working_set_mb(field):
+    # Windows: working set (RSS) / its peak from GetProcessMemoryInfo; None anywhere else or on failure
+    if sys.platform != "win32":
+        return None
+    try:
+        kernel32, psapi = ctypes.WinDLL("kernel32"), ctypes.WinDLL("psapi")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(_MemoryCounters), wintypes.DWORD]
+        counters = _MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+    except (OSError, AttributeError):
+        return None
+    return getattr(counters, field) / 2**20
+
+
+def rss_mb():
+    rss = _proc_status_mb("VmRSS")
+    return rss if rss is not None else _working_set_mb("WorkingSetSize")
+
+
+def peak_rss_mb():
+    """Peak RSS of this process: VmHWM (reset on exec, unlike ru_maxrss on Linux); PeakWorkingSetSize on Windows."""
+    peak = _proc_status_mb("VmHWM")
+    if peak is None:
+        peak = _working_set_mb("PeakWorkingSetSize")
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 2**20 if sys.platform == "darwin" else peak / 1024     # bytes on macOS, KB elsewhere
+    return peak
+
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
+
+
+class StageLog:
+    """Active run: stage() records go to <out_path stem>.runlog.jsonl next to the workbook."""
+
+    def __init__(self, out_path, script, enabled=True):
+        out_path = Path(out_path)
+        self.path = out_path.with_name(out_path.stem + SUFFIX)
+        self.script = script
+        self.enabled = enabled
+        self.run_id = uuid.uuid4().hex[:12]
+        self.profile_stage = os.environ.get(PROFILE_STAGE_ENV) or None
+        self.profile_mode = os.environ.get(PROFILE_MODE_ENV, "cprofile").lower()
+        self.profile_base = out_path.with_name(out_path.stem)
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        self._stage = stage("total")
+        self._stage.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        try:
+            self._stage.__exit__(exc_type, exc, tb)
+        finally:
+            _active = self._previous
+        return False
+
+    def write(self, record: dict):
+        if not self.enabled:
+            return
+        record = dict(run_id=self.run_id, script=self.script, **record)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+def _profile_start(log, name):
+    if log.profile_stage != name:
+        return None
+    if log.profile_mode == "tracemalloc":
+        tracemalloc.start()
+        return "tracemalloc"
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _profile_stop(log, name, profiler, record):
+    if profiler is None:
+        return
+    if profiler == "tracemalloc":
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        record["tracemalloc_peak_mb"] = round(peak / 2**20, 1)
+        record["top_allocations"] = [
+            dict(where=str(s.traceback), size_mb=round(s.size / 2**20, 2), count=s.count)
+            for s in snapshot.statistics("lineno")[:PROFILE_TOP]
+        ]
+        return
+
+    profiler.disable()
+    prof_path = Path(f"{log.profile_base}.{name.replace(' ', '_')}.prof")
+    profiler.dump_stats(prof_path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    record["profile"] = str(prof_path)
+    record["top_functions"] = [line for line in text.getvalue().splitlines() if line.strip()]
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Time the block as one stage; set st["rows_out"] (and rows_in if not given) inside it (other keys are logged too)."""
+    record = dict(rows_in=rows_in, rows_out=None)
+    log = _active
+    if log is None or not log.enabled:
+        yield record
+        return
+
+    peak_before = peak_rss_mb()
+    started = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    profiler = _profile_start(log, name)
+    error = None
+    try:
+        yield record
+    except BaseException as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        peak_after = peak_rss_mb()
+        out = dict(
+            stage=name,
+            started=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            wall_s=round(wall, 4),
+            cpu_s=round(cpu, 4),
+            rss_mb=_round(rss_mb()),
+            peak_rss_mb=_round(peak_after),
+            peak_rss_delta_mb=_round(None if peak_before is None else peak_after - peak_before),
+            rows_in=record.get("rows_in"),
+            rows_out=record.get("rows_out"),
+            thread=threading.current_thread().name,
+        )
+        out.update({k: v for k, v in record.items() if k not in out})      # extra fields set on st
+        if error:
+            out["error"] = error
+        _profile_stop(log, name, profiler, out)
+        log.write(out)
@@ -0,0 +1,116 @@
+"""
+Synthetic pending-case extracts with the columns 1st_cumulative.py, All_pending.py and
+final_regalo.py read, shaped like the real ones:
+- skewed drug / reason mix (a few values carry most rows)
+- messy text: random casing, leading/trailing and doubled inner spaces, blanks, "nan"
+- missing / unparseable / future dates, counts with blanks
+- a handful of passthrough columns the reports only copy to the source sheets
+
+    python synthetic_extract.py 100000 extract.csv
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SEED = 7
+CHUNK_ROWS = 500_000                 # rows generated + written per chunk (bounds memory at 5M)
+
+DRUGS = ["Drug A", "Drug B", "Drug C", "Drug D", "Drug E", "Drug F", "Drug G", "Drug H"]
+STATUSES = ["Pending", "On Hold", "Pending Review", "Awaiting Documents", "Escalated"]
+REASONS = [
+    "Missing Info", "PA Required", "Benefit Check", "Awaiting Prescriber", "Patient Unreachable",
+    "Insurance Denied", "Copay Assistance", "Appeal In Progress", "Address Verification",
+    "Duplicate Referral", "Shipping Hold", "Clinical Review",
+]
+PAYER_TYPES = ["Commercial", "Medicare", "Medicaid", "Cash"]
+STATES = ["CA", "TX", "NY", "FL", "IL", "PA", "OH", "GA", "NC", "MI"]
+
+# share of rows whose text is messed up, and the kinds of mess
+MESSY_SHARE = 0.3
+MESS = [
+    lambda s: s.lower(),
+    lambda s: s.upper(),
+    lambda s: f" {s}",
+    lambda s: f"{s}  ",
+    lambda s: s.replace(" ", "  "),
+]
+
+
+def zipf_weights(n, s=1.1):
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def messy_choice(rng, values, n_rows, weights=None):
+    """Values picked with the given weights; MESSY_SHARE of them in a messed-up spelling."""
+    variants = np.array([[v] + [f(v) for f in MESS] for v in values], dtype=object)
+    base = rng.choice(len(values), n_rows, p=weights)
+    kind = np.where(rng.random(n_rows) < MESSY_SHARE, rng.integers(1, len(MESS) + 1, n_rows), 0)
+    return variants[base, kind]
+
+
+def date_strings(rng, n_rows, today, with_time, missing_share):
+    """Dates 0-400 days back (1% a few days ahead), some missing, a few unparseable."""
+    offsets = rng.integers(0, 400, n_rows)
+    offsets[rng.random(n_rows) < 0.01] = -rng.integers(1, 10)
+    days = (today - pd.to_timedelta(np.arange(-10, 400), unit="D")).strftime("%Y-%m-%d").to_numpy(dtype=str)
+    out = days[offsets + 10]
+    if with_time:
+        minutes = np.array([f" {m // 60:02d}:{m % 60:02d}:00" for m in range(24 * 60)])
+        out = np.char.add(out, minutes[rng.integers(0, 24 * 60, n_rows)])
+
+    out = out.astype(object)
+    out[rng.random(n_rows) < missing_share] = np.nan
+    out[rng.random(n_rows) < 0.002] = "TBD"
+    return out
+
+
+def make_extract(n_rows, seed=SEED, start_id=0, today=None) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    today = today if today is not None else pd.Timestamp.today().normalize()
+
+    status = messy_choice(rng, STATUSES, n_rows, zipf_weights(len(STATUSES)))
+    status[rng.random(n_rows) < 0.02] = ""
+    status[rng.random(n_rows) < 0.01] = np.nan
+
+    reason = messy_choice(rng, REASONS, n_rows, zipf_weights(len(REASONS)))
+    reason[rng.random(n_rows) < 0.03] = np.nan
+    reason[rng.random(n_rows) < 0.01] = ""
+    reason[rng.random(n_rows) < 0.005] = "nan"
+
+    count = rng.choice([1, 1, 1, 1, 2, 2, 3, 5], n_rows).astype(float)
+    count[rng.random(n_rows) < 0.01] = np.nan
+
+    return pd.DataFrame({
+        "case_id": np.char.add("C", np.char.zfill((start_id + np.arange(n_rows)).astype(str), 9)),
+        "drug": messy_choice(rng, DRUGS, n_rows, zipf_weights(len(DRUGS), s=1.4)),
+        "case_sub_status": status,
+        "case_sub_status_reason_code": reason,
+        "case_count": count,
+        "file_receipt_date_time": date_strings(rng, n_rows, today, with_time=True, missing_share=0.2),
+        "eligibility_start_date": date_strings(rng, n_rows, today, with_time=False, missing_share=0.3),
+        "payer_type": rng.choice(PAYER_TYPES, n_rows, p=[0.55, 0.25, 0.15, 0.05]),
+        "patient_state": rng.choice(STATES, n_rows),
+        "vendor": "REGALORX",
+        "priority": rng.integers(1, 4, n_rows),
+        "copay_amount": np.round(rng.gamma(2.0, 40.0, n_rows), 2),
+    })
+
+
+def write_extract(path, n_rows, seed=SEED, chunk_rows=CHUNK_ROWS):
+    """Write n_rows to path in chunks (chunk i uses seed + i, so a size is always the same file)."""
+    path = Path(path)
+    today = pd.Timestamp.today().normalize()
+    for i, start in enumerate(range(0, max(n_rows, 1), chunk_rows)):
+        chunk = make_extract(min(chunk_rows, n_rows - start), seed=seed + i, start_id=start, today=today)
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    out = sys.argv[2] if len(sys.argv) > 2 else f"synthetic_{rows}.csv"
+    write_extract(out, rows)
+    print(f"✅ Done. {rows:,} rows written to: {out}")
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+# Cleaned value per (rule, unknown) -> {(type, raw value): cleaned}.
+# Lives for the whole process, so every report / run after the first reuses it.
+_CACHE = {}
+MAX_CACHE_SIZE = 100_000         # per rule; cleared when exceeded
+
+
+def clean_text(x, unknown="Unknown"):
+    """Normalize text so Excel-like pivot grouping happens (case-insensitive + trims)."""
+    if pd.isna(x):
+        return unknown
+    s = str(x).strip()
+    if s == "" or s.lower() == "nan":
+        return unknown
+    s = " ".join(s.split())      # remove extra internal spaces
+    s = s.lower()
+    return s.title()             # nice report display
+
+
+def clean_reason(text, unknown="Unknown"):
+    """Report 1 reason rule: only real missing values become unknown ("" / "nan" text is kept)."""
+    if pd.isna(text):
+        return unknown
+    text = str(text).strip()
+    text = " ".join(text.split())  # remove extra spaces
+    text = text.lower()            # normalize case
+    return text.title()            # convert to Title Case
+
+
+def clean_series(s: pd.Series, rule=clean_text, unknown="Unknown") -> pd.Series:
+    """
+    Same result as s.apply(rule), but the rule only runs once per distinct value
+    (factorize / category codes), then one take maps the cleaned values back to the rows.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy()
+        uniques = s.cat.categories
+    elif s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) not in ("string", "empty"):
+        # mixed Python types: 3 and 3.0 factorize together but print differently
+        return s.apply(rule, unknown=unknown)
+    else:
+        codes, uniques = pd.factorize(s)     # missing -> code -1
+
+    memo = _CACHE.setdefault((rule, unknown), {})
+    if len(memo) > MAX_CACHE_SIZE:
+        memo.clear()
+
+    # last slot holds the missing-value result, so code -1 lands on it
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        key = (type(value), value)
+        cleaned = memo.get(key)
+        if cleaned is None:
+            cleaned = memo[key] = rule(value, unknown)
+        mapped[i] = cleaned
+    mapped[-1] = rule(np.nan, unknown)
+
+    return pd.Series(mapped[codes], index=s.index, name=s.name)
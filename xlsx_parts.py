@@ -0,0 +1,732 @@
+"""
+Sheets replaced inside an existing workbook without loading it.
+
+An .xlsx is a zip of XML parts: xl/workbook.xml lists the sheets (name -> relationship id, in tab
+order), xl/_rels/workbook.xml.rels maps each id to its part (xl/worksheets/sheetN.xml),
+[Content_Types].xml types every part, and cells point into xl/styles.xml by index (s="N").
+
+replace_sheets() streams our sheets into a scratch workbook (write_sheets_streaming, same look as a
+new file) and then rebuilds the target zip:
+- a sheet already in the file keeps its part, relationship id and tab position; only the part's
+  content is swapped, so sheet order and defined names stay valid
+- a new sheet is added after the others (like ExcelWriter's append mode)
+- the scratch workbook's cell formats are added to styles.xml (formats already there are reused)
+  and the swapped sheets' s="N" indexes are renumbered to match
+- every other part (other teams' sheets, shared strings, pivot caches, ...) is copied as is,
+  streamed through zipfile: nothing but the small package parts is parsed
+
+Dropped: xl/calcChain.xml (order of formula cells, rebuilt by Excel; the workbook is flagged for a
+full recalculation on open, as openpyxl does) and parts only the replaced sheets used (drawings,
+comments, tables). docProps/app.xml keeps its old sheet list; Excel rewrites it on save.
+
+Frames over Excel's row limit go on numbered sheets ("name (2)", ...; excel_output.sheet_specs);
+a numbered sheet left over from a longer earlier run is removed when its sheet is replaced.
+
+write_sheets_parallel() serializes the sheets in worker processes: each writes a scratch workbook
+with every sheet opened in the same order (so the same cell formats) but only its own sheet's rows,
+and the first scratch file gets the other sheets' parts copied in.
+
+add_pivot_tables() adds native PivotTables the same way: a table definition on the pivot sheet and a
+cache definition over the source sheet's range, with no cached records (Excel fills both from the
+sheet when the file is opened), so the package carries the case rows once.
+"""
+import os
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import ExitStack
+from copy import copy
+from functools import partial
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl import Workbook
+from openpyxl.pivot.cache import CacheDefinition, CacheField, CacheSource, SharedItems, WorksheetSource
+from openpyxl.pivot.table import (DataField, FieldItem, Location, PivotField, PivotTableStyle, RowColField,
+                                  TableDefinition)
+from openpyxl.utils import get_column_letter
+from openpyxl.xml.functions import tostring
+
+from excel_output import EXCEL_MAX_ROWS, open_sheet, shard_name, sheet_specs, write_sheets_streaming
+from parallel_pivot import _pool, _receive, _share
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+DOC_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+WORKSHEET_REL = DOC_REL_NS + "/worksheet"
+CALC_CHAIN_REL = DOC_REL_NS + "/calcChain"
+WORKSHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+PIVOT_TABLE_REL = TableDefinition.rel_type
+PIVOT_CACHE_REL = CacheDefinition.rel_type
+
+CONTENT_TYPES = "[Content_Types].xml"
+COPY_BLOCK = 1 << 20                  # bytes of sheet XML renumbered at a time
+PARALLEL_MIN_ROWS = 200_000           # fewer rows in all -> sheets written in-process (pool start-up > gain)
+
+# s="N" on cells / rows, style="N" on columns: indexes into styles.xml cellXfs
+_STYLE_REF = re.compile(rb'(<(?:c|row)\b[^>]*?\ss="|<col\b[^>]*?\sstyle=")(\d+)"')
+
+
+# ------------------ Package parts ------------------
+def _rels_path(part):
+    """Relationships part of `part` ("" = the package itself): xl/workbook.xml -> xl/_rels/workbook.xml.rels"""
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", name + ".rels")
+
+
+def _resolve(part, target):
+    # relationship targets are relative to the source part's folder, or absolute from the package root
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+
+
+def _relationships(zf, part) -> list:
+    """(id, type, target part) of the internal relationships of `part` ([] when it has none)."""
+    path = _rels_path(part)
+    if path not in zf.NameToInfo:
+        return []
+    rels = []
+    for rel in ET.fromstring(zf.read(path)).iter(f"{{{PKG_REL_NS}}}Relationship"):
+        if rel.get("TargetMode") != "External":
+            rels.append((rel.get("Id"), rel.get("Type"), _resolve(part, rel.get("Target"))))
+    return rels
+
+
+def _reachable(zf, skip=()) -> set:
+    """Parts reachable from the package relationships, not following the rels of the parts in `skip`."""
+    seen, todo = set(), [""]
+    while todo:
+        part = todo.pop()
+        if part in skip:
+            continue
+        for _, _, target in _relationships(zf, part):
+            if target not in seen:
+                seen.add(target)
+                todo.append(target)
+    return seen
+
+
+def _workbook_part(zf):
+    for _, rel_type, target in _relationships(zf, ""):
+        if rel_type == DOC_REL_NS + "/officeDocument":
+            return target
+    raise ValueError(f"{zf.filename} is not an Excel workbook (no officeDocument relationship)")
+
+
+def _sheets(zf, workbook):
+    """[(name, relationship id, part, relationship type)] in tab order."""
+    root = ET.fromstring(zf.read(workbook))
+    if root.tag != f"{{{MAIN_NS}}}workbook":
+        raise ValueError(f"{zf.filename}: unsupported workbook format ({root.tag})")
+    rels = {rel_id: (rel_type, target) for rel_id, rel_type, target in _relationships(zf, workbook)}
+    out = []
+    for sheet in root.iter(f"{{{MAIN_NS}}}sheet"):
+        rel_id = sheet.get(f"{{{DOC_REL_NS}}}id")
+        rel_type, target = rels[rel_id]
+        out.append((sheet.get("name"), rel_id, target, rel_type))
+    return out
+
+
+def _sheet_styles(zf):
+    for _, rel_type, target in _relationships(zf, _workbook_part(zf)):
+        if rel_type == DOC_REL_NS + "/styles":
+            return target
+    raise ValueError(f"{zf.filename} has no styles part")
+
+
+def _without(text, tag, attr, value):
+    # drop <tag ... attr="value" .../> (self-closing entries: relationships, content type overrides)
+    return re.sub(rf'<{tag}\b(?=[^>]*\s{attr}="{re.escape(value)}")[^>]*/>', "", text)
+
+
+def _insert_before(text, end_tag, markup, part):
+    at = text.rfind(end_tag)
+    if at < 0:
+        raise ValueError(f"Unsupported layout in {part}: no {end_tag}")
+    return text[:at] + markup + text[at:]
+
+
+def _drop_sheets(book, rel_ids, positions):
+    """Remove <sheet> entries from workbook.xml: sheet-scoped names and the active tab follow the tab positions."""
+    for rel_id in rel_ids:
+        book = re.sub(rf'<sheet\b[^>]*?:id="{re.escape(rel_id)}"[^>]*/>', "", book)
+
+    def shifted(k):
+        return k - sum(p < k for p in positions)
+
+    def local_name(m):
+        k = int(m.group(1))
+        return "" if k in positions else m.group(0).replace(f'localSheetId="{k}"', f'localSheetId="{shifted(k)}"', 1)
+
+    book = re.sub(r'<definedName\b[^>]*?\slocalSheetId="(\d+)"[^>]*>.*?</definedName>', local_name, book, flags=re.S)
+    book = re.sub(r"<definedNames>\s*</definedNames>|<definedNames\s*/>", "", book)
+    left = len(re.findall(r"<sheet\b", book))
+    for attr in ("activeTab", "firstSheet"):
+        book = re.sub(rf'\s{attr}="(\d+)"',
+                      lambda m: f' {attr}="{min(shifted(int(m.group(1))), max(left - 1, 0))}"', book)
+    return book
+
+
+def _full_calc_on_load(text):
+    """Set fullCalcOnLoad on <calcPr> (added after the elements that precede it when missing)."""
+    m = re.search(r"<calcPr\b[^>]*?(/?)>", text)
+    if m:
+        tag = re.sub(r'\sfullCalcOnLoad="[^"]*"', "", m.group(0))
+        tag = tag[:-2 if m.group(1) else -1].rstrip() + ' fullCalcOnLoad="1"' + ("/>" if m.group(1) else ">")
+        return text[:m.start()] + tag + text[m.end():]
+    for name in ("definedNames", "externalReferences", "functionGroups", "sheets"):
+        m = re.search(rf"</{name}>|<{name}\b[^>]*/>", text)
+        if m:
+            return text[:m.end()] + '<calcPr fullCalcOnLoad="1"/>' + text[m.end():]
+    return text
+
+
+# ------------------ styles.xml ------------------
+def _local(name):
+    return name.rsplit("}", 1)[-1]
+
+
+def _markup(elem) -> str:
+    """An entry of styles.xml as markup in the default namespace (also its identity when merging)."""
+    attrs = "".join(f" {_local(k)}={quoteattr(v)}" for k, v in elem.attrib.items())
+    inner = escape(elem.text or "") + "".join(_markup(child) for child in elem)
+    tag = _local(elem.tag)
+    return f"<{tag}{attrs}>{inner}</{tag}>" if inner else f"<{tag}{attrs}/>"
+
+
+def _entries(root, collection) -> list:
+    node = root.find(f"{{{MAIN_NS}}}{collection}")
+    return [] if node is None else list(node)
+
+
+def _add_entries(text, collection, markups, total):
+    """Append entries to a collection of styles.xml (numFmts is created when missing) and fix its count."""
+    m = re.search(rf"<{collection}\b[^>]*?(/?)>", text)
+    if m is None:
+        if collection != "numFmts":
+            raise ValueError(f"Unsupported layout in styles.xml: no <{collection}>")
+        root = re.search(r"<styleSheet\b[^>]*>", text)      # numFmts is the first child
+        return text[:root.end()] + f'<numFmts count="{total}">{"".join(markups)}</numFmts>' + text[root.end():]
+
+    head = re.sub(r'\scount="\d*"', f' count="{total}"', m.group(0))
+    if m.group(1):                                           # <numFmts count="0"/>
+        head = head[:-2].rstrip() + ">"
+        return text[:m.start()] + head + "".join(markups) + f"</{collection}>" + text[m.end():]
+    end = text.index(f"</{collection}>", m.end())
+    return text[:m.start()] + head + text[m.end():end] + "".join(markups) + text[end:]
+
+
+def merge_styles(target: bytes, source: bytes):
+    """
+    Add the cell formats (cellXfs with their fonts, fills, borders and number formats) of the
+    `source` styles.xml to the `target` one; identical entries already in target are reused,
+    so refreshing the same sheets every day does not grow the file.
+    Returns (new styles.xml, target cellXfs index for every source cellXfs index).
+    """
+    target_root, source_root = ET.fromstring(target), ET.fromstring(source)
+    if target_root.tag != f"{{{MAIN_NS}}}styleSheet" or not re.search(rb"<styleSheet\b", target):
+        raise ValueError("Unsupported styles.xml format (only the default SpreadsheetML namespace)")
+    text = target.decode("utf-8")
+
+    # number formats: custom ids (164+) matched by format code
+    ids = {e.get("formatCode"): int(e.get("numFmtId")) for e in _entries(target_root, "numFmts")}
+    next_id = max([163, *ids.values()]) + 1
+    fmt_map, new_fmts = {}, []
+    for e in _entries(source_root, "numFmts"):
+        code = e.get("formatCode")
+        if code not in ids:
+            ids[code], next_id = next_id, next_id + 1
+            new_fmts.append(f'<numFmt numFmtId="{ids[code]}" formatCode={quoteattr(code)}/>')
+        fmt_map[int(e.get("numFmtId"))] = ids[code]
+    if new_fmts:
+        text = _add_entries(text, "numFmts", new_fmts, len(_entries(target_root, "numFmts")) + len(new_fmts))
+
+    def merge(collection, entries):
+        have = _entries(target_root, collection)
+        index = {}
+        for i, e in enumerate(have):
+            index.setdefault(_markup(e), i)
+        mapping, added = [], []
+        for e in entries:
+            key = _markup(e)
+            if key not in index:
+                index[key] = len(have) + len(added)
+                added.append(key)
+            mapping.append(index[key])
+        return mapping, added
+
+    ref_maps = {}
+    for collection, attr in (("fonts", "fontId"), ("fills", "fillId"), ("borders", "borderId")):
+        ref_maps[attr], added = merge(collection, _entries(source_root, collection))
+        if added:
+            text = _add_entries(text, collection, added, len(_entries(target_root, collection)) + len(added))
+
+    xfs = []
+    for xf in _entries(source_root, "cellXfs"):
+        xf = copy(xf)
+        for attr, mapping in ref_maps.items():
+            if xf.get(attr) is not None:
+                xf.set(attr, str(mapping[int(xf.get(attr))]))
+        if int(xf.get("numFmtId", 0)) in fmt_map:
+            xf.set("numFmtId", str(fmt_map[int(xf.get("numFmtId"))]))
+        xfs.append(xf)
+    xf_map, added = merge("cellXfs", xfs)
+    if added:
+        text = _add_entries(text, "cellXfs", added, len(_entries(target_root, "cellXfs")) + len(added))
+    return text.encode("utf-8"), xf_map
+
+
+# ------------------ Copying members ------------------
+def _copy_entry(zin, zout, info):
+    """Copy one member as is (same name, date, attributes and compression), streamed a block at a time."""
+    out = zipfile.ZipInfo(info.filename, info.date_time)
+    out.compress_type = info.compress_type
+    out.external_attr = info.external_attr
+    with zin.open(info) as src, zout.open(out, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+        while block := src.read(COPY_BLOCK):
+            dst.write(block)
+
+
+def _write_package(zin, out_path, parts: dict, dropped=()):
+    """
+    Rebuild the package next to out_path and move it over out_path: members in `parts` get new
+    content (bytes / str, or fn(zout, name) writing it; names not in zin are added at the end),
+    members in `dropped` are left out, every other member is copied as is.
+    """
+    out_path = Path(out_path)
+    tmp_path = out_path.with_name(out_path.stem + ".swap.tmp" + out_path.suffix)
+
+    def write(zout, name):
+        content = parts[name]
+        if callable(content):
+            content(zout, name)
+        else:
+            zout.writestr(name, content)
+
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename in dropped:
+                    continue
+                if info.filename in parts:
+                    write(zout, info.filename)
+                else:
+                    _copy_entry(zin, zout, info)
+            for name in parts:
+                if name not in zin.NameToInfo:
+                    write(zout, name)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    zin.close()                               # Windows: the old file can't be replaced while open
+    os.replace(tmp_path, out_path)
+
+
+def _copy_sheet(zsrc, src_part, zout, part, xf_map):
+    """Stream a scratch sheet into the output with its style indexes renumbered to the target's."""
+    table = [str(i).encode() for i in xf_map]
+
+    def renumber(m):
+        return m.group(1) + table[int(m.group(2))] + b'"'
+
+    with zsrc.open(src_part) as src, zout.open(part, "w") as dst:
+        rest = b""
+        while True:
+            block = src.read(COPY_BLOCK)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b">") + 1           # a tag never spans the cut
+            rest = block[cut:]
+            dst.write(_STYLE_REF.sub(renumber, block[:cut]))
+        dst.write(_STYLE_REF.sub(renumber, rest))
+
+
+# ------------------ Swapping sheets ------------------
+def swap_sheets(out_path, sheets_path, names=None, shards_of=()):
+    """
+    Put the sheets of the workbook at `sheets_path` (written by openpyxl, e.g. write_sheets_streaming)
+    into the workbook at `out_path`: same-named sheets replaced in place, the others added at the end.
+    names: sheets to take (default: all of them).
+    shards_of: sheets written as numbered sheets (excel_output.shard_name); the file's numbered
+    sheets of these that are not among `names` are removed (the frame got shorter).
+    """
+    with zipfile.ZipFile(sheets_path) as zsrc, zipfile.ZipFile(out_path) as zin:
+        src_sheets = {name: part for name, _, part, _ in _sheets(zsrc, _workbook_part(zsrc))}
+        names = list(src_sheets) if names is None else list(names)
+        missing = [name for name in names if name not in src_sheets]
+        if missing:
+            raise ValueError(f"Sheets {missing} not found in {sheets_path}")
+
+        workbook = _workbook_part(zin)
+        workbook_rels = _rels_path(workbook)
+        existing = {name.lower(): (rel_id, part, rel_type) for name, rel_id, part, rel_type in _sheets(zin, workbook)}
+        rels = _relationships(zin, workbook)
+        styles = next((target for _, rel_type, target in rels if rel_type == DOC_REL_NS + "/styles"), None)
+        if styles is None or styles not in zin.NameToInfo:
+            raise ValueError(f"{out_path} has no styles part")
+        calc_chain = [(rel_id, target) for rel_id, rel_type, target in rels if rel_type == CALC_CHAIN_REL]
+
+        # ---- where each sheet goes ----
+        swapped = {}                          # target part -> scratch part
+        added = []                            # (name, part, relationship id)
+        used_parts = set(zin.NameToInfo)
+        used_ids = {rel_id for rel_id, _, _ in rels}
+        folder = posixpath.join(posixpath.dirname(workbook), "worksheets")
+        for name in names:
+            found = existing.get(name.lower())
+            if found is not None:
+                _, part, rel_type = found
+                if rel_type != WORKSHEET_REL:
+                    raise ValueError(f"'{name}' in {out_path} is not a worksheet ({rel_type.rsplit('/', 1)[-1]})")
+                swapped[part] = src_sheets[name]
+                continue
+            n = 1
+            while posixpath.join(folder, f"sheet{n}.xml") in used_parts:
+                n += 1
+            part = posixpath.join(folder, f"sheet{n}.xml")
+            n = 1
+            while f"rId{n}" in used_ids:
+                n += 1
+            used_parts.add(part)
+            used_ids.add(f"rId{n}")
+            added.append((name, part, f"rId{n}"))
+            swapped[part] = src_sheets[name]
+
+        # ---- numbered sheets of an earlier, longer frame ----
+        taken = {name.lower() for name in names}
+        stale = []                            # (tab position, relationship id, part)
+        for position, (name, rel_id, part, rel_type) in enumerate(_sheets(zin, workbook)):
+            m = re.fullmatch(r".* \((\d+)\)", name)
+            if (m and name.lower() not in taken and rel_type == WORKSHEET_REL
+                    and any(shard_name(base, int(m.group(1))) == name for base in shards_of)):
+                stale.append((position, rel_id, part))
+        removed = {part for _, _, part in stale}
+
+        # ---- parts no longer used: the replaced sheets' own relationships, the calc chain ----
+        replaced = {part for part in swapped if part in zin.NameToInfo}
+        after = _reachable(zin, skip=replaced | removed) - {target for _, target in calc_chain} - removed
+        dropped = _reachable(zin) - after - replaced
+        dropped |= {_rels_path(part) for part in replaced} | {_rels_path(part) for part in dropped}
+        dropped &= set(zin.NameToInfo)
+
+        # ---- package parts ----
+        styles_xml, xf_map = merge_styles(zin.read(styles), zsrc.read(_sheet_styles(zsrc)))
+
+        types = zin.read(CONTENT_TYPES).decode("utf-8")
+        for part in dropped:
+            types = _without(types, "Override", "PartName", "/" + part)
+        for _, part, _ in added:
+            types = _insert_before(types, "</Types>",
+                                   f'<Override PartName="/{part}" ContentType="{WORKSHEET_TYPE}"/>', CONTENT_TYPES)
+
+        rels_xml = zin.read(workbook_rels).decode("utf-8")
+        for rel_id in [rel_id for rel_id, _ in calc_chain] + [rel_id for _, rel_id, _ in stale]:
+            rels_xml = _without(rels_xml, "Relationship", "Id", rel_id)
+        for _, part, rel_id in added:
+            rels_xml = _insert_before(rels_xml, "</Relationships>",
+                                      f'<Relationship Id="{rel_id}" Type="{WORKSHEET_REL}" Target="/{part}"/>',
+                                      workbook_rels)
+
+        book = zin.read(workbook).decode("utf-8")
+        if added:
+            prefix = re.search(rf'xmlns:(\w+)="{re.escape(DOC_REL_NS)}"', book)
+            if prefix is None or "</sheets>" not in book:
+                raise ValueError(f"Unsupported layout in {workbook}")
+            sheet_id = max([0, *(int(v) for v in re.findall(r'<sheet\b[^>]*?\ssheetId="(\d+)"', book))])
+            entries = "".join(
+                f'<sheet name={quoteattr(name)} sheetId="{sheet_id + i}" {prefix.group(1)}:id="{rel_id}"/>'
+                for i, (name, _, rel_id) in enumerate(added, start=1)
+            )
+            book = _insert_before(book, "</sheets>", entries, workbook)
+        if stale:
+            book = _drop_sheets(book, [rel_id for _, rel_id, _ in stale], [position for position, _, _ in stale])
+        book = _full_calc_on_load(book)
+
+        rewritten = {CONTENT_TYPES: types, workbook_rels: rels_xml, workbook: book, styles: styles_xml}
+
+        for part, src_part in swapped.items():
+            rewritten[part] = partial(_copy_sheet, zsrc, src_part, xf_map=xf_map)
+        _write_package(zin, out_path, rewritten, dropped)
+
+
+def replace_sheets(out_path, sheets: dict, total_sheets=None, outlines=None, workers=1, **sheet_kwargs):
+    """
+    write_sheets_streaming for a workbook that already exists: the sheets are streamed into a
+    scratch file next to it and swapped in (swap_sheets); the file's other sheets are not parsed.
+    workers > 1: the scratch file is written by write_sheets_parallel.
+    """
+    out_path = Path(out_path)
+    scratch = out_path.with_name(out_path.stem + ".sheets.tmp" + out_path.suffix)
+    try:
+        write_sheets_parallel(scratch, sheets, workers, total_sheets=total_sheets, outlines=outlines, **sheet_kwargs)
+        swap_sheets(out_path, scratch, shards_of=list(sheets))
+    finally:
+        scratch.unlink(missing_ok=True)
+
+
+# ------------------ Parallel sheet writing ------------------
+def _write_scratch(path, specs, index, payload, levels, sheet_kwargs):
+    """
+    Worker: a workbook with every sheet of `specs` opened in the same order, and its per-cell styles
+    registered up front, so every worker's styles.xml comes out the same; rows only for specs[index].
+    """
+    wb = Workbook(write_only=True)
+    sheets = [open_sheet(wb, spec, **sheet_kwargs) for spec in specs]
+    for sheet in sheets:
+        sheet.register_cell_styles()
+    sheets[index].append(_receive(payload), levels=levels, hide_from=specs[index]["hide_from"])
+    wb.save(path)
+
+
+def _copy_member(zsrc, zout, name):
+    _copy_entry(zsrc, zout, zsrc.getinfo(name))
+
+
+def _assemble(out_path, scratch):
+    """The first scratch package with sheet i's part taken from scratch[i] (see _write_scratch)."""
+    with ExitStack() as stack:
+        zips = [stack.enter_context(zipfile.ZipFile(path)) for path in scratch]
+        base = zips[0]
+        styles = _sheet_styles(base)
+        base_styles = styles_xml = base.read(styles)
+        parts = {}
+        for i, zf in enumerate(zips[1:], start=1):
+            part = _sheets(zf, _workbook_part(zf))[i][2]
+            zf_styles = zf.read(_sheet_styles(zf))
+            if zf_styles == base_styles:
+                parts[part] = partial(_copy_member, zf)          # same cell formats: copied as is
+            else:
+                styles_xml, xf_map = merge_styles(styles_xml, zf_styles)
+                parts[part] = partial(_copy_sheet, zf, part, xf_map=xf_map)
+        if styles_xml != base_styles:
+            parts[styles] = styles_xml
+        _write_package(base, out_path, parts)
+
+
+def write_sheets_parallel(out_path, sheets: dict, workers=1, total_sheets=None, outlines=None, **sheet_kwargs):
+    """
+    write_sheets_streaming with the sheets (numbered sheets of a long frame included) serialized
+    in `workers` processes at once, then put together in one package. Same sheets and look;
+    styles.xml may list a few more (unused) cell formats.
+    """
+    rows = sum(len(df) for df in sheets.values())
+    max_col, max_width = sheet_kwargs.pop("max_col", None), sheet_kwargs.pop("max_width", 60)
+    specs = sheet_specs(sheets, total_sheets, outlines, max_col=max_col, max_width=max_width)
+    if workers <= 1 or rows < PARALLEL_MIN_ROWS or len(specs) < 2:
+        write_sheets_streaming(out_path, sheets, total_sheets=total_sheets, outlines=outlines,
+                               max_col=max_col, max_width=max_width, **sheet_kwargs)
+        return
+
+    outlines = outlines or {}
+    out_path = Path(out_path)
+    scratch = [out_path.with_name(f"{out_path.stem}.part{i}.tmp{out_path.suffix}") for i in range(len(specs))]
+    running = {}                              # future -> shared memory segment of its rows
+    try:
+        # biggest sheets first, at most `workers` frames in shared memory at a time
+        for i in sorted(range(len(specs)), key=lambda i: specs[i]["start"] - specs[i]["stop"]):
+            while len(running) >= workers:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    shm = running.pop(future)
+                    if shm is not None:
+                        shm.close()
+                        shm.unlink()
+                    future.result()
+            spec = specs[i]
+            levels = outlines.get(spec["source"], (None, None))[0]
+            shm, payload = _share(sheets[spec["source"]].iloc[spec["start"]:spec["stop"]])
+            future = _pool(workers).submit(_write_scratch, scratch[i], specs, i, payload,
+                                           None if levels is None else levels[spec["start"]:spec["stop"]],
+                                           sheet_kwargs)
+            running[future] = shm
+        for future in list(running):
+            future.result()
+        _assemble(out_path, scratch)
+    finally:
+        for shm in running.values():
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        for path in scratch:
+            path.unlink(missing_ok=True)
+
+
+# ------------------ Native PivotTables ------------------
+def _free_name(used, pattern):
+    n = 1
+    while pattern.format(n) in used:
+        n += 1
+    used.add(pattern.format(n))
+    return pattern.format(n)
+
+
+def _pivot_xml(spec, cache_id):
+    """(cache definition, table definition) markup for one pivot spec (see add_pivot_tables)."""
+    columns = [str(col) for col in spec["columns"]]
+    missing = [col for col in [*spec["row_fields"], *spec["value_fields"]] if col not in columns]
+    if missing:
+        raise ValueError(f"Pivot on '{spec['source']}': columns {missing} not in the sheet")
+    last_row = max(int(spec["rows"]), 1) + 1             # a header-only range is not a valid source
+    if last_row > EXCEL_MAX_ROWS:
+        # a longer frame is split over numbered sheets: a range past the last row would be invalid
+        raise ValueError(f"Pivot on '{spec['source']}': {int(spec['rows']):,} rows don't fit on one sheet "
+                         f"(at most {EXCEL_MAX_ROWS - 1:,})")
+    ref = f"A1:{get_column_letter(len(columns))}{last_row}"
+
+    # no records: saveData off + refreshOnLoad, Excel fills the cache from the sheet when the file opens
+    cache = CacheDefinition(
+        saveData=False, refreshOnLoad=True, createdVersion=6, refreshedVersion=6, minRefreshableVersion=3,
+        recordCount=0, upgradeOnRefresh=True,
+        cacheSource=CacheSource(type="worksheet", worksheetSource=WorksheetSource(ref=ref, sheet=spec["source"])),
+        cacheFields=[CacheField(name=col, numFmtId=0, sharedItems=SharedItems()) for col in columns],
+    )
+
+    subtotals = spec.get("subtotals", False)
+    fields = []
+    for col in columns:
+        if col in spec["row_fields"]:
+            fields.append(PivotField(axis="axisRow", showAll=False, compact=False, outline=subtotals,
+                                     defaultSubtotal=subtotals,
+                                     items=[FieldItem(t="default")] if subtotals else ()))
+        else:
+            fields.append(PivotField(dataField=col in spec["value_fields"] or None, showAll=False,
+                                     compact=False, outline=subtotals))
+    values = spec["value_fields"]
+    table = TableDefinition(
+        name=spec.get("name", "PivotTable1"), cacheId=cache_id, dataCaption="Values",
+        updatedVersion=6, minRefreshableVersion=3, createdVersion=6, useAutoFormatting=True,
+        itemPrintTitles=True, indent=0, outline=True, outlineData=True, compact=False, compactData=False,
+        location=Location(ref="A3", firstHeaderRow=1, firstDataRow=2, firstDataCol=len(spec["row_fields"])),
+        pivotFields=fields,
+        rowFields=[RowColField(x=columns.index(col)) for col in spec["row_fields"]],
+        colFields=[RowColField(x=-2)] if len(values) > 1 else (),
+        dataFields=[DataField(name=f"Sum of {col}", fld=columns.index(col), subtotal="sum", baseField=0, baseItem=0)
+                    for col in values],
+        pivotTableStyleInfo=PivotTableStyle(name="PivotStyleLight16", showRowHeaders=True, showColHeaders=True,
+                                            showRowStripes=False, showColStripes=False, showLastColumn=True),
+    )
+    return tostring(cache.to_tree()), tostring(table.to_tree())
+
+
+def _cache_source_sheet(zf, part):
+    if part not in zf.NameToInfo:
+        return None
+    node = ET.fromstring(zf.read(part)).find(f"{{{MAIN_NS}}}cacheSource/{{{MAIN_NS}}}worksheetSource")
+    return None if node is None else node.get("sheet")
+
+
+def _add_pivot_caches(book, entries, workbook):
+    """Add <pivotCache> entries to workbook.xml (<pivotCaches> created in its place when missing)."""
+    if "</pivotCaches>" in book:
+        return _insert_before(book, "</pivotCaches>", entries, workbook)
+    # pivotCaches comes after calcPr / oleSize / customWorkbookViews, before the rest
+    for name in ("smartTagPr", "smartTagTypes", "webPublishing", "fileRecoveryPr", "webPublishObjects", "extLst"):
+        m = re.search(rf"<{name}\b", book)
+        if m:
+            return book[:m.start()] + f"<pivotCaches>{entries}</pivotCaches>" + book[m.start():]
+    return _insert_before(book, "</workbook>", f"<pivotCaches>{entries}</pivotCaches>", workbook)
+
+
+def add_pivot_tables(out_path, pivots: dict):
+    """
+    Put a native Excel PivotTable on each of the given (already written, empty) sheets, computed by
+    Excel from a source sheet of the same workbook. The file carries no pivot rows and no cache
+    records: Excel builds both when the workbook is opened (refreshOnLoad), and Refresh keeps working.
+
+    pivots: {pivot sheet: spec}, spec = dict(
+        source="All Pending Cases",      # sheet with the rows (header in row 1)
+        columns=[...],                   # its header, in sheet order
+        rows=60_000,                     # its data rows
+        row_fields=[...],                # row labels, outer first
+        value_fields=[...],              # columns summed
+        subtotals=False,                 # True -> outline form with a subtotal per outer label
+    )
+    PivotTables already on those sheets are removed, with their caches and the caches over the same
+    source sheets once no other table uses them (so refreshing a file every day does not pile up caches).
+    """
+    with zipfile.ZipFile(out_path) as zin:
+        workbook = _workbook_part(zin)
+        workbook_rels = _rels_path(workbook)
+        sheets = {name: part for name, _, part, rel_type in _sheets(zin, workbook) if rel_type == WORKSHEET_REL}
+        missing = [name for name in [*pivots, *(spec["source"] for spec in pivots.values())] if name not in sheets]
+        if missing:
+            raise ValueError(f"Sheets {missing} not found in {out_path}")
+
+        # ---- old pivot tables on our sheets, and caches of our sources nothing uses any more ----
+        ours = {sheets[name] for name in pivots}
+        old_tables = {target for part in ours for _, rel_type, target in _relationships(zin, part)
+                      if rel_type == PIVOT_TABLE_REL}
+        used = {target for part in sheets.values() for _, rel_type, table in _relationships(zin, part)
+                if rel_type == PIVOT_TABLE_REL and table not in old_tables
+                for _, cache_type, target in _relationships(zin, table) if cache_type == PIVOT_CACHE_REL}
+        # stale: caches no remaining table uses, that were our old tables' or are over our sources
+        # (a cache still shared with a table on another sheet stays, with its workbook entry)
+        sources = {spec["source"] for spec in pivots.values()}
+        old_caches = {target for table in old_tables for _, cache_type, target in _relationships(zin, table)
+                      if cache_type == PIVOT_CACHE_REL}
+        stale = [(rel_id, target) for rel_id, rel_type, target in _relationships(zin, workbook)
+                 if rel_type == PIVOT_CACHE_REL and target not in used
+                 and (target in old_caches or _cache_source_sheet(zin, target) in sources)]
+        stale_caches = {target for _, target in stale}
+        records = {target for part in stale_caches for _, _, target in _relationships(zin, part)}
+        dropped = set(old_tables) | stale_caches | records
+        dropped |= {_rels_path(part) for part in dropped}
+        dropped &= set(zin.NameToInfo)
+
+        types = zin.read(CONTENT_TYPES).decode("utf-8")
+        rels_xml = zin.read(workbook_rels).decode("utf-8")
+        book = zin.read(workbook).decode("utf-8")
+        for part in dropped:
+            types = _without(types, "Override", "PartName", "/" + part)
+        for rel_id, _ in stale:
+            rels_xml = _without(rels_xml, "Relationship", "Id", rel_id)
+            book = re.sub(rf'<pivotCache\b[^>]*?:id="{re.escape(rel_id)}"[^>]*/>', "", book)
+        book = re.sub(r"<pivotCaches>\s*</pivotCaches>|<pivotCaches/>", "", book)
+
+        # ---- new parts ----
+        prefix = re.search(rf'xmlns:(\w+)="{re.escape(DOC_REL_NS)}"', book)
+        if prefix is None:
+            raise ValueError(f"Unsupported layout in {workbook}")
+        used_parts = set(zin.NameToInfo) - dropped
+        used_ids = {rel_id for rel_id, _, _ in _relationships(zin, workbook)} - {rel_id for rel_id, _ in stale}
+        cache_ids = [int(v) for v in re.findall(r'<pivotCache\b[^>]*?\scacheId="(\d+)"', book)]
+        parts, entries = {}, ""
+        for cache_id, (sheet, spec) in enumerate(pivots.items(), start=max([0, *cache_ids]) + 1):
+            cache_xml, table_xml = _pivot_xml(spec, cache_id)
+            cache_part = _free_name(used_parts, "xl/pivotCache/pivotCacheDefinition{}.xml")
+            table_part = _free_name(used_parts, "xl/pivotTables/pivotTable{}.xml")
+            rel_id = _free_name(used_ids, "rId{}")
+
+            parts[cache_part] = cache_xml
+            parts[table_part] = table_xml
+            parts[_rels_path(table_part)] = (
+                f'<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" Type="{PIVOT_CACHE_REL}" '
+                f'Target="/{cache_part}"/></Relationships>')
+            rels_xml = _insert_before(rels_xml, "</Relationships>",
+                                      f'<Relationship Id="{rel_id}" Type="{PIVOT_CACHE_REL}" Target="/{cache_part}"/>',
+                                      workbook_rels)
+            entries += f'<pivotCache cacheId="{cache_id}" {prefix.group(1)}:id="{rel_id}"/>'
+            types = _insert_before(types, "</Types>",
+                                   f'<Override PartName="/{cache_part}" ContentType="{CacheDefinition.mime_type}"/>'
+                                   f'<Override PartName="/{table_part}" ContentType="{TableDefinition.mime_type}"/>',
+                                   CONTENT_TYPES)
+
+            # the pivot sheet -> its table (sheet rels created when the sheet has none)
+            sheet_rels = _rels_path(sheets[sheet])
+            link = f'<Relationship Id="{{}}" Type="{PIVOT_TABLE_REL}" Target="/{table_part}"/>'
+            if sheet_rels in zin.NameToInfo:
+                text = _without(zin.read(sheet_rels).decode("utf-8"), "Relationship", "Type", PIVOT_TABLE_REL)
+                ids = set(re.findall(r'\sId="([^"]+)"', text))
+                parts[sheet_rels] = _insert_before(text, "</Relationships>", link.format(_free_name(ids, "rId{}")),
+                                                   sheet_rels)
+            else:
+                parts[sheet_rels] = f'<Relationships xmlns="{PKG_REL_NS}">{link.format("rId1")}</Relationships>'
+
+        parts[CONTENT_TYPES] = types
+        parts[workbook_rels] = rels_xml
+        parts[workbook] = _add_pivot_caches(book, entries, workbook)
+        _write_package(zin, out_path, parts, dropped - set(parts))